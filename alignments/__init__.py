@@ -1,2 +1,11 @@
-import alignments.datasets
-import alignments.dataset
\ No newline at end of file
+import importlib
+
+# submodules are imported on first access, so reading an aligned corpus (alignments.reader)
+# doesn't import torch and the other dependencies of the build path
+_SUBMODULES = ["datasets", "dataset", "reader"]
+
+
+def __getattr__(name):
+    if name in _SUBMODULES:
+        return importlib.import_module(f"alignments.{name}")
+    raise AttributeError(f"module 'alignments' has no attribute '{name}'")
@@ -0,0 +1,211 @@
+"""
+Single-file archive of the alignments of a corpus.
+
+All tiers of all TextGrids are stored in one container (see ``alignments.container``):
+interval times as integer multiples of 10^-5 seconds (the precision TextGrids are parsed
+with), marks as ids into one sorted vocabulary, and one key per utterance (its path
+relative to the aligned directory, without suffix). Archives are written in parallel by
+``make_archives.py --format alignments``, can be used as ``textgrid_url`` of
+``AlignmentDataset`` without extracting any TextGrid files, and can be exported to TextGrids.
+"""
+from array import array
+from multiprocessing import Pool
+from pathlib import Path
+import os
+
+import numpy as np
+from tqdm.auto import tqdm
+
+from alignments.container import StringColumn, read_container, write_container
+from alignments.textgrids import read_tiers, ROUND_DIGITS
+
+ARCHIVE_SUFFIX = ".alignments"
+ARCHIVE_NAME = ".alignments.archive"
+ARCHIVE_VERSION = 1
+TIME_SCALE = 10 ** ROUND_DIGITS
+
+
+def _read_grid(path):
+    return read_tiers(path)
+
+
+def pack_alignments(directory, archive_path, n_workers=1, chunk_size=100):
+    """
+    Packs all TextGrids below ``directory`` into an archive at ``archive_path``, parsing them with ``n_workers`` processes.
+    Returns the number of packed TextGrids.
+    """
+    directory = Path(directory)
+    paths = sorted(directory.glob("**/*.TextGrid"))
+    keys = [str(path.relative_to(directory).with_suffix("")) for path in paths]
+    tier_offsets = array("q", [0])
+    tier_names = array("i")
+    tier_points = array("B")
+    interval_offsets = array("q", [0])
+    starts, ends, marks = [], [], []
+    names = {}
+    with Pool(max(1, n_workers)) as pool:
+        for tiers in tqdm(pool.imap(_read_grid, paths, chunksize=chunk_size), total=len(paths), desc="packing alignments"):
+            for name, tier_starts, tier_ends, tier_marks in tiers:
+                if name not in names:
+                    names[name] = len(names)
+                tier_names.append(names[name])
+                tier_points.append(tier_starts is tier_ends)
+                starts.append(np.round(np.asarray(tier_starts, dtype=np.float64) * TIME_SCALE).astype(np.int64))
+                ends.append(np.round(np.asarray(tier_ends, dtype=np.float64) * TIME_SCALE).astype(np.int64))
+                marks += tier_marks
+                interval_offsets.append(len(marks))
+            tier_offsets.append(len(tier_names))
+    starts = np.concatenate(starts) if len(starts) > 0 else np.zeros(0, dtype=np.int64)
+    ends = np.concatenate(ends) if len(ends) > 0 else np.zeros(0, dtype=np.int64)
+    # 32 bit ticks are enough for about 6 hours per utterance
+    if len(ends) == 0 or max(ends.max(), -starts.min()) < np.iinfo(np.int32).max:
+        starts, ends = starts.astype(np.int32), ends.astype(np.int32)
+    vocab, mark_ids = np.unique(np.array(marks, dtype=object), return_inverse=True) if len(marks) > 0 else ([], [])
+    arrays = {
+        "tier_offsets": np.asarray(tier_offsets, dtype=np.int64),
+        "tier_names": np.asarray(tier_names, dtype=np.int32),
+        "tier_points": np.asarray(tier_points, dtype=np.uint8),
+        "interval_offsets": np.asarray(interval_offsets, dtype=np.int64),
+        "starts": starts,
+        "ends": ends,
+        "mark_ids": np.asarray(mark_ids, dtype=np.int32),
+    }
+    arrays.update(StringColumn.from_strings(keys).to_arrays("keys"))
+    arrays.update(StringColumn.from_strings([str(x) for x in vocab]).to_arrays("vocab"))
+    meta = {
+        "type": "alignment_archive",
+        "version": ARCHIVE_VERSION,
+        "time_scale": TIME_SCALE,
+        "tier_names": list(names),
+    }
+    write_container(archive_path, meta, arrays)
+    return len(keys)
+
+
+def _quote(mark):
+    return '"' + mark.replace('"', '""') + '"'
+
+
+def format_textgrid(tiers):
+    """
+    Formats ``(name, starts, ends, marks)`` tiers (like the ones returned by ``read_tiers``) as a long TextGrid.
+    """
+    xmin = min([x[1][0] for x in tiers if len(x[1]) > 0], default=0)
+    xmax = max([x[2][-1] for x in tiers if len(x[2]) > 0], default=0)
+    lines = [
+        'File type = "ooTextFile"',
+        'Object class = "TextGrid"',
+        '',
+        f'xmin = {xmin} ',
+        f'xmax = {xmax} ',
+        'tiers? <exists> ',
+        f'size = {len(tiers)} ',
+        'item []: ',
+    ]
+    for i, (name, starts, ends, marks) in enumerate(tiers):
+        is_point = starts is ends
+        lines += [
+            f'    item [{i + 1}]:',
+            f'        class = "{"TextTier" if is_point else "IntervalTier"}" ',
+            f'        name = {_quote(name)} ',
+            f'        xmin = {xmin} ',
+            f'        xmax = {xmax} ',
+            f'        {"points" if is_point else "intervals"}: size = {len(marks)} ',
+        ]
+        for j, (start, end, mark) in enumerate(zip(starts, ends, marks)):
+            if is_point:
+                lines += [f'        points [{j + 1}]:', f'            number = {start} ', f'            mark = {_quote(mark)} ']
+            else:
+                lines += [
+                    f'        intervals [{j + 1}]:',
+                    f'            xmin = {start} ',
+                    f'            xmax = {end} ',
+                    f'            text = {_quote(mark)} ',
+                ]
+    return "\n".join(lines) + "\n"
+
+
+_SHARED = {}
+
+
+def _open_shared(path):
+    """
+    Opens the archive at ``path`` only once per process, used when unpickling archives.
+    """
+    stat = os.stat(path)
+    key = (path, stat.st_mtime_ns, stat.st_size)
+    if key not in _SHARED:
+        _SHARED[key] = AlignmentArchive.open(path)
+    return _SHARED[key]
+
+
+class AlignmentArchive():
+    """
+    Read-only, memory-mapped alignment archive. Pickling it only pickles its path,
+    so it can be used in worker processes.
+    """
+    def __init__(self, path, meta, arrays):
+        self.path = Path(path)
+        self.meta = meta
+        self.arrays = arrays
+        self.keys = StringColumn.from_arrays(arrays, "keys")
+        self.vocab = list(StringColumn.from_arrays(arrays, "vocab"))
+        stat = os.stat(self.path)
+        self.stats = (stat.st_mtime_ns, stat.st_size)
+        self._index = None
+
+    @classmethod
+    def open(cls, path):
+        """
+        Returns the archive at ``path``, or None if it is missing or invalid.
+        """
+        container = read_container(path)
+        if container is None:
+            return None
+        meta, arrays = container
+        if meta.get("type") != "alignment_archive" or meta.get("version") != ARCHIVE_VERSION:
+            return None
+        return cls(path, meta, arrays)
+
+    def __reduce__(self):
+        return (_open_shared, (str(self.path),))
+
+    def __len__(self):
+        return len(self.keys)
+
+    def lookup(self, name):
+        """
+        Index of the utterance with file name ``name`` (without suffix), or None.
+        """
+        if self._index is None:
+            self._index = {Path(key).name: i for i, key in enumerate(self.keys)}
+        return self._index.get(name)
+
+    def tiers(self, index, n_tiers=None):
+        """
+        The first ``n_tiers`` tiers (or all tiers) of utterance ``index``, in the same format as ``read_tiers``.
+        """
+        a = self.arrays
+        first, last = int(a["tier_offsets"][index]), int(a["tier_offsets"][index + 1])
+        if n_tiers is not None:
+            last = min(last, first + n_tiers)
+        tiers = []
+        for t in range(first, last):
+            start, end = int(a["interval_offsets"][t]), int(a["interval_offsets"][t + 1])
+            starts = (a["starts"][start:end] / TIME_SCALE).tolist()
+            ends = starts if a["tier_points"][t] else (a["ends"][start:end] / TIME_SCALE).tolist()
+            marks = [self.vocab[i] for i in a["mark_ids"][start:end].tolist()]
+            tiers.append((self.meta["tier_names"][a["tier_names"][t]], starts, ends, marks))
+        return tiers
+
+    def write_textgrid(self, index, path):
+        Path(path).write_text(format_textgrid(self.tiers(index)))
+
+    def export(self, directory):
+        """
+        Writes all utterances as TextGrids to ``directory``, using the keys as relative paths.
+        """
+        for i, key in enumerate(tqdm(self.keys, total=len(self), desc="exporting TextGrids")):
+            path = Path(directory) / (key + ".TextGrid")
+            path.parent.mkdir(parents=True, exist_ok=True)
+            self.write_textgrid(i, path)
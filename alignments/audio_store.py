@@ -0,0 +1,153 @@
+"""
+Packed audio store.
+
+All utterances of a dataset are decoded once and written back to back into a few
+large raw PCM shard files, with an offset table stored in a container next to them.
+Reading an utterance (or a single phone of it) is then a slice of a memory-mapped
+shard instead of opening and decoding a small audio file.
+"""
+from multiprocessing import Pool
+from pathlib import Path
+import shutil
+
+import numpy as np
+from tqdm.auto import tqdm
+
+from alignments.container import write_container, read_container
+
+AUDIO_STORE_NAME = ".alignments_audio"
+STORE_VERSION = 1
+DTYPES = ["int16", "float32"]
+
+
+def load_audio(path, sampling_rate=None):
+    """
+    Reads the audio file at ``path`` as mono float32, resampled to ``sampling_rate`` if given.
+    Returns ``(audio, sampling_rate)``.
+    """
+    import soundfile as sf
+    audio, file_sampling_rate = sf.read(path, dtype="float32", always_2d=True)
+    audio = audio.mean(axis=1)
+    if sampling_rate is not None and sampling_rate != file_sampling_rate:
+        import librosa
+        audio = librosa.resample(audio, orig_sr=file_sampling_rate, target_sr=sampling_rate)
+        file_sampling_rate = sampling_rate
+    return audio, file_sampling_rate
+
+
+def _decode(args):
+    path, sampling_rate, dtype = args
+    audio, sampling_rate = load_audio(path, sampling_rate)
+    if dtype == "int16":
+        audio = (np.clip(audio, -1.0, 1.0) * np.iinfo(np.int16).max).astype(np.int16)
+    return audio, sampling_rate
+
+
+def pack_audio(paths, directory, signature, sampling_rate=None, dtype="int16", shard_size=2**31, n_workers=1, chunk_size=100):
+    """
+    Decodes ``paths`` in parallel and writes them to shards in ``directory``.
+    ``signature`` identifies the list of paths, it is checked when the store is opened again.
+    If ``sampling_rate`` is None, all files need to have the same sampling rate.
+    """
+    if dtype not in DTYPES:
+        raise ValueError(f"dtype must be one of {DTYPES}")
+    directory = Path(directory)
+    shutil.rmtree(directory, ignore_errors=True)
+    directory.mkdir(parents=True)
+    itemsize = np.dtype(dtype).itemsize
+    shards = np.zeros(len(paths), dtype=np.int32)
+    offsets = np.zeros(len(paths), dtype=np.int64)
+    lengths = np.zeros(len(paths), dtype=np.int64)
+    shard = 0
+    shard_file = open(directory / f"shard_{shard:05d}.pcm", "wb")
+    position = 0
+    with Pool(n_workers) as pool:
+        results = pool.imap(_decode, [(str(x), sampling_rate, dtype) for x in paths], chunksize=chunk_size)
+        for i, (audio, file_sampling_rate) in enumerate(tqdm(results, total=len(paths), desc="packing audio")):
+            if sampling_rate is None:
+                sampling_rate = file_sampling_rate
+            elif file_sampling_rate != sampling_rate:
+                raise ValueError(f"{paths[i]} has a sampling rate of {file_sampling_rate} instead of {sampling_rate}, please set target_sampling_rate")
+            if position > 0 and (position + len(audio)) * itemsize > shard_size:
+                shard_file.close()
+                shard += 1
+                shard_file = open(directory / f"shard_{shard:05d}.pcm", "wb")
+                position = 0
+            shard_file.write(audio.tobytes())
+            shards[i] = shard
+            offsets[i] = position
+            lengths[i] = len(audio)
+            position += len(audio)
+    shard_file.close()
+    meta = {
+        "store_version": STORE_VERSION,
+        "signature": signature,
+        "sampling_rate": sampling_rate,
+        "dtype": dtype,
+        "n_shards": shard + 1,
+    }
+    write_container(directory / "index", meta, {"shards": shards, "offsets": offsets, "lengths": lengths})
+
+
+class AudioStore():
+    """
+    Memory-mapped view of a packed audio store, ``store[i]`` returns the audio of item ``i`` without copying.
+    """
+    def __init__(self, directory, meta, arrays):
+        self.directory = Path(directory)
+        self.sampling_rate = meta["sampling_rate"]
+        self.dtype = np.dtype(meta["dtype"])
+        self.n_shards = meta["n_shards"]
+        self.shards = arrays["shards"]
+        self.offsets = arrays["offsets"]
+        self.lengths = arrays["lengths"]
+        self._maps = {}
+
+    @classmethod
+    def open(cls, directory, signature=None, sampling_rate=None):
+        """
+        Returns the store in ``directory``, or ``None`` if it is missing or does not match ``signature`` and ``sampling_rate``.
+        """
+        container = read_container(Path(directory) / "index")
+        if container is None:
+            return None
+        meta, arrays = container
+        if meta.get("store_version") != STORE_VERSION:
+            return None
+        if signature is not None and meta["signature"] != signature:
+            return None
+        if sampling_rate is not None and meta["sampling_rate"] != sampling_rate:
+            return None
+        return cls(directory, meta, arrays)
+
+    def _shard(self, shard):
+        if shard not in self._maps:
+            path = self.directory / f"shard_{shard:05d}.pcm"
+            if path.stat().st_size == 0:
+                self._maps[shard] = np.zeros(0, dtype=self.dtype)
+            else:
+                self._maps[shard] = np.memmap(path, dtype=self.dtype, mode="r")
+        return self._maps[shard]
+
+    def __getitem__(self, index):
+        offset = self.offsets[index]
+        return self._shard(self.shards[index])[offset:offset + self.lengths[index]]
+
+    def __len__(self):
+        return len(self.lengths)
+
+    def segment(self, index, start, end):
+        """
+        Returns the audio of item ``index`` between ``start`` and ``end`` (in seconds) as a view.
+        """
+        audio = self[index]
+        return audio[int(round(start * self.sampling_rate)):int(round(end * self.sampling_rate))]
+
+    def segments(self, index, starts, ends):
+        """
+        Returns a list of views, one per ``(start, end)`` pair (in seconds), e.g. for the phones of an item.
+        """
+        audio = self[index]
+        starts = np.round(np.asarray(starts, dtype=np.float64) * self.sampling_rate).astype(np.int64)
+        ends = np.round(np.asarray(ends, dtype=np.float64) * self.sampling_rate).astype(np.int64)
+        return [audio[s:e] for s, e in zip(starts.tolist(), ends.tolist())]
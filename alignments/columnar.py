@@ -0,0 +1,310 @@
+"""
+Columnar storage for parsed alignments.
+
+Rather than keeping one dict with a list of ``(start, end, phone)`` tuples per item,
+all phones of the corpus live in three global arrays (float32 starts and ends, int16
+phone ids into a sorted token vocabulary) and each item only stores an offset into them.
+The words of the word tier are stored the same way, with ids into a sorted word vocabulary.
+This keeps memory flat and avoids copy-on-write of millions of small objects when
+DataLoader workers are forked.
+"""
+from array import array
+from pathlib import Path
+import hashlib
+
+import numpy as np
+
+from alignments.container import StringColumn
+from alignments.textgrids import ROUND_DIGITS
+
+PHONES_FORMATS = ["tuples", "arrays"]
+
+
+def paths_signature(paths):
+    """
+    Hash of a ``StringColumn`` of paths, used to check if files derived from a dataset are still valid.
+    """
+    sha = hashlib.sha1()
+    sha.update(np.asarray(paths.offsets).tobytes())
+    sha.update(np.asarray(paths.data).tobytes())
+    return sha.hexdigest()
+
+
+def _id_dtype(vocab_size):
+    return np.int16 if vocab_size < np.iinfo(np.int16).max else np.int32
+
+
+class ColumnarBuilder():
+    """
+    Collects items as returned by ``AlignmentDataset._create_item`` into compact buffers.
+    """
+    def __init__(self, target_directory):
+        self.target_directory = Path(target_directory)
+        self.wavs = []
+        self.transcripts = []
+        self.speakers = []
+        self.speaker_to_id = {}
+        self.speaker_ids = array("i")
+        self.phone_offsets = array("q", [0])
+        self.phone_starts = array("f")
+        self.phone_ends = array("f")
+        self.phone_ids = array("i")
+        self.token_to_id = {}
+        self.word_offsets = array("q", [0])
+        self.word_starts = array("f")
+        self.word_ends = array("f")
+        self.word_ids = array("i")
+        self.word_to_id = {}
+        self._lookups = {}
+
+    def __len__(self):
+        return len(self.speaker_ids)
+
+    def _append_row(self, wav, speaker, transcript):
+        self.wavs.append(wav)
+        if speaker not in self.speaker_to_id:
+            self.speaker_to_id[speaker] = len(self.speakers)
+            self.speakers.append(speaker)
+        self.speaker_ids.append(self.speaker_to_id[speaker])
+        self.transcripts.append(transcript)
+
+    def append(self, item):
+        self._append_row(
+            str(Path(item["wav"]).relative_to(self.target_directory)),
+            str(Path(item["speaker"]).relative_to(self.target_directory)),
+            item["transcript"],
+        )
+        for start, end, phone in item["phones"]:
+            if phone not in self.token_to_id:
+                self.token_to_id[phone] = len(self.token_to_id)
+            self.phone_starts.append(start)
+            self.phone_ends.append(end)
+            self.phone_ids.append(self.token_to_id[phone])
+        self.phone_offsets.append(len(self.phone_starts))
+        for start, end, word in item["words"]:
+            if word not in self.word_to_id:
+                self.word_to_id[word] = len(self.word_to_id)
+            self.word_starts.append(start)
+            self.word_ends.append(end)
+            self.word_ids.append(self.word_to_id[word])
+        self.word_offsets.append(len(self.word_starts))
+
+    def append_from(self, data, index):
+        """
+        Appends item ``index`` of the ``ColumnarData`` ``data`` without materialising its phones.
+        """
+        if id(data) not in self._lookups:
+            for token in data.vocab:
+                if token not in self.token_to_id:
+                    self.token_to_id[token] = len(self.token_to_id)
+            for word in data.word_vocab:
+                if word not in self.word_to_id:
+                    self.word_to_id[word] = len(self.word_to_id)
+            self._lookups[id(data)] = (
+                np.array([self.token_to_id[x] for x in data.vocab], dtype=np.int32),
+                np.array([self.word_to_id[x] for x in data.word_vocab], dtype=np.int32),
+            )
+        token_lookup, word_lookup = self._lookups[id(data)]
+        self._append_row(data.wavs[index], data.speakers[data.speaker_ids[index]], data.transcripts[index])
+        starts, ends, phone_ids = data.phones(index)
+        self.phone_starts.frombytes(np.asarray(starts, dtype=np.float32).tobytes())
+        self.phone_ends.frombytes(np.asarray(ends, dtype=np.float32).tobytes())
+        self.phone_ids.frombytes(token_lookup[phone_ids].tobytes())
+        self.phone_offsets.append(len(self.phone_starts))
+        starts, ends, word_ids = data.words(index)
+        self.word_starts.frombytes(np.asarray(starts, dtype=np.float32).tobytes())
+        self.word_ends.frombytes(np.asarray(ends, dtype=np.float32).tobytes())
+        self.word_ids.frombytes(word_lookup[word_ids].tobytes())
+        self.word_offsets.append(len(self.word_starts))
+
+    def build(self, phones_format="tuples"):
+        vocab = sorted(self.token_to_id)
+        # phone ids were assigned in order of appearance, remap them to the sorted vocabulary
+        remap = np.zeros(len(vocab), dtype=np.int64)
+        for i, token in enumerate(vocab):
+            remap[self.token_to_id[token]] = i
+        phone_ids = remap[np.frombuffer(self.phone_ids, dtype=np.int32)].astype(_id_dtype(len(vocab)))
+        word_vocab = sorted(self.word_to_id)
+        remap = np.zeros(len(word_vocab), dtype=np.int64)
+        for i, word in enumerate(word_vocab):
+            remap[self.word_to_id[word]] = i
+        word_ids = remap[np.frombuffer(self.word_ids, dtype=np.int32)].astype(np.int32)
+        return ColumnarData(
+            self.target_directory,
+            wavs=StringColumn.from_strings(self.wavs),
+            speakers=StringColumn.from_strings(self.speakers),
+            speaker_ids=np.frombuffer(self.speaker_ids, dtype=np.int32),
+            transcripts=StringColumn.from_strings(self.transcripts),
+            phone_offsets=np.frombuffer(self.phone_offsets, dtype=np.int64),
+            phone_starts=np.frombuffer(self.phone_starts, dtype=np.float32),
+            phone_ends=np.frombuffer(self.phone_ends, dtype=np.float32),
+            phone_ids=phone_ids,
+            vocab=vocab,
+            word_offsets=np.frombuffer(self.word_offsets, dtype=np.int64),
+            word_starts=np.frombuffer(self.word_starts, dtype=np.float32),
+            word_ends=np.frombuffer(self.word_ends, dtype=np.float32),
+            word_ids=word_ids,
+            word_vocab=StringColumn.from_strings(word_vocab),
+            phones_format=phones_format,
+        )
+
+
+class ColumnarData():
+    """
+    Sequence of items stored column-wise, the arrays can be in memory or memory-mapped from an index.
+
+    With ``phones_format="tuples"`` items contain the usual ``"phones"`` list of
+    ``(start, end, phone)`` tuples, which is materialised on access. With
+    ``phones_format="arrays"`` items instead contain ``"phone_starts"``, ``"phone_ends"``
+    and ``"phone_ids"``, which are views into the global arrays.
+    The ``"words"`` of the word tier are ``(start, end, word)`` tuples in both formats.
+    """
+    def __init__(
+        self,
+        target_directory,
+        wavs,
+        speakers,
+        speaker_ids,
+        transcripts,
+        phone_offsets,
+        phone_starts,
+        phone_ends,
+        phone_ids,
+        vocab,
+        word_offsets,
+        word_starts,
+        word_ends,
+        word_ids,
+        word_vocab,
+        phones_format="tuples",
+    ):
+        if phones_format not in PHONES_FORMATS:
+            raise ValueError(f"phones_format must be one of {PHONES_FORMATS}")
+        self.target_directory = Path(target_directory)
+        self.wavs = wavs
+        self.speakers = speakers
+        self.speaker_ids = speaker_ids
+        self.transcripts = transcripts
+        self.phone_offsets = phone_offsets
+        self.phone_starts = phone_starts
+        self.phone_ends = phone_ends
+        self.phone_ids = phone_ids
+        self.vocab = vocab
+        self.word_offsets = word_offsets
+        self.word_starts = word_starts
+        self.word_ends = word_ends
+        self.word_ids = word_ids
+        self.word_vocab = word_vocab
+        self.phones_format = phones_format
+
+    @property
+    def token_counts(self):
+        counts = np.bincount(self.phone_ids, minlength=len(self.vocab))
+        return dict(zip(self.vocab, counts.tolist()))
+
+    def signature(self):
+        """
+        Hash of the (relative) audio paths of all items, used to check if files derived from the data are still valid.
+        """
+        return paths_signature(self.wavs)
+
+    def durations(self):
+        """
+        Duration of each item in seconds, the end of its last phone (0 for items without phones).
+        """
+        offsets = np.asarray(self.phone_offsets)
+        ends = np.asarray(self.phone_ends, dtype=np.float64)
+        durations = np.zeros(len(self), dtype=np.float64)
+        nonempty = offsets[1:] > offsets[:-1]
+        durations[nonempty] = ends[offsets[1:][nonempty] - 1]
+        return np.round(durations, ROUND_DIGITS)
+
+    def phones(self, index):
+        """
+        Returns ``(starts, ends, phone_ids)`` views for the item at ``index``.
+        """
+        start, end = self.phone_offsets[index], self.phone_offsets[index + 1]
+        return self.phone_starts[start:end], self.phone_ends[start:end], self.phone_ids[start:end]
+
+    def words(self, index):
+        """
+        Returns ``(starts, ends, word_ids)`` views for the words of the item at ``index``, ids index into ``word_vocab``.
+        """
+        start, end = self.word_offsets[index], self.word_offsets[index + 1]
+        return self.word_starts[start:end], self.word_ends[start:end], self.word_ids[start:end]
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if index < 0 or index >= len(self):
+            raise IndexError("index out of range")
+        item = {
+            "wav": self.target_directory / self.wavs[index],
+            "speaker": self.target_directory / self.speakers[self.speaker_ids[index]],
+            "transcript": self.transcripts[index],
+        }
+        starts, ends, phone_ids = self.phones(index)
+        if self.phones_format == "arrays":
+            item["phone_starts"] = starts
+            item["phone_ends"] = ends
+            item["phone_ids"] = phone_ids
+        else:
+            # times were parsed with ROUND_DIGITS, rounding removes the float32 representation error
+            item["phones"] = list(zip(
+                np.round(starts.astype(np.float64), ROUND_DIGITS).tolist(),
+                np.round(ends.astype(np.float64), ROUND_DIGITS).tolist(),
+                [self.vocab[x] for x in phone_ids.tolist()],
+            ))
+        starts, ends, word_ids = self.words(index)
+        item["words"] = list(zip(
+            np.round(starts.astype(np.float64), ROUND_DIGITS).tolist(),
+            np.round(ends.astype(np.float64), ROUND_DIGITS).tolist(),
+            [self.word_vocab[x] for x in word_ids.tolist()],
+        ))
+        return item
+
+    def __len__(self):
+        return len(self.speaker_ids)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def to_arrays(self):
+        arrays = {
+            "speaker_ids": self.speaker_ids,
+            "phone_offsets": self.phone_offsets,
+            "phone_starts": self.phone_starts,
+            "phone_ends": self.phone_ends,
+            "phone_ids": self.phone_ids,
+            "word_offsets": self.word_offsets,
+            "word_starts": self.word_starts,
+            "word_ends": self.word_ends,
+            "word_ids": self.word_ids,
+        }
+        arrays.update(self.word_vocab.to_arrays("word_vocab"))
+        arrays.update(self.wavs.to_arrays("wavs"))
+        arrays.update(self.speakers.to_arrays("speakers"))
+        arrays.update(self.transcripts.to_arrays("transcripts"))
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, target_directory, arrays, vocab, phones_format="tuples"):
+        return cls(
+            target_directory,
+            wavs=StringColumn.from_arrays(arrays, "wavs"),
+            speakers=StringColumn.from_arrays(arrays, "speakers"),
+            speaker_ids=arrays["speaker_ids"],
+            transcripts=StringColumn.from_arrays(arrays, "transcripts"),
+            phone_offsets=arrays["phone_offsets"],
+            phone_starts=arrays["phone_starts"],
+            phone_ends=arrays["phone_ends"],
+            phone_ids=arrays["phone_ids"],
+            vocab=vocab,
+            word_offsets=arrays["word_offsets"],
+            word_starts=arrays["word_starts"],
+            word_ends=arrays["word_ends"],
+            word_ids=arrays["word_ids"],
+            word_vocab=StringColumn.from_arrays(arrays, "word_vocab"),
+            phones_format=phones_format,
+        )
@@ -0,0 +1,164 @@
+"""
+Minimal binary container used for the on-disk files written by alignments.
+
+A container is a single file made of a small JSON header followed by raw,
+64-byte aligned numpy arrays, so every array can be memory-mapped directly
+without copying or unpickling anything.
+"""
+from pathlib import Path
+import json
+import os
+import struct
+import warnings
+
+import numpy as np
+
+MAGIC = b"ALIGNBIN"
+FORMAT_VERSION = 1
+ALIGNMENT = 64
+
+_PREAMBLE = struct.Struct("<8sIQ")
+
+
+def _pad(offset):
+    return (ALIGNMENT - offset % ALIGNMENT) % ALIGNMENT
+
+
+def write_container(path, meta, arrays):
+    """
+    Writes ``arrays`` (a dict of name -> numpy array) and the JSON-serialisable
+    ``meta`` dict to ``path``. The file is written to a temporary location first
+    and moved into place, so readers never see a half-written container.
+    """
+    path = Path(path)
+    arrays = {name: np.ascontiguousarray(array) for name, array in arrays.items()}
+    descriptors = {}
+    offset = 0
+    for name, array in arrays.items():
+        offset += _pad(offset)
+        descriptors[name] = {
+            "dtype": array.dtype.str,
+            "shape": list(array.shape),
+            "offset": offset,
+        }
+        offset += array.nbytes
+    header = json.dumps({"meta": meta, "arrays": descriptors}).encode("utf-8")
+    data_start = _PREAMBLE.size + len(header)
+    data_start += _pad(data_start)
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(_PREAMBLE.pack(MAGIC, FORMAT_VERSION, len(header)))
+            f.write(header)
+            f.write(b"\0" * (data_start - f.tell()))
+            for name, array in arrays.items():
+                f.write(b"\0" * (data_start + descriptors[name]["offset"] - f.tell()))
+                f.write(array.tobytes())
+        os.replace(tmp_path, path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+
+def write_cache(path, meta, arrays):
+    """
+    Writes a container which only caches data that can be computed again, see ``write_container``.
+    If the directory isn't writable (e.g. a read-only or shared corpus), warns and returns False,
+    the caller keeps using its data in memory.
+    """
+    try:
+        write_container(path, meta, arrays)
+    except OSError as e:
+        warnings.warn(f"could not write the cache {path} ({e}), it is only kept in memory")
+        return False
+    return True
+
+
+def read_container_meta(path):
+    """
+    Reads only the header of a container, returns ``None`` if ``path`` is not a valid container.
+    """
+    path = Path(path)
+    if not path.is_file():
+        return None
+    with open(path, "rb") as f:
+        preamble = f.read(_PREAMBLE.size)
+        if len(preamble) < _PREAMBLE.size:
+            return None
+        magic, version, header_size = _PREAMBLE.unpack(preamble)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            return None
+        header = json.loads(f.read(header_size).decode("utf-8"))
+    data_start = _PREAMBLE.size + header_size
+    header["data_start"] = data_start + _pad(data_start)
+    return header
+
+
+def read_container(path, mmap=True):
+    """
+    Returns ``(meta, arrays)`` for the container at ``path``, or ``None`` if it is missing or invalid.
+    With ``mmap=True`` the arrays are read-only memory maps into the file.
+    """
+    header = read_container_meta(path)
+    if header is None:
+        return None
+    arrays = {}
+    for name, desc in header["arrays"].items():
+        dtype = np.dtype(desc["dtype"])
+        shape = tuple(desc["shape"])
+        offset = header["data_start"] + desc["offset"]
+        if int(np.prod(shape)) == 0:
+            arrays[name] = np.zeros(shape, dtype=dtype)
+        elif mmap:
+            arrays[name] = np.memmap(path, dtype=dtype, mode="r", offset=offset, shape=shape)
+        else:
+            arrays[name] = np.fromfile(path, dtype=dtype, count=int(np.prod(shape)), offset=offset).reshape(shape)
+    return header["meta"], arrays
+
+
+def pack_strings(strings):
+    """
+    Packs a list of strings into ``(offsets, data)`` arrays, see ``StringColumn``.
+    """
+    encoded = [s.encode("utf-8") for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(s) for s in encoded], out=offsets[1:])
+    data = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+    return offsets, data
+
+
+class StringColumn():
+    """
+    Read-only sequence of strings stored as one utf-8 buffer plus offsets.
+    """
+    def __init__(self, offsets, data):
+        self.offsets = offsets
+        self.data = data
+
+    @classmethod
+    def from_strings(cls, strings):
+        return cls(*pack_strings(strings))
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if index < 0 or index >= len(self):
+            raise IndexError("string column index out of range")
+        return self.data[self.offsets[index]:self.offsets[index + 1]].tobytes().decode("utf-8")
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def to_arrays(self, prefix):
+        return {
+            f"{prefix}_offsets": self.offsets,
+            f"{prefix}_data": self.data,
+        }
+
+    @classmethod
+    def from_arrays(cls, arrays, prefix):
+        return cls(arrays[f"{prefix}_offsets"], arrays[f"{prefix}_data"])
@@ -1,13 +1,8 @@
 from abc import abstractmethod
 import abc
-import re
 from pathlib import Path
 from string import punctuation
-from urllib import request
-from zipfile import ZipFile
-import tarfile
 import os, shutil
-import subprocess
 import platform
 import multiprocessing
 import unicodedata
@@ -18,38 +13,52 @@ from tqdm.rich import tqdm
 from tqdm.contrib.concurrent import process_map
 from rich import print
 from rich.console import Console
-import textgrid
-import soundfile as sf
-import librosa
+import numpy as np
+
+from alignments.index import index_path, write_index, load_index, load_manifest, PARSER_VERSION
+from alignments.reader import finish_item
+from alignments.manifest import Manifest
+from alignments.inventory import scan_directory
+from alignments.audio_store import AudioStore, AUDIO_STORE_NAME, pack_audio
+from alignments.resample import resample_file, resampled_directory
+from alignments.durations import AlignmentCollator, audio_samples, frames_for_samples, phone_durations, read_durations
+from alignments.sampler import DurationBatchSampler
+from alignments.container import StringColumn, read_container, write_cache
+from alignments.textgrids import read_tiers
+from alignments.columnar import ColumnarBuilder, PHONES_FORMATS, paths_signature
+from alignments.lazy import LazyData
+from alignments.iterable import IterableAlignmentDataset
+from alignments.stats import CorpusStats, STATS_NAME, data_signature
+from alignments.metrics import Metrics, run_command
+from alignments.search import SearchIndex, SEARCH_NAME
+from alignments.prefetch import AudioPrefetcher, crop_item, phone_segment, read_segment
+from alignments.features import FeatureStore, extract_features, feature_config, features_directory, phones_crc
+from alignments.shards import export_shards
+from alignments.sharding import ShardedAlignment
+from alignments.download import download_and_extract, download_file
+from alignments.materialize import materialize
+from alignments.lexicon import corpus_words, find_oovs, normalize_lexicon, read_lexicon, write_lexicon
+from alignments.g2p_cache import G2PCache
+from alignments.archive import AlignmentArchive, ARCHIVE_NAME, ARCHIVE_SUFFIX
 
 console = Console()
 warnings.filterwarnings("ignore", message="rich is experimental/alpha")
 
-class DownloadProgressBar():
-    def __init__(self):
-        self.pbar = None
-        self.downloaded = 0
-        self.sum = 0
-
-    def __call__(self, block_num, block_size, total_size):
-        if not self.pbar:
-            self.pbar=tqdm(total=total_size, desc="Downloading")
-
-        downloaded = block_num * block_size
-
-        self.pbar.update(downloaded-self.downloaded)
-        self.downloaded = downloaded
-        if self.downloaded >= total_size:
-            self.pbar.close()
-            self.pbar = None
+DURATIONS_NAME = ".alignments.durations"
 
-def run_subprocess(command, desc, capture=True, cwd=None):
+def run_subprocess(command, desc, capture=True, cwd=None, metrics=None):
+    if metrics is not None:
+        # record the command as a stage of its own
+        with metrics.stage(desc) as stage:
+            out = run_subprocess(command, desc, capture, cwd)
+            stage.command_peak_rss = out.peak_rss
+            return out
     if capture:
         with console.status(desc):
-            out = subprocess.run(command, capture_output=capture, cwd=cwd, shell=True)
+            out = run_command(command, capture, cwd)
     else:
         print(f"[blue]⏱[/blue] {desc}")
-        out = subprocess.run(command, capture_output=capture, cwd=cwd, shell=True)
+        out = run_command(command, capture, cwd)
     if out.returncode != 0:
         print(f"[red]✕[/red] {desc}")
         if out.stderr is not None:
@@ -58,6 +67,16 @@ def run_subprocess(command, desc, capture=True, cwd=None):
         print(f"[green]✓[/green] {desc}")
     return out
 
+def mfa_command(arguments):
+    """
+    Returns a shell command running ``mfa`` with ``arguments`` in the "alignments_mfa" conda environment.
+    The ALIGNMENTS_MFA environment variable can be set to run a different executable instead (e.g. a stub),
+    the conda environment is then neither checked nor installed.
+    """
+    if "ALIGNMENTS_MFA" in os.environ:
+        return f"{os.environ['ALIGNMENTS_MFA']} {arguments}"
+    return f". $CONDA_PREFIX/etc/profile.d/conda.sh && conda activate alignments_mfa && mfa {arguments}"
+
 def check_install_mfa(verbose, force):
     """
     Create new conda enviroment used for aligning.
@@ -83,6 +102,103 @@ def check_install_mfa(verbose, force):
             not verbose,
         )
 
+
+def create_item(args):
+    """
+    Parses a (wav, TextGrid, lab) triple into an item, given as one ``(file, punctuation_marks, archive)`` tuple.
+    TextGrids which don't exist are read from ``archive`` (an ``AlignmentArchive`` or None).
+    Returns ``{"incorrect": reason, "text": text}`` if the transcript doesn't match the alignment.
+    """
+    # TODO: fix quotes and triple dots
+    file, punctuation_marks, archive = args
+    wav, grid, lab = file
+    text = Path(lab).read_text().lower()
+    words = [
+        x.replace('"', '')[1:] if x.replace('"', '').startswith("'") else x.replace('"', '') 
+        for x in Path(lab).read_text().lower().split()
+    ]
+    last_word = 0
+    for i, word in enumerate(words):
+        has_alnum = any([x.isalnum() for x in word])
+        if not has_alnum:
+            if i > 0:
+                words[last_word] = words[last_word] + words[i]
+            words[i] = ''
+        else:
+            last_word = i
+    words = [x for x in words if len(x) > 0]
+    if archive is not None and not Path(grid).exists():
+        tiers = archive.tiers(archive.lookup(Path(grid).stem), n_tiers=2)
+    else:
+        tiers = read_tiers(grid, n_tiers=2)
+    (_, word_starts, word_ends, word_marks), (_, phone_starts, phone_ends, phone_marks) = tiers
+    punctuations = []
+    mark_i = 0
+    for word in words:
+        if mark_i >= len(word_marks):
+            return {
+                "incorrect": "marks out of range",
+                "text": text,
+            }
+        while len(word_marks[mark_i]) == 0:
+            mark_i += 1
+            if mark_i >= len(word_marks):
+                return {
+                    "incorrect": "marks out of range",
+                    "text": text,
+                }
+        current_mark = word_marks[mark_i]
+        if word.startswith(current_mark):
+            punctuation = word[len(current_mark):].replace("'", "").replace('"', '').replace('...', '')
+            has_alnum = any([x.isalnum() for x in punctuation])
+            if len(punctuation) >= 1 and not has_alnum and punctuation[0] in punctuation_marks:
+                punctuation = "[" + unicodedata.name(punctuation[0]) + "]"
+            elif len(punctuation) == 0 or punctuation[0] not in punctuation_marks:
+                punctuation = "[SILENCE]"
+            else:
+                return {
+                    "incorrect": "word starts with punctuation",
+                    "text": text,
+                }
+            punctuations.append((word_ends[mark_i], punctuation))
+            mark_i += 1
+        else:
+            return {
+                "incorrect": "word does not start with mark",
+                "text": text,
+            }
+    phones = []
+    max_time = phone_ends[-1]
+    filter_grid = [
+        (start, end, mark)
+        for start, end, mark in zip(phone_starts, phone_ends, phone_marks)
+        if len(mark) > 0
+    ]
+    punc_i = 0
+    for i, (start, end, mark) in enumerate(filter_grid):
+        if i == 0:
+            phones.append((0.0, start, "[SILENCE]"))
+        phones.append((start, end, mark))
+        if punc_i < len(punctuations) and end == punctuations[punc_i][0]:
+            if i < len(filter_grid) - 1:
+                next_time = filter_grid[i + 1][0]
+            else:
+                next_time = max_time
+            phones.append((end, next_time, punctuations[punc_i][1]))
+            punc_i += 1
+    return {
+        "wav": wav,
+        "speaker": Path(wav).parent,
+        "transcript": " ".join(words),
+        "phones": phones,
+        "words": [
+            (start, end, mark)
+            for start, end, mark in zip(word_starts, word_ends, word_marks)
+            if len(mark) > 0
+        ],
+    }
+
+
 class AlignmentDataset(Dataset):
     def __init__(
         self,
@@ -91,6 +207,7 @@ class AlignmentDataset(Dataset):
         source_url=None,
         force="none", # "none", "all", "download", "processing", "lexicon", "validation", "alignment"
         symbolic_links=True,
+        link_mode=None, # "symlink", "hardlink", "reflink" or "copy", defaults to "symlink" if symbolic_links else "copy"
         acoustic_model="english_us_arpa",
         g2p_model="english_us_arpa",
         lexicon=None,
@@ -100,8 +217,28 @@ class AlignmentDataset(Dataset):
         tmp_directory=None,
         chunk_size=100,
         target_sampling_rate=None,
-        textgrid_url=None, # url to a zip file containing TextGrids
+        resample_directory=None, # resampled audio is cached in resample_directory/.resampled/<rate>, defaults to target_directory
+        textgrid_url=None, # url to a .zip or .tar.gz file containing TextGrids, or to an alignment archive (see alignments.archive)
         n_workers=multiprocessing.cpu_count(),
+        use_index=True, # store parsed items in an index file in target_directory and reuse it on later runs
+        phones_format="tuples", # "tuples" for lists of (start, end, phone), "arrays" for numpy views
+        lazy=False, # parse items on first access instead of up front
+        cache_size=10_000, # number of parsed items kept in memory in lazy mode
+        packed_audio=False, # pack all audio into memory-mapped shards and return it as item["audio"]
+        prefetch_audio=0, # decode the audio of up to this many upcoming items in background threads and return it as item["audio"]
+        prefetch_threads=4, # number of threads decoding audio with prefetch_audio
+        crop_seconds=None, # with prefetch_audio, crop items to a random segment of at most this many seconds at phone boundaries
+        features=None, # dict of settings of feature_config (see alignments.features), extracts mel spectrograms, pitch and energy once and adds them to items
+        n_shards=1, # split the corpus by speaker into n_shards shards which are aligned concurrently
+        shard_commands=None, # write the mfa command of each shard to this file instead of running them (e.g. for a cluster)
+        source_sha256=None, # expected sha256 checksum of the archive at source_url
+        textgrid_sha256=None, # expected sha256 checksum of the archive at textgrid_url
+        validation="fast", # "fast" finds OOV words in python, "full" runs mfa validate (which also checks the audio)
+        g2p_cache=True, # reuse pronunciations generated by the g2p model in a shared sqlite file (see alignments.g2p_cache), or a path to such a file
+        build_search_index=False, # build the search index (see search_index) while loading instead of on first use
+        metrics_hooks=None, # functions called with the metrics of each finished stage (see alignments.metrics)
+        metrics_path=None, # write a JSON report of the metrics of all stages to this path
+        download_connections=1, # number of parallel ranged connections used to download .zip archives (and .tar.gz archives, which are then not streamed)
     ):
         super().__init__()
         __metaclass__ = abc.ABCMeta
@@ -112,90 +249,120 @@ class AlignmentDataset(Dataset):
         self.punctuation_marks = punctuation_marks
         self.chunk_size = chunk_size
         self.target_sampling_rate = target_sampling_rate
+        self.resample_directory = resample_directory
+        self.resampled_directory = None
         self.n_workers = n_workers
+        self.use_index = use_index
+        self.build_search_index = build_search_index
+        if phones_format not in PHONES_FORMATS:
+            raise ValueError(f"phones_format must be one of {PHONES_FORMATS}")
+        self.phones_format = phones_format
+        self.acoustic_model = acoustic_model
+        self.g2p_model = g2p_model
+        self.g2p_cache = g2p_cache
+        if validation not in ["fast", "full"]:
+            raise ValueError("validation must be \"fast\" or \"full\"")
+        self.verbose = verbose
+        # set by the VALIDATE stage, needed to align new utterances in refresh
+        self.lexicon_with_oov_path = None
+        if source_directory is not None and (Path(source_directory) / "lexicon_with_oov.txt").exists():
+            self.lexicon_with_oov_path = Path(source_directory) / "lexicon_with_oov.txt"
+        if lazy and phones_format != "tuples":
+            raise ValueError("lazy mode only supports phones_format=\"tuples\"")
+        self.lazy = lazy
+        self.cache_size = cache_size
+        self.inventory = None
+        if lazy and packed_audio:
+            raise ValueError("packed_audio is not supported in lazy mode")
+        self.packed_audio = packed_audio
+        self.audio_store = None
+        if prefetch_audio > 0 and packed_audio:
+            raise ValueError("prefetch_audio is not needed with packed_audio")
+        if crop_seconds is not None and (prefetch_audio == 0 or lazy):
+            raise ValueError("crop_seconds needs prefetch_audio and is not supported in lazy mode")
+        self.prefetch_audio = prefetch_audio
+        self.prefetch_threads = prefetch_threads
+        self.crop_seconds = crop_seconds
+        self.prefetcher = None
+        if features is not None and (lazy or crop_seconds is not None):
+            raise ValueError("features are not supported in lazy mode or with crop_seconds")
+        self.features = features
+        self.feature_store = None
         if tmp_directory is None:
             self.tmp_directory = Path("/tmp/alignments")
         else:
             self.tmp_directory = Path(tmp_directory)
         self.tmp_directory.mkdir(parents=True, exist_ok=True)
+        self.metrics = Metrics(metrics_hooks, metrics_path)
+
+        if force != "none":
+            index_path(target_directory).unlink(missing_ok=True)
+        self.archive = AlignmentArchive.open(Path(target_directory) / ARCHIVE_NAME)
 
         if source_directory is None:
             # skip all other init steps
             self._load_files()
             return
 
-        if len(list(Path(target_directory).glob("**/*.TextGrid"))) > 0 and force == "none":
+        if (self._scan().count(".TextGrid") > 0 or self.archive is not None) and force == "none":
             print(f"[green]✓[/green] {target_directory} already contains TextGrids")
             self._load_files()
             return
         
         if textgrid_url is not None:
-            # download textgrids
-            download_path = Path(f"{self.tmp_directory}/downloads")
-            download_path.mkdir(exist_ok=True, parents=True)
-            if textgrid_url.endswith(".zip"):
-                tmp_path = download_path / "data.zip"
-                response = request.urlretrieve(textgrid_url, tmp_path, DownloadProgressBar())
-                ZipFile(tmp_path).extractall(target_directory)
-            elif textgrid_url.endswith(".tar.gz"):
-                tmp_path = download_path / "data.tar.gz"
-                response = request.urlretrieve(textgrid_url, tmp_path, DownloadProgressBar())
-                tarfile.open(tmp_path).extractall(target_directory)
-            else:
-                raise ValueError("Unknown file type, only .zip and .tar.gz are supported.")
-            # if speaker directories are missing, create them, and move .TextGrid files
-            for textgrid in Path(target_directory).glob("*.TextGrid"):
-                speaker = textgrid.name.split("_")[0]
-                speaker_dir = Path(target_directory) / speaker
-                speaker_dir.mkdir(exist_ok=True, parents=True)
-                shutil.move(textgrid, speaker_dir / textgrid.name)
-            shutil.rmtree(download_path, ignore_errors=True)
+            with self.metrics.stage("download textgrids") as stage:
+                if textgrid_url.endswith(ARCHIVE_SUFFIX):
+                    # alignment archives are read directly, no TextGrids are extracted
+                    archive_path = download_file(textgrid_url, Path(target_directory) / ARCHIVE_NAME, textgrid_sha256, download_connections)
+                    stage.add(files=1, bytes=archive_path.stat().st_size)
+                    self.archive = AlignmentArchive.open(archive_path)
+                    if self.archive is None:
+                        raise ValueError(f"{textgrid_url} is not a valid alignment archive")
+                else:
+                    # download textgrids
+                    download_path = Path(f"{self.tmp_directory}/downloads")
+                    download_path.mkdir(exist_ok=True, parents=True)
+                    stage.add(bytes=download_and_extract(textgrid_url, target_directory, download_path, textgrid_sha256, download_connections))
+                    # if speaker directories are missing, create them, and move .TextGrid files
+                    for textgrid in Path(target_directory).glob("*.TextGrid"):
+                        speaker = textgrid.name.split("_")[0]
+                        speaker_dir = Path(target_directory) / speaker
+                        speaker_dir.mkdir(exist_ok=True, parents=True)
+                        shutil.move(textgrid, speaker_dir / textgrid.name)
+                    shutil.rmtree(download_path, ignore_errors=True)
+                    self.inventory = None
 
         # DOWNLOAD
         if self.source_url is not None:
-            if force == "download" or force == "all":
-                shutil.rmtree(source_directory)
-            if not Path(source_directory).exists():
-                download_path = Path(f"{self.tmp_directory}/downloads")
-                download_path.mkdir(exist_ok=True, parents=True)
-                if self.source_url.endswith(".zip"):
-                    tmp_path = download_path / "data.zip"
-                    response = request.urlretrieve(self.source_url, tmp_path, DownloadProgressBar())
-                    ZipFile(tmp_path).extractall(source_directory)
-                elif self.source_url.endswith(".tar.gz"):
-                    tmp_path = download_path / "data.tar.gz"
-                    response = request.urlretrieve(self.source_url, tmp_path, DownloadProgressBar())
-                    tarfile.open(tmp_path).extractall(source_directory)
+            with self.metrics.stage("download") as stage:
+                if force == "download" or force == "all":
+                    shutil.rmtree(source_directory)
+                if not Path(source_directory).exists():
+                    download_path = Path(f"{self.tmp_directory}/downloads")
+                    download_path.mkdir(exist_ok=True, parents=True)
+                    stage.add(bytes=download_and_extract(self.source_url, source_directory, download_path, source_sha256, download_connections))
+                    shutil.rmtree(download_path, ignore_errors=True)
                 else:
-                    raise ValueError("Unknown file type, only .zip and .tar.gz are supported.")
-                shutil.rmtree(download_path, ignore_errors=True)
-            else:
-                print("Source directory already exists. Skipping [blue]download[/blue].")
+                    print("Source directory already exists. Skipping [blue]download[/blue].")
+                    stage.skip()
 
         # LOAD
-        if force == "processing" or force == "all":
-            shutil.rmtree(target_directory)
+        with self.metrics.stage("processing") as stage:
+            if force == "processing" or force == "all":
+                shutil.rmtree(target_directory)
+                self.inventory = None
         
-        if not Path(target_directory).exists() or (textgrid_url is not None and len(list(Path(target_directory).glob("**/*.wav"))) == 0):
-            Path(target_directory).mkdir(exist_ok=True, parents=True)
-            for item in self.collect_data(self.source_directory):
-                if not item["path"].suffix in [".wav", ".flac"]:
-                    raise ValueError("Only .wav and .flac files are supported.")
-                target_path = (Path(target_directory) / item["speaker"] / item["path"].name)
-                target_path.parent.mkdir(exist_ok=True, parents=True)
-                if symbolic_links:
-                    target_path.resolve().symlink_to(item["path"].resolve())
-                else:
-                    shutil.copy(item["path"], target_path)
-                if "transcript" in item:
-                    target_path.with_suffix(".lab").write_text(item["transcript"])
-                elif "textgrid" in item:
-                    # symlink to textgrid instead of creating a lab file
-                    target_path.with_suffix(".TextGrid").resolve().symlink_to(item["textgrid"].resolve())
-                else:
-                    raise ValueError("Either transcript or textgrid must be provided.")
-        else:
-            print("Target directory already exists. Skipping [blue]processing[/blue].")
+            if not Path(target_directory).exists() or (textgrid_url is not None and self._scan().count(".wav") == 0):
+                Path(target_directory).mkdir(exist_ok=True, parents=True)
+                if link_mode is None:
+                    link_mode = "symlink" if symbolic_links else "copy"
+                n_items = materialize(self.collect_data(self.source_directory), target_directory, link_mode, n_workers)
+                print(f"[green]✓[/green] {link_mode} {n_items} files to target directory")
+                stage.add(files=n_items)
+                self.inventory = None
+            else:
+                print("Target directory already exists. Skipping [blue]processing[/blue].")
+                stage.skip()
 
         # We can avoid MFA if TextGrids already exist
         if textgrid_url is not None:
@@ -203,158 +370,643 @@ class AlignmentDataset(Dataset):
             return
 
         # PREPARE
-        check_install_mfa(True, force=="conda" or force=="all")
-        download_command = f". $CONDA_PREFIX/etc/profile.d/conda.sh \
-                            && conda activate alignments_mfa \
-                            && mfa model download acoustic {acoustic_model}"
-        if g2p_model is not None:
-            download_command += f" && mfa model download g2p {g2p_model}"
-        run_subprocess(
-            download_command,
-            "downloading necessary models",
-            not verbose
-        )
+        with self.metrics.stage("prepare"):
+            if "ALIGNMENTS_MFA" not in os.environ:
+                check_install_mfa(True, force=="conda" or force=="all")
+            download_command = mfa_command(f"model download acoustic {acoustic_model}")
+            if g2p_model is not None:
+                download_command += " && " + mfa_command(f"model download g2p {g2p_model}")
+            run_subprocess(
+                download_command,
+                "downloading necessary models",
+                not verbose,
+                metrics=self.metrics,
+            )
 
         # LEXICON
-        lexicon_path = Path(source_directory) / "lexicon.txt"
-        if force == "lexicon" or force == "all":
-            lexicon_path.unlink(missing_ok=True)
-        if not lexicon_path.exists():
-            if lexicon is not None:
-                if lexicon.startswith("http"):
-                    response = request.urlretrieve(lexicon, lexicon_path, DownloadProgressBar())
-            elif g2p_model is not None:
-                g2p_command = f". $CONDA_PREFIX/etc/profile.d/conda.sh \
-                                && conda activate alignments_mfa \
-                                && mfa g2p {g2p_model} {target_directory} {lexicon_path} -j {n_workers}"
-                run_subprocess(
-                    g2p_command,
-                    "creating lexicon using g2p model (this could take a while)",
-                    not verbose
-                )
-        else:
-            print("Lexicon already exists. Skipping [blue]lexicon[/blue] creation.")
-        with open (lexicon_path, 'r') as f:
-            content = f.read()
-            content_new = re.sub('^(\S+)\s+', r'\1\t', content, flags = re.M)
-        with open (lexicon_path, 'w') as f:
-            f.write(content_new)
+        with self.metrics.stage("lexicon") as stage:
+            lexicon_path = Path(source_directory) / "lexicon.txt"
+            if force == "lexicon" or force == "all":
+                lexicon_path.unlink(missing_ok=True)
+            if not lexicon_path.exists():
+                if lexicon is not None:
+                    if lexicon.startswith("http"):
+                        download_file(lexicon, lexicon_path)
+                elif g2p_model is not None:
+                    stage.add(files=self._scan().count(".lab"))
+                    self._g2p(
+                        corpus_words(self._scan().paths(".lab"), n_workers),
+                        lexicon_path,
+                        "creating lexicon using g2p model (this could take a while)",
+                    )
+            else:
+                print("Lexicon already exists. Skipping [blue]lexicon[/blue] creation.")
+                stage.skip()
+            normalize_lexicon(lexicon_path)
         
 
         # VALIDATE
-        lexicon_with_oov_path = Path(source_directory) / "lexicon_with_oov.txt"
-        oov_path = Path(os.environ["MFA_ROOT_DIR"]) / f"{Path(target_directory).name}_validate_pretrained" / "oovs_found_lexicon.txt"
-        if force == "validation" or force == "all":
-            lexicon_with_oov_path.unlink(missing_ok=True)
-            shutil.rmtree(oov_path.parent)
-        if not lexicon_with_oov_path.exists() or not oov_path.parent.exists():
-            align_command = f". $CONDA_PREFIX/etc/profile.d/conda.sh \
-                                && conda activate alignments_mfa \
-                                && mfa validate {target_directory} {lexicon_path} {acoustic_model} -j {n_workers} --clean --overwrite"
+        with self.metrics.stage("validation") as stage:
+            lexicon_with_oov_path = Path(source_directory) / "lexicon_with_oov.txt"
+            self.lexicon_with_oov_path = lexicon_with_oov_path
+            if validation == "full":
+                oov_path = Path(os.environ["MFA_ROOT_DIR"]) / f"{Path(target_directory).name}_validate_pretrained" / "oovs_found_lexicon.txt"
+            else:
+                oov_path = Path(source_directory) / "oovs_found_lexicon.txt"
+            if force == "validation" or force == "all":
+                lexicon_with_oov_path.unlink(missing_ok=True)
+                if validation == "full":
+                    shutil.rmtree(oov_path.parent, ignore_errors=True)
+                else:
+                    oov_path.unlink(missing_ok=True)
+            validated = oov_path.parent.exists() if validation == "full" else oov_path.exists()
+            if not lexicon_with_oov_path.exists() or not validated:
+                if validation == "full":
+                    align_command = mfa_command(f"validate {target_directory} {lexicon_path} {acoustic_model} -j {n_workers} --clean --overwrite")
+                    run_subprocess(
+                        align_command,
+                        "validating data",
+                        not verbose,
+                        metrics=self.metrics,
+                    )
+                else:
+                    oovs = find_oovs(self._scan().paths(".lab"), lexicon_path, n_workers)
+                    stage.add(files=self._scan().count(".lab"))
+                    oov_path.write_text("".join(f"{word}\n" for word in oovs))
+                    print(f"[green]✓[/green] found {len(oovs)} OOV words")
+                self.tmp_directory.mkdir(exist_ok=True, parents=True)
+                lexicon_tmp_path = self.tmp_directory / "lexicon.txt"
+                self._g2p(
+                    [line.split()[0] for line in oov_path.read_text().splitlines() if len(line.split()) > 0],
+                    lexicon_tmp_path,
+                    "using g2p model for oovs",
+                )
+                lexicon_with_oov_path.write_text(lexicon_path.read_text()+lexicon_tmp_path.read_text())
+            else:
+                print("Lexicon with OOV words and valid. directory already exists. Skipping [blue]validation[/blue].")
+                stage.skip()
+            normalize_lexicon(lexicon_with_oov_path)
+
+        # ALIGN
+        with self.metrics.stage("alignment") as stage:
+            if force == "alignment" or force == "all":
+                for textgrid in self._scan().paths(".TextGrid"):
+                    textgrid.unlink(missing_ok=True)
+                (Path(target_directory) / ARCHIVE_NAME).unlink(missing_ok=True)
+                self.archive = None
+                self.inventory = None
+            if self._scan().count(".TextGrid") == 0:
+                stage.add(files=len(self._scan().unaligned))
+                index_path(target_directory).unlink(missing_ok=True)
+                if n_shards > 1:
+                    if not self._align_sharded(n_shards, shard_commands):
+                        self._set_data(ColumnarBuilder(target_directory).build(phones_format))
+                        return
+                else:
+                    self._align(target_directory, verbose)
+            else:
+                print("TextGrids already exist. Skipping [blue]alignment[/blue].")
+                stage.skip()
+
+        self._load_files()
+        
+    def _g2p(self, words, output_path, desc):
+        """
+        Writes a lexicon of ``words`` to ``output_path`` using the g2p model.
+        Pronunciations found in the g2p cache are reused, only the remaining words are passed to ``mfa g2p``
+        and their pronunciations are added to the cache.
+        """
+        words = sorted(set(words))
+        entries = []
+        cache = None
+        if self.g2p_cache:
+            cache = G2PCache(None if self.g2p_cache is True else self.g2p_cache)
+            cached = cache.lookup(self.g2p_model, words)
+            entries = [(word, pronunciation) for word in words for pronunciation in cached.get(word, [])]
+            words = [word for word in words if word not in cached]
+            print(f"[green]✓[/green] found {len(cached)} of {len(cached) + len(words)} words in the g2p cache")
+        if len(words) > 0:
+            word_path = self.tmp_directory / "g2p_words.txt"
+            new_lexicon_path = self.tmp_directory / "g2p_lexicon.txt"
+            word_path.write_text("".join(f"{word}\n" for word in words))
             run_subprocess(
-                align_command,
-                "validating data",
-                not verbose
+                mfa_command(f"g2p {self.g2p_model} {word_path} {new_lexicon_path} -j {self.n_workers}"),
+                desc,
+                not self.verbose,
+                metrics=self.metrics,
             )
-            self.tmp_directory.mkdir(exist_ok=True, parents=True)
-            lexicon_tmp_path = self.tmp_directory / "lexicon.txt"
-            g2p_command = f". $CONDA_PREFIX/etc/profile.d/conda.sh \
-                                && conda activate alignments_mfa \
-                                && mfa g2p {g2p_model} {oov_path} {lexicon_tmp_path} -j {n_workers}"
-            run_subprocess(
-                g2p_command,
-                "using g2p model for oovs",
-                not verbose
+            new_entries = read_lexicon(new_lexicon_path)
+            if cache is not None:
+                cache.add(self.g2p_model, new_entries)
+            entries += new_entries
+            new_lexicon_path.unlink(missing_ok=True)
+        if cache is not None:
+            cache.close()
+        entries.sort(key=lambda x: x[0])
+        write_lexicon(output_path, entries)
+
+    def _align(self, corpus_directory, verbose=False):
+        """
+        Aligns the corpus in ``corpus_directory`` using MFA and copies the resulting TextGrids
+        to the target directory, ``corpus_directory`` has to mirror the layout of the target directory.
+        """
+        target_temp_directory = self.tmp_directory / "alignments"
+        shutil.rmtree(target_temp_directory, ignore_errors=True)
+        target_temp_directory.mkdir(exist_ok=True, parents=True)
+        align_command = mfa_command(
+            f"align {corpus_directory} {self.lexicon_with_oov_path} {self.acoustic_model} {target_temp_directory} -j {self.n_workers} --clean --overwrite --verbose"
+        )
+        run_subprocess(
+                align_command,
+                "aligning data",
+                not verbose,
+                metrics=self.metrics,
             )
-            lexicon_with_oov_path.write_text(lexicon_path.read_text()+lexicon_tmp_path.read_text())
-        else:
-            print("Lexicon with OOV words and valid. directory already exists. Skipping [blue]validation[/blue].")
-        with open (lexicon_with_oov_path, 'r') as f:
-            content = f.read()
-            content_new = re.sub('^(\S+)\s+', r'\1\t', content, flags = re.M)
-        with open (lexicon_with_oov_path, 'w') as f:
-            f.write(content_new)
+        run_subprocess(
+            f"cp -rT {target_temp_directory} {self.target_directory}",
+            "copying TextGrids to target directory",
+        )
+        shutil.rmtree(target_temp_directory, ignore_errors=True)
+        if "MFA_ROOT_DIR" in os.environ:
+            shutil.rmtree(os.environ["MFA_ROOT_DIR"], ignore_errors=True)
+        self.inventory = None
 
-        # ALIGN
-        if force == "alignment" or force == "all":
-            for textgrid in Path(target_directory).glob("**/*.TextGrid"):
-                textgrid.unlink(missing_ok=True)
-        if len(list(Path(target_directory).glob("**/*.TextGrid"))) == 0:
-            target_temp_directory = self.tmp_directory / "alignments"
-            shutil.rmtree(target_temp_directory, ignore_errors=True)
-            target_temp_directory.mkdir(exist_ok=True, parents=True)
-            align_command = f". $CONDA_PREFIX/etc/profile.d/conda.sh \
-                                    && conda activate alignments_mfa \
-                                    && mfa align {target_directory} {lexicon_with_oov_path} {acoustic_model} {target_temp_directory} -j {n_workers} --clean --overwrite --verbose"
-            run_subprocess(
-                    align_command,
-                    "aligning data",
-                    not verbose
-                )
-            run_subprocess(
-                f"cp -rT {target_temp_directory} {target_directory}",
-                "copying TextGrids to target directory",
+    def _align_sharded(self, n_shards, shard_commands=None):
+        """
+        Aligns the target directory in ``n_shards`` shards of speakers (see ``alignments.sharding``),
+        shards which were aligned in a previous run are skipped.
+        If ``shard_commands`` is given, the commands of the remaining shards are written to it instead,
+        and False is returned until all of them finished.
+        """
+        unaligned = self._scan().unaligned
+        sharded = ShardedAlignment(
+            self.target_directory,
+            [(x, x.with_suffix(".lab")) for x in unaligned],
+            self.tmp_directory / "shards" / Path(self.target_directory).name,
+            n_shards,
+            lambda corpus, output, n_jobs: mfa_command(
+                f"align {corpus} {self.lexicon_with_oov_path} {self.acoustic_model} {output} -j {n_jobs} --clean --overwrite"
+            ),
+            self.n_workers,
+        )
+        pending = sharded.pending
+        if shard_commands is not None and len(pending) > 0:
+            sharded.write_commands(shard_commands)
+            print(
+                f"Wrote commands for {len(pending)} of {len(sharded.shards)} shards to {shard_commands}, "
+                "run them and create the dataset again to merge the TextGrids."
             )
-            shutil.rmtree(target_temp_directory, ignore_errors=True)
+            return False
+        print(f"Aligning {len(pending)} of {len(sharded.shards)} shards, {len(sharded.shards) - len(pending)} already done.")
+        sharded.run(metrics=self.metrics)
+        sharded.merge()
+        print(f"[green]✓[/green] merged TextGrids of {len(sharded.shards)} shards")
+        shutil.rmtree(sharded.shard_directory, ignore_errors=True)
+        if "MFA_ROOT_DIR" in os.environ:
             shutil.rmtree(os.environ["MFA_ROOT_DIR"], ignore_errors=True)
-        else:
-            print("TextGrids already exist. Skipping [blue]alignment[/blue].")
+        self.inventory = None
+        return True
+
+    def _align_missing(self):
+        """
+        Aligns only the utterances in the target directory which have a .lab file but no TextGrid.
+        """
+        unaligned = self._scan().unaligned
+        if len(unaligned) == 0:
+            print("All utterances have TextGrids. Skipping [blue]alignment[/blue].")
+            return
+        if self.lexicon_with_oov_path is None or not Path(self.lexicon_with_oov_path).exists():
+            raise ValueError("no lexicon found, aligning new utterances requires a source_directory containing lexicon_with_oov.txt")
+        print(f"Aligning {len(unaligned)} utterances without TextGrids.")
+        corpus_directory = self.tmp_directory / "unaligned"
+        shutil.rmtree(corpus_directory, ignore_errors=True)
+        for item in unaligned:
+            relative_path = item.relative_to(self.target_directory)
+            (corpus_directory / relative_path).parent.mkdir(exist_ok=True, parents=True)
+            (corpus_directory / relative_path).symlink_to(item.resolve())
+            (corpus_directory / relative_path).with_suffix(".lab").symlink_to(item.with_suffix(".lab").resolve())
+        self._align(corpus_directory, self.verbose)
+        shutil.rmtree(corpus_directory, ignore_errors=True)
+
+    def refresh(self, align=False):
+        """
+        Updates the dataset after files in the target directory were added, removed or changed.
+        Only triples which are new or whose files changed (according to their modification time and size)
+        are parsed again, everything else is taken from the index.
+        If ``align`` is True, utterances without a TextGrid are aligned first (this requires MFA and the lexicon).
+        """
+        with self.metrics.stage("refresh") as stage:
+            self.inventory = None
+            self.archive = AlignmentArchive.open(Path(self.target_directory) / ARCHIVE_NAME)
+            if align:
+                self._align_missing()
+            path = index_path(self.target_directory)
+            data = load_index(path, self.target_directory, self.punctuation_marks, PARSER_VERSION)
+            manifest = load_manifest(path, self.punctuation_marks, PARSER_VERSION)
+            if data is None or manifest is None:
+                print("No valid index found, loading all files.")
+                use_index, lazy = self.use_index, self.lazy
+                self.use_index, self.lazy = True, False
+                self._load_files()
+                self.use_index, self.lazy = use_index, lazy
+                return
+            self._find_files()
+            stats = [self._file_stats(file) for file in self.files]
+            previous = [None] * len(self.files)
+            changed = []
+            for i, file in enumerate(self.files):
+                row = manifest.lookup(str(file[0].relative_to(self.target_directory)))
+                if row is not None and tuple(manifest.stats[row].tolist()) == stats[i]:
+                    previous[i] = row
+                else:
+                    changed.append(i)
+            print(f"{len(self.files) - len(changed)} files unchanged, {len(changed)} new or changed.")
+            stage.add(files=len(changed))
+            parsed = {}
+            if len(changed) > 0:
+                for i, item in zip(changed, self._parse_files(
+                    [self.files[i] for i in changed], "collecting new textgrid and audio files"
+                )):
+                    parsed[i] = item
+            builder = ColumnarBuilder(self.target_directory)
+            items, reasons = [], []
+            for i in range(len(self.files)):
+                if previous[i] is not None:
+                    row = manifest.items[previous[i]]
+                    reason = manifest.reasons[previous[i]]
+                    if row >= 0:
+                        items.append(len(builder))
+                        builder.append_from(data, row)
+                    else:
+                        items.append(-1)
+                    reasons.append(reason)
+                elif "incorrect" not in parsed[i]:
+                    items.append(len(builder))
+                    builder.append(parsed[i])
+                    reasons.append("")
+                else:
+                    self._warn_skipped(parsed[i])
+                    items.append(-1)
+                    reasons.append(parsed[i]["incorrect"])
+            self._set_data(builder.build(self.phones_format))
+            print(f"Found {len(self.data)} items with {items.count(-1)} skipped due to bad punctuation.")
+            manifest = Manifest.build(self.target_directory, self.files, stats, items, reasons)
+            write_index(path, self.data, manifest, self.punctuation_marks, PARSER_VERSION)
+            self._prepare_audio()
+
+    def _set_data(self, data):
+        self.data = data
+        self.vocab = data.vocab
+        self.tokens = set(data.vocab)
+        self.token_counts = data.token_counts
 
-        self._load_files()
-        
     def _load_files(self):
         """
         Loads the files from the source directory.
         """
-        self.files = []
-        self.missing = 0
-        for item in Path(self.target_directory).glob("**/*.wav"):
-            if item.with_suffix(".TextGrid").exists() and item.with_suffix(".lab").exists():
-                self.files.append([item, item.with_suffix(".TextGrid"), item.with_suffix(".lab")])
-            else:
-                self.missing += 1
-        # same for flac files
-        for item in Path(self.target_directory).glob("**/*.flac"):
-            if item.with_suffix(".TextGrid").exists() and item.with_suffix(".lab").exists():
-                self.files.append([item, item.with_suffix(".TextGrid"), item.with_suffix(".lab")])
+        with self.metrics.stage("load") as stage:
+            self._load_items(stage)
+        if self.build_search_index and not self.lazy:
+            with self.metrics.stage("search index"):
+                self.search_index()
+        self._prepare_audio()
+
+    def _load_items(self, stage):
+        # lazy mode indexes the files it found (skipped items stay as None), so the index isn't used
+        if self.use_index and not self.lazy:
+            path = index_path(self.target_directory)
+            data = load_index(path, self.target_directory, self.punctuation_marks, PARSER_VERSION, self.phones_format)
+            if data is not None:
+                self._set_data(data)
+                stage.add(files=1, bytes=path.stat().st_size)
+                print(f"[green]✓[/green] loaded {len(self.data)} items from index")
+                return
+        self._find_files()
+        if self.lazy:
+            self.data = LazyData(self.files, self._create_item, self.cache_size, self._warn_skipped)
+            self.vocab = None
+            self.tokens = set()
+            self.token_counts = {}
+            return
+        builder = ColumnarBuilder(self.target_directory)
+        items, reasons = [], []
+        for item in self._parse_files(self.files, "collecting textgrid and audio files"):
+            if "incorrect" not in item:
+                items.append(len(builder))
+                reasons.append("")
+                builder.append(item)
             else:
-                self.missing += 1
+                self._warn_skipped(item)
+                items.append(-1)
+                reasons.append(item["incorrect"])
+        self._set_data(builder.build(self.phones_format))
+        print(f"Found {len(self.data)} items with {items.count(-1)} skipped due to bad punctuation.")
+        stats = [self._file_stats(file) for file in self.files]
+        # the parsed TextGrid and lab files, the audio is only read later
+        stage.add(files=len(self.files), bytes=sum(x[3] + x[5] for x in stats))
+        if self.use_index:
+            manifest = Manifest.build(self.target_directory, self.files, stats, items, reasons)
+            write_index(index_path(self.target_directory), self.data, manifest, self.punctuation_marks, PARSER_VERSION)
+
+    def _find_files(self):
+        """
+        Collects the (wav, TextGrid, lab) triples in the target directory.
+        """
+        inventory = self._scan()
+        self.files = inventory.files
+        self.missing = inventory.missing
+        if self.archive is not None:
+            # utterances without a TextGrid file are read from the alignment archive
+            archived = [
+                [audio, audio.with_suffix(".TextGrid"), audio.with_suffix(".lab")]
+                for audio in inventory.unaligned
+                if self.archive.lookup(audio.stem) is not None
+            ]
+            self.files = sorted(self.files + archived)
+            self.missing -= len(archived)
         print(f"Found {len(self.files)} files with {self.missing} missing.")
-        self.data = []
-        self.tokens = set()
-        self.token_counts = {}
-        none_count = 0
-        for item in process_map(
-                self._create_item,
-                self.files,
-                chunksize=self.chunk_size,
-                max_workers=self.n_workers,
-                desc="collecting textgrid and audio files",
-                tqdm_class=tqdm,
-            ):
-            if "incorrect" not in item:
-                self.data.append(item)
-                tokens = [x[2] for x in item["phones"]]
-                self.tokens.update(tokens)
-                for token in tokens:
-                    if token not in self.token_counts:
-                        self.token_counts[token] = 1
-                    else:
-                        self.token_counts[token] += 1
+
+    def _file_stats(self, file):
+        """
+        Modification times and sizes of a (wav, TextGrid, lab) triple for the manifest,
+        TextGrids which are only in the alignment archive get the stats of the archive.
+        """
+        inventory = self._scan()
+        wav, grid, lab = file
+        if self.archive is not None and ".TextGrid" not in inventory.entries.get(os.path.splitext(str(grid))[0], {}):
+            return inventory.stats([wav]) + self.archive.stats + inventory.stats([lab])
+        return inventory.stats(file)
+
+    def export_textgrids(self):
+        """
+        Writes a TextGrid file next to each audio file whose alignment is only stored in the alignment archive.
+        """
+        if self.archive is None:
+            raise ValueError("no alignment archive found in the target directory")
+        for audio in tqdm(self._scan().unaligned, desc="exporting TextGrids"):
+            index = self.archive.lookup(audio.stem)
+            if index is not None:
+                self.archive.write_textgrid(index, audio.with_suffix(".TextGrid"))
+        self.inventory = None
+
+    def export_shards(self, directory, format="parquet", audio=False, max_shard_bytes=2**30, batch_size=1000, compression="zstd"):
+        """
+        Writes all items to Parquet or Arrow shards of at most about ``max_shard_bytes`` in ``directory``,
+        with the bytes of the audio files if ``audio``. Read them with ``AlignmentReader.from_shards``
+        or ``alignments.shards.ShardedCorpus``, see ``alignments.shards``.
+        """
+        if self.lazy:
+            raise ValueError("exporting shards is not supported in lazy mode")
+        with self.metrics.stage("export shards") as stage:
+            n_shards = export_shards(
+                self.data, directory, format, audio, max_shard_bytes, batch_size, compression, n_workers=self.n_workers
+            )
+            stage.add(files=len(self), bytes=sum(x.stat().st_size for x in Path(directory).iterdir()))
+        print(f"[green]✓[/green] exported {len(self)} items to {n_shards} {format} shards")
+
+    def _scan(self):
+        """
+        Returns the inventory of the target directory, the directory is only walked again after it was modified.
+        """
+        if self.inventory is None:
+            self.inventory = scan_directory(self.target_directory, self.n_workers)
+        return self.inventory
+
+    def _warn_skipped(self, item):
+        if self.show_warnings:
+            print(f"WARNING: \"{item['text']}\" is incorrect and was skipped because {item['incorrect']}")
+
+    def _prepare_audio(self):
+        self._resample()
+        if self.packed_audio:
+            self.audio_store = AudioStore.open(
+                Path(self.target_directory) / AUDIO_STORE_NAME, self.data.signature(), self.target_sampling_rate
+            )
+            if self.audio_store is None:
+                self.pack_audio()
             else:
-                if self.show_warnings:
-                    print(f"WARNING: \"{item['text']}\" is incorrect and was skipped because {item['incorrect']}")
-                none_count += 1
-        print(f"Found {len(self.data)} items with {none_count} skipped due to bad punctuation.")
+                print(f"[green]✓[/green] opened packed audio")
+        if self.features is not None:
+            self.extract_features(**self.features)
+
+    def pack_audio(self, shard_size=2**31, dtype="int16"):
+        """
+        Writes the audio of all items (at ``target_sampling_rate``, if set) into shards of at most
+        ``shard_size`` bytes in the target directory. Afterwards, items contain the audio as a
+        memory-mapped numpy array in ``item["audio"]``.
+        """
+        if self.lazy:
+            raise ValueError("packed audio is not supported in lazy mode")
+        directory = Path(self.target_directory) / AUDIO_STORE_NAME
+        with self.metrics.stage("pack audio") as stage:
+            # resampled files are read if audio was resampled, so it isn't resampled a second time
+            pack_audio(
+                [self._audio_path(i) for i in range(len(self))],
+                directory,
+                self.data.signature(),
+                sampling_rate=self.target_sampling_rate,
+                dtype=dtype,
+                shard_size=shard_size,
+                n_workers=self.n_workers,
+                chunk_size=self.chunk_size,
+            )
+            stage.add(files=len(self.data.wavs), bytes=sum(x.stat().st_size for x in directory.iterdir()))
+        self.audio_store = AudioStore.open(directory)
+        self.packed_audio = True
+
+    def extract_features(self, **kwargs):
+        """
+        Extracts log mel spectrograms, pitch and energy (see ``alignments.features``) of all items which have no
+        features with these settings yet. Afterwards, items contain ``"mel"``, ``"pitch"`` and ``"energy"`` per frame
+        and ``"phone_pitch"`` and ``"phone_energy"`` per phone as memory-mapped views.
+        ``kwargs`` are passed to ``feature_config``, ``sampling_rate`` defaults to the one of the packed or resampled audio.
+        """
+        if self.lazy:
+            raise ValueError("features are not supported in lazy mode")
+        sampling_rate = self._sampling_rate(kwargs.pop("sampling_rate", None))
+        config = feature_config(sampling_rate, **kwargs)
+        directory = features_directory(self.target_directory, config)
+        store = FeatureStore.open(directory, config)
+        if store is None:
+            raise ValueError(f"{directory} contains features of a different config, remove it to extract them again")
+        keys = list(self.data.wavs)
+        crcs = [phones_crc(self.phone_arrays(i)[1]) for i in range(len(self))]
+        rows = store.rows(keys, crcs)
+        todo = np.flatnonzero(rows < 0).tolist()
+        if len(todo) > 0:
+            with self.metrics.stage("features") as stage:
+                items = [(keys[i], self._audio_path(i), self.phone_arrays(i)[1]) for i in todo]
+                store = extract_features(items, directory, config, self.n_workers, self.chunk_size)
+                rows = store.rows(keys, crcs)
+                stage.add(files=len(todo))
+        else:
+            print(f"[green]✓[/green] opened features")
+        self.feature_store = store
+        self.feature_rows = rows
+
+    def phone_audio(self, index):
+        """
+        Returns the audio of each phone of item ``index`` as a list of views into the packed audio.
+        """
+        if self.audio_store is None:
+            raise ValueError("audio is not packed, use packed_audio=True or call pack_audio() first")
+        starts, ends, _ = self.phone_arrays(index)
+        return self.audio_store.segments(index, starts, ends)
+
+    def _sampling_rate(self, sampling_rate):
+        if sampling_rate is not None:
+            return sampling_rate
+        if self.audio_store is not None:
+            return self.audio_store.sampling_rate
         if self.target_sampling_rate is not None:
+            return self.target_sampling_rate
+        raise ValueError("sampling_rate has to be given if target_sampling_rate is not set")
+
+    def phone_durations(self, index, hop_length, sampling_rate=None, center=True):
+        """
+        Returns the number of frames of each phone of item ``index`` as an integer array,
+        the durations add up to the number of frames of the audio (see ``alignments.durations``).
+        """
+        sampling_rate = self._sampling_rate(sampling_rate)
+        if self.audio_store is not None:
+            n_samples = len(self.audio_store[index])
+        else:
+            n_samples = audio_samples(self.data[index]["wav"], sampling_rate)
+        if self.lazy:
+            ends = [x[1] for x in self.data[index]["phones"]]
+        else:
+            _, ends, _ = self.phone_arrays(index)
+        return phone_durations(ends, sampling_rate, hop_length, frames_for_samples(n_samples, hop_length, center))
+
+    def collate_fn(self, hop_length, sampling_rate=None, center=True, pad_id=None, vocab=None):
+        """
+        Returns an ``AlignmentCollator`` to be used as ``collate_fn`` of a ``torch.utils.data.DataLoader``,
+        which pads and stacks phone ids, frame durations and frame-to-phone maps of a batch.
+        ``vocab`` is only needed in lazy mode, otherwise ``self.vocab`` is used.
+        """
+        if vocab is None:
+            vocab = self.vocab
+        if vocab is None:
+            raise ValueError("vocab has to be given in lazy mode")
+        return AlignmentCollator(vocab, self._sampling_rate(sampling_rate), hop_length, center, pad_id)
+
+    def _signature(self):
+        if self.lazy:
+            return paths_signature(StringColumn.from_strings(
+                [str(wav.relative_to(self.target_directory)) for wav, _, _ in self.files]
+            ))
+        return self.data.signature()
+
+    def durations(self, source="alignment"):
+        """
+        Returns the duration of each item in seconds, without decoding any audio.
+        With ``source="alignment"`` the end of the last phone is used,
+        with ``source="header"`` the audio file headers are read in parallel (or the lengths of the packed audio are used).
+        Durations read from headers are cached in the target directory.
+        In lazy mode, durations are always read from the headers.
+        """
+        if source not in ["alignment", "header"]:
+            raise ValueError("source must be \"alignment\" or \"header\"")
+        if source == "alignment" and not self.lazy:
+            return self.data.durations()
+        if self.audio_store is not None:
+            return self.audio_store.lengths / self.audio_store.sampling_rate
+        cache_path = Path(self.target_directory) / DURATIONS_NAME
+        signature = self._signature()
+        cache = read_container(cache_path, mmap=False)
+        if cache is not None and cache[0].get("signature") == signature:
+            return cache[1]["durations"]
+        if self.lazy:
+            paths = [wav for wav, _, _ in self.files]
+        else:
+            paths = [Path(self.target_directory) / x for x in self.data.wavs]
+        durations = read_durations(paths, self.n_workers)
+        write_cache(cache_path, {"signature": signature}, {"durations": durations})
+        return durations
+
+    def stats(self):
+        """
+        Returns ``CorpusStats`` (see ``alignments.stats``) with per-phone duration statistics and per-speaker
+        speaking rates. The stats are cached in the target directory until the items change.
+        """
+        if self.lazy:
+            raise ValueError("stats are not available in lazy mode")
+        # the signature hashes all phones, it is only needed when the items were replaced (e.g. by refresh)
+        if getattr(self, "_stats", None) is not None and self._stats[0] is self.data:
+            return self._stats[1]
+        signature = data_signature(self.data)
+        cache_path = Path(self.target_directory) / STATS_NAME
+        stats = None
+        cache = read_container(cache_path, mmap=False)
+        if cache is not None:
+            stats = CorpusStats.from_container(cache[0], cache[1], signature)
+        if stats is None:
+            stats = CorpusStats.compute(self.data)
+            write_cache(cache_path, stats.to_meta(signature), stats.arrays)
+        self._stats = (self.data, stats)
+        return stats
+
+    def search_index(self):
+        """
+        Returns a ``SearchIndex`` (see ``alignments.search``) to find all occurrences of a phone, a sequence
+        of phones or a word, e.g. ``dataset.search_index().phones("K AE T")``. The index is stored in the
+        target directory until the items change.
+        """
+        if self.lazy:
+            raise ValueError("the search index is not available in lazy mode")
+        if getattr(self, "_search_index", None) is None or self._search_index.data is not self.data:
+            self._search_index = SearchIndex.open(self.data, Path(self.target_directory) / SEARCH_NAME)
+        return self._search_index
+
+    def batch_sampler(self, max_seconds=None, max_frames=None, hop_length=None, sampling_rate=None, source="alignment", **kwargs):
+        """
+        Returns a ``DurationBatchSampler`` (see ``alignments.sampler``) grouping items of similar duration,
+        to be passed as ``batch_sampler`` to a ``torch.utils.data.DataLoader``.
+        """
+        if max_frames is not None:
+            sampling_rate = self._sampling_rate(sampling_rate)
+        return DurationBatchSampler(
+            self.durations(source),
+            max_seconds=max_seconds,
+            max_frames=max_frames,
+            sampling_rate=sampling_rate,
+            hop_length=hop_length,
+            **kwargs,
+        )
+
+    def _resample(self):
+        """
+        Resamples all audio files to ``target_sampling_rate`` into a cache directory,
+        items then point to the resampled files. Files which are already resampled are skipped.
+        """
+        if self.target_sampling_rate is None:
+            return
+        self.resampled_directory = resampled_directory(
+            self.resample_directory or self.target_directory, self.target_sampling_rate
+        )
+        if self.lazy:
+            relative_paths = [wav.relative_to(self.target_directory) for wav, _, _ in self.files]
+        else:
+            relative_paths = [Path(x) for x in self.data.wavs]
+        done = scan_directory(self.resampled_directory, self.n_workers)
+        todo = [
+            (Path(self.target_directory) / x, self.resampled_directory / x, self.target_sampling_rate)
+            for x in relative_paths
+            if str((self.resampled_directory / x).with_suffix("")) not in done.entries
+        ]
+        if len(todo) == 0:
+            print(f"[green]✓[/green] all audio already resampled to {self.target_sampling_rate}")
+            return
+        with self.metrics.stage("resample") as stage:
             process_map(
-                self._resample_wav,
-                [x["path"] for x in self.data],
+                resample_file,
+                todo,
                 chunksize=self.chunk_size,
                 max_workers=self.n_workers,
-                desc=f"resampling wavs to {self.target_sampling_rate}",
+                desc=f"resampling audio to {self.target_sampling_rate}",
                 tqdm_class=tqdm,
             )
+            stage.add(files=len(todo))
 
     @abstractmethod
     def collect_data(self, directory):
@@ -366,96 +1018,116 @@ class AlignmentDataset(Dataset):
         """
         raise NotImplementedError()
 
-    def _resample_wav(self, wav_file):
-        # TODO use librosa to load and soundfile to save in place with new sampling rate
-        wav, sampling_rate = librosa.load(wav_file, sr=self.target_sampling_rate)
-        # resample to self.target_sampling_rate
-        wav = librosa.resample(wav, sampling_rate, self.target_sampling_rate, res_type="kaiser_fast")
-        # save to wav_file
-        soundfile.write(wav_file, wav, self.target_sampling_rate)
+    def _create_item(self, file):
+        return create_item((file, self.punctuation_marks, self.archive))
 
+    def _parse_files(self, files, desc):
+        # the worker only gets the paths and parser settings instead of a pickled copy of the dataset
+        return process_map(
+            create_item,
+            [(file, self.punctuation_marks, self.archive) for file in files],
+            chunksize=self.chunk_size,
+            max_workers=self.n_workers,
+            desc=desc,
+            tqdm_class=tqdm,
+        )
 
-    def _create_item(self, file):
-        # TODO: fix quotes and triple dots
-        wav, grid, lab = file
-        text = Path(lab).read_text().lower()
-        words = [
-            x.replace('"', '')[1:] if x.replace('"', '').startswith("'") else x.replace('"', '') 
-            for x in Path(lab).read_text().lower().split()
-        ]
-        last_word = 0
-        for i, word in enumerate(words):
-            has_alnum = any([x.isalnum() for x in word])
-            if not has_alnum:
-                if i > 0:
-                    words[last_word] = words[last_word] + words[i]
-                words[i] = ''
-            else:
-                last_word = i
-        words = [x for x in words if len(x) > 0]
-        file = textgrid.TextGrid.fromFile(grid)
-        marks = [x for x in file[0]]
-        punctuations = []
-        mark_i = 0
-        for word in words:
-            if mark_i >= len(marks):
-                return {
-                    "incorrect": "marks out of range",
-                    "text": text,
-                }
-            current_mark = marks[mark_i]
-            while len(current_mark.mark) == 0:
-                mark_i += 1
-                if mark_i >= len(marks):
-                    return {
-                        "incorrect": "marks out of range",
-                        "text": text,
-                    }
-                current_mark = marks[mark_i]
-            if word.startswith(current_mark.mark):
-                mark_i += 1
-                punctuation = word[len(current_mark.mark):].replace("'", "").replace('"', '').replace('...', '')
-                has_alnum = any([x.isalnum() for x in punctuation])
-                if len(punctuation) >= 1 and not has_alnum and punctuation[0] in self.punctuation_marks:
-                    punctuation = "[" + unicodedata.name(punctuation[0]) + "]"
-                elif len(punctuation) == 0 or punctuation[0] not in self.punctuation_marks:
-                    punctuation = "[SILENCE]"
-                else:
-                    return {
-                        "incorrect": "word starts with punctuation",
-                        "text": text,
-                    }
-                punctuations.append((current_mark.maxTime, punctuation))
-            else:
-                return {
-                    "incorrect": "word does not start with mark",
-                    "text": text,
-                }
-        phones = []
-        phone_grid = file[1]
-        max_time = phone_grid[-1].maxTime
-        filter_grid = [x for x in phone_grid if len(x.mark) > 0]
-        punc_i = 0
-        for i, phone in enumerate(filter_grid):
-            if i == 0:
-                phones.append((0.0, phone.minTime, "[SILENCE]"))
-            phones.append((phone.minTime, phone.maxTime, phone.mark))
-            if punc_i < len(punctuations) and phone.maxTime == punctuations[punc_i][0]:
-                if i < len(filter_grid) - 1:
-                    next_time = filter_grid[i + 1].minTime
-                else:
-                    next_time = max_time
-                phones.append((phone.maxTime, next_time, punctuations[punc_i][1]))
-                punc_i += 1
-        return {
-            "wav": wav,
-            "speaker": Path(wav).parent,
-            "transcript": " ".join(words),
-            "phones": phones
-        }
+    def phone_arrays(self, index):
+        """
+        Returns ``(starts, ends, phone_ids)`` numpy views for the item at ``index``, ids index into ``self.vocab``.
+        """
+        return self.data.phones(index)
+
+    def iterable(self, shuffle=False, buffer_size=10_000, block_size=1_000, seed=0, **kwargs):
+        """
+        Returns an ``IterableAlignmentDataset`` (see ``alignments.iterable``) which streams the items of this dataset,
+        split across DataLoader workers and distributed ranks, with approximate shuffling in a buffer of ``buffer_size`` items.
+        Use it with ``lazy=True`` for corpora whose items don't fit in memory, items are then parsed while iterating.
+        """
+        return IterableAlignmentDataset(self, shuffle, buffer_size, block_size, seed, **kwargs)
+
+    def _stream_item(self, index):
+        # same as __getitem__, but lazy mode doesn't fill the item cache
+        if self.lazy:
+            return self._finish_item(index, self.data.parse(index))
+        return self[index]
 
     def __getitem__(self, index):
-        return self.data[index]
+        # in lazy mode, items skipped due to bad punctuation are returned as None
+        return self._finish_item(index, self.data[index])
+
+    def __getitems__(self, indices):
+        # used by DataLoader for whole batches, their audio is then decoded in parallel
+        if self.prefetch_audio > 0:
+            self._audio_prefetcher().schedule(indices)
+        return [self[index] for index in indices]
+
+    def _finish_item(self, index, item):
+        item = finish_item(index, item, self.target_directory, self.resampled_directory, self.audio_store)
+        if self.prefetch_audio > 0:
+            audio, segment = self._audio_prefetcher().get(index)
+            if item is not None:
+                if segment is not None:
+                    item = crop_item(item, *segment)
+                item = dict(item, audio=audio)
+        if self.feature_store is not None and item is not None:
+            row = self.feature_rows[index]
+            phones = self.feature_store.phones(row)
+            item = dict(
+                item,
+                mel=self.feature_store.mel(row),
+                pitch=self.feature_store.pitch(row),
+                energy=self.feature_store.energy(row),
+                phone_pitch=phones[:, 0],
+                phone_energy=phones[:, 1],
+            )
+        return item
+
+    def _audio_prefetcher(self):
+        # threads don't survive forking, so each DataLoader worker starts its own prefetcher
+        if self.prefetcher is None or self.prefetcher_pid != os.getpid():
+            self.prefetcher = AudioPrefetcher(self._load_audio, len(self), self.prefetch_threads, self.prefetch_audio)
+            self.prefetcher_pid = os.getpid()
+        return self.prefetcher
+
+    def prefetch_stats(self):
+        """
+        Hits, waits and misses of the audio prefetcher of this process (see ``alignments.prefetch``).
+        """
+        if self.prefetcher is None:
+            return None
+        return self.prefetcher.stats()
+
+    def _load_audio(self, index):
+        """
+        Decodes the audio of item ``index``, cropped to a segment if ``crop_seconds`` is set.
+        Crops are random, but the same for an index each time.
+        Returns the audio and the ``(start, end)`` of the segment (None without cropping).
+        """
+        wav = self._audio_path(index)
+        segment = None
+        if self.crop_seconds is not None:
+            starts, ends, _ = self.phone_arrays(index)
+            segment = phone_segment(starts, ends, self.crop_seconds, np.random.default_rng(index))
+        if segment is None:
+            return read_segment(wav)[0], None
+        return read_segment(wav, *segment)[0], segment
+
+    def _audio_path(self, index):
+        # the resampled file, if audio was resampled
+        if self.lazy:
+            wav = self.files[index][0]
+        else:
+            wav = Path(self.target_directory) / self.data.wavs[index]
+        if self.resampled_directory is not None:
+            wav = self.resampled_directory / Path(wav).relative_to(self.target_directory)
+        return wav
+
+    def __getstate__(self):
+        # the prefetcher's threads can't be pickled for worker processes, they start their own
+        state = self.__dict__.copy()
+        state["prefetcher"] = None
+        return state
 
     def __len__(self):
         return len(self.data)
@@ -2,15 +2,14 @@ from glob import glob
 from pathlib import Path
 import re
 import gzip
+import hashlib
 import json
 import shutil
+import os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED, ALL_COMPLETED
 
 from tqdm.auto import tqdm
-from transformers.utils.hub import cached_file
-import tgt
-import torchaudio
-import torch
-import librosa
 
 from alignments.dataset import AlignmentDataset
 
@@ -102,8 +101,117 @@ class LibrittsRDataset(AlignmentDataset):
             }
 
 
+def _manifest_sources(jsonl_path):
+    """
+    Streams the gzipped LibriHeavy manifest and yields ``(source, segments)`` for each run of
+    consecutive lines with the same source recording, so only one source is held in memory at a time.
+    Segments are ``(number, start, duration, speaker, transcript)``, numbered per source starting at 1.
+    """
+    counts = {}
+    current_source = None
+    segments = []
+    with gzip.open(jsonl_path, mode='rt', encoding="utf-8") as gz_file:
+        for line in gz_file:
+            data = json.loads(line)
+            if len(data["supervisions"]) > 1:
+                raise ValueError("multiple supervisions not supported")
+            source = str(Path(jsonl_path).parent / Path(data["recording"]["sources"][0]["source"]))
+            if source != current_source and current_source is not None:
+                yield current_source, segments
+                segments = []
+            current_source = source
+            counts[source] = counts.get(source, 0) + 1
+            segments.append((
+                counts[source],
+                data["start"],
+                data["duration"],
+                data["supervisions"][0]["speaker"],
+                data["supervisions"][0]["custom"]["texts"][0],
+            ))
+    if current_source is not None:
+        yield current_source, segments
+
+
+def _segment_source(args):
+    """
+    Writes one .flac and .lab file per segment of a source recording, only reading the needed frames.
+    A marker file is written once all segments are done, so an interrupted run can resume per source.
+    Returns the number of seconds written and the number of skipped (empty) segments.
+    """
+    import soundfile as sf
+    source, segments, source_directory = args
+    source_name = Path(source).name.replace(".flac", "")
+    # source names are not unique across directories, so the marker also contains a hash of the full path
+    source_hash = hashlib.sha1(source.encode("utf-8")).hexdigest()[:10]
+    marker = Path(source_directory) / ".done" / f"{source_name}_{source_hash}_{segments[0][0]}"
+    if marker.exists():
+        return 0, 0
+    seconds = 0
+    skips = 0
+    with sf.SoundFile(source) as audio_file:
+        sample_rate = audio_file.samplerate
+        for number, start, duration, speaker, transcript in segments:
+            start_frame = min(int(start * sample_rate), audio_file.frames)
+            end_frame = min(int((start + duration) * sample_rate), audio_file.frames)
+            if end_frame <= start_frame:
+                skips += 1
+                continue
+            tgt_path_lab = (Path(source_directory) / speaker / (source_name + f"_{number}")).with_suffix(".lab")
+            tgt_path_flac = tgt_path_lab.with_suffix(".flac")
+            tgt_path_lab.parent.mkdir(parents=True, exist_ok=True)
+            tgt_path_lab.write_text(transcript)
+            if not tgt_path_flac.is_file():
+                audio_file.seek(start_frame)
+                audio = audio_file.read(end_frame - start_frame, dtype="float32", always_2d=True)
+                tmp_path = tgt_path_flac.with_name(f".{tgt_path_flac.name}.tmp")
+                sf.write(tmp_path, audio, sample_rate, format="FLAC")
+                os.replace(tmp_path, tgt_path_flac)
+            seconds += duration
+    marker.parent.mkdir(parents=True, exist_ok=True)
+    marker.touch()
+    return seconds, skips
+
+
+def segment_libriheavy(jsonl_path, source_directory, n_workers=multiprocessing.cpu_count()):
+    """
+    Cuts the LibriHeavy recordings referenced in ``jsonl_path`` into one .flac and .lab file per segment.
+    Sources are processed in parallel while the manifest is streamed, and finished sources are skipped
+    when the function is run again.
+    """
+    # .done is created before any work, so an interrupted run is never mistaken for a complete legacy directory
+    (Path(source_directory) / ".done").mkdir(parents=True, exist_ok=True)
+    seconds = 0
+    skips = 0
+    n_segments = 0
+    prev_int_hours = 0
+    max_pending = 2 * n_workers
+    with ProcessPoolExecutor(n_workers) as executor:
+        pending = set()
+        def collect(return_when):
+            nonlocal pending, seconds, skips, prev_int_hours
+            done, pending = wait(pending, return_when=return_when)
+            for future in done:
+                source_seconds, source_skips = future.result()
+                seconds += source_seconds
+                skips += source_skips
+            new_int_hours = int(seconds / 3600)
+            if new_int_hours != prev_int_hours:
+                prev_int_hours = new_int_hours
+                print(f"added {round(seconds / 3600, 2)} hours of audio")
+        for source, segments in tqdm(_manifest_sources(jsonl_path), desc="segmenting sources"):
+            n_segments += len(segments)
+            pending.add(executor.submit(_segment_source, (source, segments, str(source_directory))))
+            if len(pending) >= max_pending:
+                collect(FIRST_COMPLETED)
+        collect(ALL_COMPLETED)
+    (Path(source_directory) / ".done" / "all").touch()
+    print(f"added {round(seconds / 3600, 2)} hours of audio")
+    if n_segments > 0:
+        print(f"skipped {skips} files, that's {round(skips / n_segments * 100, 2)}%")
+
+
 class LibriHeavyDataset(AlignmentDataset):
-    def __init__(self, jsonl_path, overwrite_source_dir=True, **kwargs):
+    def __init__(self, jsonl_path, overwrite_source_dir=False, **kwargs):
         if "acoustic_model" not in kwargs:
             kwargs["acoustic_model"] = "english_us_arpa"
         if "g2p_model" not in kwargs:
@@ -115,69 +223,15 @@ class LibriHeavyDataset(AlignmentDataset):
             please use the preprocessing at https://github.com/k2-fsa/libriheavy")
         if "textgrid_url" in kwargs:
             raise ValueError("textgrid url not supported for libriheavy (yet)")
+        source_directory = Path(kwargs["source_directory"])
         # prepare source_directory, if it doesn't exist yet
-        if overwrite_source_dir and Path(kwargs["source_directory"]).exists():
-            shutil.rmtree(kwargs["source_directory"])
-        if not Path(kwargs["source_directory"]).exists():
-            Path(kwargs["source_directory"]).mkdir(parents=True)
-            # construct the textgrid files from the jsonl
-            with gzip.open(jsonl_path, mode='rt', encoding="utf-8") as gz_file:
-                i = 0
-                seconds = 0
-                skips = 0
-                source_dict = {}
-                previous_source = None
-                prev_int_hours = 0
-                for line in tqdm(gz_file):
-                    i += 1
-                    data = json.loads(line)
-                    current_source = Path(jsonl_path).parent / Path(data["recording"]["sources"][0]["source"])
-                    if current_source not in source_dict:
-                        source_dict[current_source] = []
-                    source_dict[current_source].append([
-                        len(source_dict[current_source]) + 1,
-                        data["start"],
-                        data["duration"],
-                        data["supervisions"][0]["speaker"],
-                        data["supervisions"][0]["custom"]["texts"][0],
-                    ])
-                    if len(data["supervisions"]) > 1:
-                        raise ValueError("multiple supervisions not supported")
-                    # tgt_path_lab = (Path(kwargs["source_directory"]) / speaker / (Path(current_source).name + f"_{source_dict[current_source][-1][0]}")).with_suffix(".lab")
-                    # tgt_path_flac = tgt_path_lab.with_suffix(".flac")
-                    # transcript = data["supervisions"][0]["custom"]["texts"][0]
-                    # start_time = float(data["start"])
-                    # end_time = float(data["start"]) + float(data["duration"])
-                    # # save transcript to lab file
-                    # tgt_path_lab.parent.mkdir(parents=True, exist_ok=True)
-                    # with open(tgt_path_lab, "w") as f:
-                    #     f.write(transcript)
-                    if current_source != previous_source and previous_source is not None:
-                        # save transcripts to lab files
-                        audio, sample_rate = torchaudio.load(current_source)
-                        for source in source_dict[previous_source]:
-                            new_audio = audio[:, int(source[1] * sample_rate):int((source[1] + source[2]) * sample_rate)]
-                            if new_audio.shape[1] > 0:
-                                tgt_path_lab = (Path(kwargs["source_directory"]) / source[3] / (Path(previous_source).name.replace(".flac", "") + f"_{source[0]}")).with_suffix(".lab")
-                                tgt_path_flac = tgt_path_lab.with_suffix(".flac")
-                                tgt_path_lab.parent.mkdir(parents=True, exist_ok=True)
-                                with open(tgt_path_lab, "w") as f:
-                                    f.write(source[4])
-                                # save audio to flac files
-                                if not tgt_path_flac.is_file():
-                                    torchaudio.save(tgt_path_flac, new_audio, sample_rate)
-                                else:
-                                    print(f"skipped {tgt_path_flac} because it already exists")
-                                seconds += source[2]
-                            else:
-                                skips += 1
-                    new_int_hours = int(seconds / 3600)
-                    if new_int_hours != prev_int_hours:
-                        prev_int_hours = new_int_hours
-                        print(f"added {round(seconds / 3600, 2)} hours of audio")
-                    previous_source = current_source
-            print(f"added {round(seconds / 3600, 2)} hours of audio")
-            print(f"skipped {skips} files, that's {round(skips / i * 100, 2)}%")
+        if overwrite_source_dir and source_directory.exists():
+            shutil.rmtree(source_directory)
+        # source directories created before segmentation was resumable have no .done directory and are complete
+        is_legacy = source_directory.exists() and not (source_directory / ".done").exists()
+        if not is_legacy and not (source_directory / ".done" / "all").exists():
+            # construct the lab and flac files from the jsonl
+            segment_libriheavy(jsonl_path, source_directory, kwargs.get("n_workers", multiprocessing.cpu_count()))
         super().__init__(**kwargs)
 
     def collect_data(self, directory):
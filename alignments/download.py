@@ -0,0 +1,267 @@
+"""
+Downloading and extracting of corpora and TextGrid archives.
+
+.tar.gz archives are extracted while they are downloaded, so the archive never has to be
+stored on disk. Dropped connections are continued with HTTP Range requests where they
+stopped. .zip archives (which can't be extracted from a stream) are downloaded to partial
+files first, optionally over several connections, and interrupted downloads continue from
+the partial files on the next run. Archives can be checked against a sha256 checksum, the
+extracted files only appear in the target directory if the checksum matches.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from urllib import request
+from urllib.error import HTTPError
+from zipfile import ZipFile
+import hashlib
+import http.client
+import os
+import shutil
+import tarfile
+import threading
+import time
+
+from tqdm.auto import tqdm
+
+CHUNK_SIZE = 2**20
+RETRY_DELAY = 1 # seconds, doubled after every failed attempt
+MAX_RETRY_DELAY = 30
+
+
+class RangeReader():
+    """
+    File-like object reading ``url`` from byte ``start`` up to ``end`` (exclusive, None for the end of the file).
+    After a dropped connection, it reconnects with an HTTP Range request and continues where it stopped,
+    at most ``retries`` times in a row. ``on_read`` is called with every chunk of data that was read.
+    """
+    def __init__(self, url, start=0, end=None, retries=5, timeout=60, on_read=None):
+        self.url = url
+        self.position = start
+        self.end = end
+        self.size = end
+        self.retries = retries
+        self.timeout = timeout
+        self.on_read = on_read
+        self.response = None
+
+    def open(self):
+        headers = {}
+        if self.position > 0 or self.end is not None:
+            headers["Range"] = f"bytes={self.position}-" + ("" if self.end is None else str(self.end - 1))
+        response = request.urlopen(request.Request(self.url, headers=headers), timeout=self.timeout)
+        if response.status == 206:
+            content_range = response.headers.get("Content-Range", "")
+            total = content_range.rsplit("/", 1)[-1]
+            if self.size is None and total.isdigit():
+                self.size = int(total)
+        else:
+            length = response.headers.get("Content-Length")
+            if self.size is None and length is not None:
+                self.size = int(length)
+            # the server ignored the range, skip to the current position
+            skip = self.position
+            while skip > 0:
+                chunk = response.read(min(skip, CHUNK_SIZE))
+                if len(chunk) == 0:
+                    raise ConnectionError("connection closed before the end of the file")
+                skip -= len(chunk)
+        self.response = response
+
+    def read(self, n=-1):
+        if n is None or n < 0:
+            return b"".join(iter(lambda: self.read(CHUNK_SIZE), b""))
+        if self.end is not None:
+            n = min(n, self.end - self.position)
+        if n == 0:
+            return b""
+        attempt = 0
+        while True:
+            try:
+                if self.response is None:
+                    self.open()
+                data = self.response.read(n)
+                if len(data) == 0 and self.size is not None and self.position < self.size:
+                    raise ConnectionError("connection closed before the end of the file")
+                break
+            except HTTPError as e:
+                self.close()
+                attempt += 1
+                if e.code < 500 or attempt > self.retries:
+                    raise
+                time.sleep(min(RETRY_DELAY * 2 ** (attempt - 1), MAX_RETRY_DELAY))
+            except (OSError, http.client.HTTPException):
+                self.close()
+                attempt += 1
+                if attempt > self.retries:
+                    raise
+                time.sleep(min(RETRY_DELAY * 2 ** (attempt - 1), MAX_RETRY_DELAY))
+        self.position += len(data)
+        if self.on_read is not None:
+            self.on_read(data)
+        return data
+
+    def close(self):
+        if self.response is not None:
+            self.response.close()
+            self.response = None
+
+
+def remote_size(url, timeout=60):
+    """
+    Returns the size of the file at ``url`` and whether the server supports range requests, using a HEAD request.
+    The size is None if it is unknown.
+    """
+    try:
+        with request.urlopen(request.Request(url, method="HEAD"), timeout=timeout) as response:
+            length = response.headers.get("Content-Length")
+            return (
+                int(length) if length is not None else None,
+                response.headers.get("Accept-Ranges", "").lower() == "bytes",
+            )
+    except (OSError, http.client.HTTPException):
+        return None, False
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _check_sha256(digest, sha256, url):
+    if sha256 is not None and digest != sha256.lower():
+        raise ValueError(f"checksum of {url} does not match, expected {sha256} but got {digest}")
+
+
+def download_file(url, path, sha256=None, n_connections=1, retries=5):
+    """
+    Downloads ``url`` to ``path``, in ``n_connections`` ranges fetched in parallel if the server supports it.
+    Ranges are written to partial files next to ``path``, which are continued if the download is started again.
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    size, accepts_ranges = remote_size(url)
+    if n_connections > 1 and size is not None and accepts_ranges:
+        bounds = [size * i // n_connections for i in range(n_connections + 1)]
+        ranges = [(start, end) for start, end in zip(bounds[:-1], bounds[1:]) if end > start]
+    else:
+        ranges = [(0, None)]
+    # partial files are named after their range, so a different number of connections doesn't mix them up
+    parts = [path.with_name(f".{path.name}.{start}-{end or ''}.part") for start, end in ranges]
+    lock = threading.Lock()
+    with tqdm(total=size, desc=f"downloading {path.name}", unit="B", unit_scale=True) as pbar:
+        def on_read(data):
+            with lock:
+                pbar.update(len(data))
+        def fetch(args):
+            (start, end), part = args
+            offset = part.stat().st_size if part.exists() else 0
+            with lock:
+                pbar.update(offset)
+            reader = RangeReader(url, start + offset, end, retries=retries, on_read=on_read)
+            try:
+                with open(part, "ab") as f:
+                    for chunk in iter(lambda: reader.read(CHUNK_SIZE), b""):
+                        f.write(chunk)
+            finally:
+                reader.close()
+        with ThreadPoolExecutor(len(ranges)) as executor:
+            list(executor.map(fetch, zip(ranges, parts)))
+    if len(parts) == 1:
+        os.replace(parts[0], path)
+    else:
+        with open(path, "wb") as f:
+            for part in parts:
+                with open(part, "rb") as p:
+                    shutil.copyfileobj(p, f, CHUNK_SIZE)
+        for part in parts:
+            part.unlink()
+    if sha256 is not None:
+        try:
+            _check_sha256(file_sha256(path), sha256, url)
+        except ValueError:
+            path.unlink()
+            raise
+    return path
+
+
+def _move_contents(source, target):
+    """
+    Moves everything in ``source`` into ``target``, merging directories which exist in both.
+    """
+    target.mkdir(parents=True, exist_ok=True)
+    for child in source.iterdir():
+        destination = target / child.name
+        if child.is_dir() and not child.is_symlink() and destination.is_dir():
+            _move_contents(child, destination)
+        else:
+            os.replace(child, destination)
+    source.rmdir()
+
+
+def stream_extract(url, directory, sha256=None, retries=5):
+    """
+    Extracts the tar archive at ``url`` (compressed or not) to ``directory`` while it is being downloaded.
+    The files are extracted next to ``directory`` first and only moved there once the checksum was checked.
+    Returns the number of downloaded bytes.
+    """
+    directory = Path(directory)
+    staging = directory.parent / f".{directory.name}.download"
+    shutil.rmtree(staging, ignore_errors=True)
+    staging.mkdir(parents=True)
+    digest = hashlib.sha256()
+    n_bytes = 0
+    reader = RangeReader(url, retries=retries)
+    try:
+        reader.open()
+        with tqdm(total=reader.size, desc=f"downloading and extracting {Path(url).name}", unit="B", unit_scale=True) as pbar:
+            def on_read(data):
+                nonlocal n_bytes
+                n_bytes += len(data)
+                digest.update(data)
+                pbar.update(len(data))
+            reader.on_read = on_read
+            with tarfile.open(fileobj=reader, mode="r|*") as archive:
+                archive.extractall(staging)
+            # tarfile stops at the end-of-archive marker, the padding after it is part of the checksum too
+            for _ in iter(lambda: reader.read(CHUNK_SIZE), b""):
+                pass
+        _check_sha256(digest.hexdigest(), sha256, url)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    finally:
+        reader.close()
+    _move_contents(staging, directory)
+    return n_bytes
+
+
+def download_and_extract(url, directory, download_directory, sha256=None, n_connections=1, retries=5):
+    """
+    Downloads the .zip or .tar.gz archive at ``url`` and extracts it to ``directory``.
+    .tar.gz archives are extracted while downloading, unless ``n_connections`` > 1, in which case
+    they are downloaded in parallel ranges to ``download_directory`` first, like .zip archives.
+    Returns the size of the archive in bytes.
+    """
+    if url.endswith(".zip"):
+        suffix = ".zip"
+    elif url.endswith(".tar.gz"):
+        suffix = ".tar.gz"
+    else:
+        raise ValueError("Unknown file type, only .zip and .tar.gz are supported.")
+    if suffix == ".tar.gz" and n_connections <= 1:
+        return stream_extract(url, directory, sha256, retries)
+    # named after the url, so partial downloads of different urls are never mixed up
+    path = Path(download_directory) / (hashlib.sha1(url.encode("utf-8")).hexdigest()[:10] + suffix)
+    download_file(url, path, sha256, n_connections, retries)
+    if suffix == ".zip":
+        with ZipFile(path) as archive:
+            archive.extractall(directory)
+    else:
+        with tarfile.open(path) as archive:
+            archive.extractall(directory)
+    size = path.stat().st_size
+    path.unlink()
+    return size
@@ -0,0 +1,160 @@
+"""
+Conversion of phone timestamps to integer frame durations, and batching.
+
+Phone boundaries are rounded to the nearest frame once, and durations are the
+differences between consecutive boundaries. The durations therefore always add up to
+the number of frames of the audio, instead of accumulating rounding errors phone by phone.
+"""
+import numpy as np
+
+from alignments.textgrids import ROUND_DIGITS
+
+
+def frames_for_samples(n_samples, hop_length, center=True):
+    """
+    Number of frames of a spectrogram of ``n_samples`` samples, ``center`` as in ``torch.stft`` and ``librosa.stft``.
+    """
+    n_samples = np.asarray(n_samples, dtype=np.int64)
+    if center:
+        return n_samples // hop_length + 1
+    return n_samples // hop_length
+
+
+def audio_samples(path, sampling_rate=None):
+    """
+    Number of samples of the audio file at ``path`` (at ``sampling_rate``, if given) read from its header only.
+    """
+    import soundfile as sf
+    info = sf.info(str(path))
+    if sampling_rate is None or sampling_rate == info.samplerate:
+        return info.frames
+    return int(np.ceil(info.frames * sampling_rate / info.samplerate))
+
+
+def read_durations(paths, n_workers=16):
+    """
+    Durations in seconds of the audio files at ``paths``, read from their headers in parallel.
+    """
+    import soundfile as sf
+    from concurrent.futures import ThreadPoolExecutor
+    def duration(path):
+        info = sf.info(str(path))
+        return info.frames / info.samplerate
+    with ThreadPoolExecutor(max(1, n_workers)) as executor:
+        return np.array(list(executor.map(duration, paths)), dtype=np.float64)
+
+
+def phone_durations(ends, sampling_rate, hop_length, n_frames=None):
+    """
+    Returns the number of frames of each phone, given the phone end times in seconds.
+    Phones are assumed to be contiguous and to start at 0, like the phones of ``AlignmentDataset``.
+    If ``n_frames`` is given, the last phone is stretched or cut so the durations add up to ``n_frames``.
+    """
+    durations, _ = batch_phone_durations(
+        [ends], sampling_rate, hop_length, None if n_frames is None else [n_frames]
+    )
+    return durations
+
+
+def batch_phone_durations(ends, sampling_rate, hop_length, n_frames=None):
+    """
+    Vectorized version of ``phone_durations`` for a list of phone end time arrays.
+    Returns the concatenated durations of all items and the number of phones per item.
+    """
+    lengths = np.array([len(x) for x in ends], dtype=np.int64)
+    if len(ends) == 0 or lengths.sum() == 0:
+        return np.zeros(0, dtype=np.int64), lengths
+    flat_ends = np.concatenate([np.asarray(x, dtype=np.float64) for x in ends])
+    # undo float32 storage error first, otherwise boundaries exactly between two frames could round differently
+    flat_ends = np.round(flat_ends, ROUND_DIGITS)
+    boundaries = np.round(flat_ends * sampling_rate / hop_length).astype(np.int64)
+    item_ids = np.repeat(np.arange(len(ends)), lengths)
+    last = np.cumsum(lengths) - 1
+    if n_frames is not None:
+        n_frames = np.asarray(n_frames, dtype=np.int64)
+        boundaries = np.minimum(boundaries, n_frames[item_ids])
+        nonempty = lengths > 0
+        boundaries[last[nonempty]] = n_frames[nonempty]
+    previous = np.empty_like(boundaries)
+    previous[1:] = boundaries[:-1]
+    first = last - lengths + 1
+    previous[first[lengths > 0]] = 0
+    durations = np.maximum(boundaries - previous, 0)
+    return durations, lengths
+
+
+def _pad(flat, lengths, padding_value, dtype):
+    padded = np.full((len(lengths), max(int(lengths.max(initial=0)), 1)), padding_value, dtype=dtype)
+    mask = np.arange(padded.shape[1])[None, :] < lengths[:, None]
+    padded[mask] = flat
+    return padded, mask
+
+
+class AlignmentCollator():
+    """
+    ``collate_fn`` for ``torch.utils.data.DataLoader`` which pads and stacks a batch of items.
+
+    The returned dict contains (as torch tensors):
+    - "phone_ids": (batch, max_phones), padded with ``pad_id`` (``len(vocab)`` by default)
+    - "durations": (batch, max_phones), the number of frames of each phone, padded with 0
+    - "phone_mask": (batch, max_phones), True for real phones
+    - "phone_lengths": (batch,)
+    - "frame_phones": (batch, max_frames), the index of the phone of each frame, padded with -1
+    - "frame_lengths": (batch,)
+    - "audio" and "audio_lengths", if the items contain packed audio
+    as well as the lists "wav", "speaker" and "transcript".
+    """
+    def __init__(self, vocab, sampling_rate, hop_length, center=True, pad_id=None):
+        self.vocab = vocab
+        self.token_to_id = {token: i for i, token in enumerate(vocab)}
+        self.sampling_rate = sampling_rate
+        self.hop_length = hop_length
+        self.center = center
+        self.pad_id = len(vocab) if pad_id is None else pad_id
+
+    def _phones(self, item):
+        if "phone_ids" in item:
+            return np.asarray(item["phone_ids"], dtype=np.int64), np.asarray(item["phone_ends"])
+        return (
+            np.array([self.token_to_id[x[2]] for x in item["phones"]], dtype=np.int64),
+            np.array([x[1] for x in item["phones"]], dtype=np.float64),
+        )
+
+    def _samples(self, item):
+        if "audio" in item:
+            return len(item["audio"])
+        return audio_samples(item["wav"], self.sampling_rate)
+
+    def __call__(self, items):
+        import torch
+        phone_ids, ends = zip(*[self._phones(item) for item in items])
+        n_samples = np.array([self._samples(item) for item in items], dtype=np.int64)
+        n_frames = frames_for_samples(n_samples, self.hop_length, self.center)
+        durations, phone_lengths = batch_phone_durations(ends, self.sampling_rate, self.hop_length, n_frames)
+        flat_ids = np.concatenate(phone_ids) if len(durations) > 0 else np.zeros(0, dtype=np.int64)
+        padded_ids, phone_mask = _pad(flat_ids, phone_lengths, self.pad_id, np.int64)
+        padded_durations, _ = _pad(durations, phone_lengths, 0, np.int64)
+        # index of each phone within its item, repeated for each of its frames
+        local_ids = np.arange(len(durations)) - np.repeat(np.cumsum(phone_lengths) - phone_lengths, phone_lengths)
+        frame_phones, _ = _pad(np.repeat(local_ids, durations), n_frames, -1, np.int64)
+        batch = {
+            "phone_ids": torch.from_numpy(padded_ids),
+            "durations": torch.from_numpy(padded_durations),
+            "phone_mask": torch.from_numpy(phone_mask),
+            "phone_lengths": torch.from_numpy(phone_lengths),
+            "frame_phones": torch.from_numpy(frame_phones),
+            "frame_lengths": torch.from_numpy(n_frames),
+            "wav": [item["wav"] for item in items],
+            "speaker": [item["speaker"] for item in items],
+            "transcript": [item["transcript"] for item in items],
+        }
+        if all("audio" in item for item in items):
+            audio = np.zeros((len(items), max(int(n_samples.max()), 1)), dtype=np.float32)
+            for i, item in enumerate(items):
+                x = np.asarray(item["audio"])
+                if x.dtype == np.int16:
+                    x = x / np.iinfo(np.int16).max
+                audio[i, :len(x)] = x
+            batch["audio"] = torch.from_numpy(audio)
+            batch["audio_lengths"] = torch.from_numpy(n_samples)
+        return batch
@@ -0,0 +1,284 @@
+"""
+Cache of acoustic features: log mel spectrograms, pitch and energy per frame, and pitch
+and energy averaged per phone.
+
+Features are stored in a directory per feature config (named after a hash of the
+config) in the target directory. Frame features of each utterance are appended to raw
+shard files as rows of ``n_mels`` mel bins plus pitch and energy, phone features as rows
+of pitch and energy. An offset index (see ``alignments.container``) maps utterances to
+their rows. It is rewritten every ``flush_every`` utterances, so an interrupted extraction
+continues where it stopped, and utterances whose phones changed are appended again.
+Reading features is a slice of a memory-mapped shard.
+"""
+from multiprocessing import Pool
+from pathlib import Path
+import hashlib
+import json
+import zlib
+
+import numpy as np
+from tqdm.auto import tqdm
+
+from alignments.audio_store import load_audio
+from alignments.container import StringColumn, read_container, write_container
+from alignments.durations import phone_durations
+
+FEATURES_NAME = ".alignments_features"
+FEATURES_VERSION = 1
+DTYPES = ["float32", "float16"]
+
+
+def feature_config(
+    sampling_rate,
+    n_fft=1024,
+    hop_length=256,
+    n_mels=80,
+    win_length=None, # defaults to n_fft
+    fmin=0,
+    fmax=None, # defaults to sampling_rate / 2
+    pitch_fmin=65,
+    pitch_fmax=600,
+    dtype="float32", # of the frame features, "float16" halves their size
+):
+    """
+    Returns the dict of feature settings, every setting is part of the config hash.
+    """
+    if dtype not in DTYPES:
+        raise ValueError(f"dtype must be one of {DTYPES}")
+    return {
+        "version": FEATURES_VERSION,
+        "sampling_rate": sampling_rate,
+        "n_fft": n_fft,
+        "hop_length": hop_length,
+        "n_mels": n_mels,
+        "win_length": win_length or n_fft,
+        "fmin": fmin,
+        "fmax": fmax or sampling_rate / 2,
+        "pitch_fmin": pitch_fmin,
+        "pitch_fmax": pitch_fmax,
+        "dtype": dtype,
+    }
+
+
+def config_hash(config):
+    return hashlib.sha1(json.dumps(config, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+
+def features_directory(target_directory, config):
+    return Path(target_directory) / FEATURES_NAME / config_hash(config)
+
+
+def phones_crc(ends):
+    """
+    Checksum of the phone end times of an utterance, phone features are extracted again when it changes.
+    """
+    return zlib.crc32(np.ascontiguousarray(ends, dtype=np.float32).tobytes())
+
+
+def compute_features(audio, ends, config):
+    """
+    Returns the frame features of ``audio`` (log mel bins, then pitch in Hz estimated with ``librosa.yin``
+    and energy, the norm of each STFT frame) and the mean pitch and energy of each phone, given the phone end times.
+    """
+    import librosa
+    sampling_rate, hop_length = config["sampling_rate"], config["hop_length"]
+    magnitudes = np.abs(librosa.stft(
+        audio, n_fft=config["n_fft"], hop_length=hop_length, win_length=config["win_length"], center=True
+    ))
+    mel = librosa.feature.melspectrogram(
+        S=magnitudes ** 2, sr=sampling_rate, n_fft=config["n_fft"], n_mels=config["n_mels"], fmin=config["fmin"], fmax=config["fmax"]
+    )
+    energy = np.linalg.norm(magnitudes, axis=0)
+    pitch = librosa.yin(
+        audio, fmin=config["pitch_fmin"], fmax=config["pitch_fmax"], sr=sampling_rate,
+        frame_length=config["n_fft"], hop_length=hop_length, center=True,
+    )
+    n_frames = min(mel.shape[1], len(pitch))
+    frames = np.concatenate([
+        np.log(np.maximum(mel[:, :n_frames], 1e-5)).T,
+        pitch[:n_frames, None],
+        energy[:n_frames, None],
+    ], axis=1)
+    # phones are assigned whole frames, the same way as in AlignmentCollator
+    durations = phone_durations(ends, sampling_rate, hop_length, n_frames)
+    phone_of_frame = np.repeat(np.arange(len(durations)), durations)
+    phones = np.zeros((len(durations), 2), dtype=np.float32)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        for j, column in enumerate([pitch[:n_frames], energy[:n_frames]]):
+            phones[:, j] = np.nan_to_num(np.bincount(phone_of_frame, weights=column, minlength=len(durations)) / durations)
+    return frames.astype(config["dtype"]), phones
+
+
+def _extract(args):
+    path, ends, config = args
+    audio, _ = load_audio(path, config["sampling_rate"])
+    return compute_features(audio, ends, config)
+
+
+class FeatureStore():
+    """
+    Memory-mapped features of one config in ``directory``, ``store.frames(row)`` returns the frame features
+    of a row without copying. Use ``rows`` to find the rows of utterances.
+    """
+    def __init__(self, directory, config, arrays):
+        self.directory = Path(directory)
+        self.config = config
+        self.n_mels = config["n_mels"]
+        self.keys = StringColumn.from_arrays(arrays, "keys")
+        self.arrays = arrays
+        self._maps = {}
+
+    def __getstate__(self):
+        # shards are mapped again after unpickling instead of copying them
+        state = self.__dict__.copy()
+        state["_maps"] = {}
+        return state
+
+    @classmethod
+    def open(cls, directory, config):
+        """
+        Returns the store in ``directory``, an empty one if it doesn't exist yet, or None if it was written with a different config.
+        """
+        container = read_container(Path(directory) / "index")
+        if container is None:
+            return cls(directory, config, cls._empty_arrays())
+        meta, arrays = container
+        if meta.get("config") != config:
+            return None
+        return cls(directory, config, arrays)
+
+    @staticmethod
+    def _empty_arrays():
+        arrays = {
+            "crcs": np.zeros(0, dtype=np.uint32),
+            "shards": np.zeros(0, dtype=np.int32),
+            "frame_offsets": np.zeros(0, dtype=np.int64),
+            "frame_lengths": np.zeros(0, dtype=np.int64),
+            "phone_offsets": np.zeros(0, dtype=np.int64),
+            "phone_lengths": np.zeros(0, dtype=np.int64),
+        }
+        arrays.update(StringColumn.from_strings([]).to_arrays("keys"))
+        return arrays
+
+    def __len__(self):
+        return len(self.keys)
+
+    def rows(self, keys, crcs):
+        """
+        The row of each utterance with the given keys and phone checksums, -1 for utterances without features.
+        If an utterance was appended more than once, its last row is used.
+        """
+        lookup = {}
+        for row, (key, crc) in enumerate(zip(self.keys, self.arrays["crcs"].tolist())):
+            lookup[key] = (row, crc)
+        rows = np.full(len(keys), -1, dtype=np.int64)
+        for i, (key, crc) in enumerate(zip(keys, crcs)):
+            row = lookup.get(key)
+            if row is not None and row[1] == crc:
+                rows[i] = row[0]
+        return rows
+
+    def _map(self, kind, shard):
+        if (kind, shard) not in self._maps:
+            path = self.directory / f"{kind}_{shard:05d}.bin"
+            if kind == "frames":
+                dtype, width = np.dtype(self.config["dtype"]), self.n_mels + 2
+            else:
+                dtype, width = np.dtype(np.float32), 2
+            # complete rows only, an interrupted append can leave a partial row at the end
+            n_rows = path.stat().st_size // (dtype.itemsize * width)
+            if n_rows == 0:
+                self._maps[(kind, shard)] = np.zeros((0, width), dtype=dtype)
+            else:
+                self._maps[(kind, shard)] = np.memmap(path, dtype=dtype, mode="r", shape=(n_rows, width))
+        return self._maps[(kind, shard)]
+
+    def frames(self, row):
+        """
+        Frame features of a row, shape (n_frames, n_mels + 2): the log mel bins, then pitch and energy.
+        """
+        a = self.arrays
+        offset = a["frame_offsets"][row]
+        return self._map("frames", a["shards"][row])[offset:offset + a["frame_lengths"][row]]
+
+    def mel(self, row):
+        return self.frames(row)[:, :self.n_mels]
+
+    def pitch(self, row):
+        return self.frames(row)[:, self.n_mels]
+
+    def energy(self, row):
+        return self.frames(row)[:, self.n_mels + 1]
+
+    def phones(self, row):
+        """
+        Mean pitch and energy of each phone of a row, shape (n_phones, 2).
+        """
+        a = self.arrays
+        offset = a["phone_offsets"][row]
+        return self._map("phones", a["shards"][row])[offset:offset + a["phone_lengths"][row]]
+
+
+def extract_features(items, directory, config, n_workers=1, chunk_size=100, shard_size=2**31, flush_every=1000):
+    """
+    Extracts the features of ``items`` (``(key, path, phone_ends)`` tuples) in parallel and appends them to the store
+    in ``directory``, writing its index every ``flush_every`` utterances. Returns the store.
+    """
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    (directory / "config.json").write_text(json.dumps(config, indent=2))
+    store = FeatureStore.open(directory, config)
+    if store is None:
+        raise ValueError(f"{directory} contains features of a different config")
+    a = store.arrays
+    keys = list(store.keys)
+    columns = {name: a[name].tolist() for name in ["crcs", "shards", "frame_offsets", "frame_lengths", "phone_offsets", "phone_lengths"]}
+    frame_width = np.dtype(config["dtype"]).itemsize * (config["n_mels"] + 2)
+    shard = max(columns["shards"], default=0)
+
+    def write_index():
+        arrays = {name: np.array(values, dtype=a[name].dtype) for name, values in columns.items()}
+        arrays.update(StringColumn.from_strings(keys).to_arrays("keys"))
+        write_container(directory / "index", {"config": config}, arrays)
+
+    def open_shard(shard):
+        files = {}
+        for kind, width in [("frames", frame_width), ("phones", 8)]:
+            path = directory / f"{kind}_{shard:05d}.bin"
+            path.touch()
+            files[kind] = open(path, "r+b")
+            # rows written after the last index update are not referenced by the index, they are overwritten
+            lengths, offsets = columns[f"{kind[:-1]}_lengths"], columns[f"{kind[:-1]}_offsets"]
+            end = max([o + l for s, o, l in zip(columns["shards"], offsets, lengths) if s == shard], default=0)
+            files[kind].truncate(end * width)
+            files[kind].seek(end * width)
+        return files
+
+    files = open_shard(shard)
+    with Pool(max(1, n_workers)) as pool:
+        args = [(str(path), np.asarray(ends, dtype=np.float64), config) for _, path, ends in items]
+        results = pool.imap(_extract, args, chunksize=chunk_size)
+        for i, (frames, phones) in enumerate(tqdm(results, total=len(items), desc="extracting features")):
+            key, _, ends = items[i]
+            if files["frames"].tell() > 0 and files["frames"].tell() + frames.nbytes > shard_size:
+                for f in files.values():
+                    f.close()
+                shard += 1
+                files = open_shard(shard)
+            keys.append(key)
+            columns["crcs"].append(phones_crc(ends))
+            columns["shards"].append(shard)
+            columns["frame_offsets"].append(files["frames"].tell() // frame_width)
+            columns["frame_lengths"].append(len(frames))
+            columns["phone_offsets"].append(files["phones"].tell() // 8)
+            columns["phone_lengths"].append(len(phones))
+            files["frames"].write(frames.tobytes())
+            files["phones"].write(phones.tobytes())
+            if (i + 1) % flush_every == 0:
+                for f in files.values():
+                    f.flush()
+                write_index()
+    for f in files.values():
+        f.close()
+    write_index()
+    return FeatureStore.open(directory, config)
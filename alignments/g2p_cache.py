@@ -0,0 +1,73 @@
+"""
+Persistent store of pronunciations generated by G2P models.
+
+Pronunciations are stored in an SQLite database keyed by G2P model and word, which is
+shared between all datasets (by default in ``~/.cache/alignments``), so a word is only
+ever passed to ``mfa g2p`` once per model.
+"""
+from pathlib import Path
+import os
+import sqlite3
+
+G2P_CACHE_NAME = "g2p.sqlite"
+# number of parameters per query, sqlite limits them to 999 on older versions
+QUERY_SIZE = 900
+
+
+def default_cache_path():
+    """
+    ``$ALIGNMENTS_CACHE/g2p.sqlite``, or ``~/.cache/alignments/g2p.sqlite`` if the variable is not set.
+    """
+    directory = os.environ.get("ALIGNMENTS_CACHE", Path.home() / ".cache" / "alignments")
+    return Path(directory) / G2P_CACHE_NAME
+
+
+class G2PCache():
+    """
+    Pronunciations of words by G2P model, stored at ``path`` (``default_cache_path()`` if None).
+    Several processes can use the same cache at the same time.
+    """
+    def __init__(self, path=None):
+        self.path = Path(path) if path is not None else default_cache_path()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.connection = sqlite3.connect(self.path, timeout=60)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS pronunciations ("
+            "model TEXT NOT NULL, word TEXT NOT NULL, pronunciation TEXT NOT NULL, "
+            "PRIMARY KEY (model, word, pronunciation))"
+        )
+        self.connection.commit()
+
+    def lookup(self, model, words):
+        """
+        Returns a dict of word -> list of pronunciations for all ``words`` with cached pronunciations.
+        """
+        words = list(words)
+        found = {}
+        for i in range(0, len(words), QUERY_SIZE):
+            chunk = words[i:i + QUERY_SIZE]
+            rows = self.connection.execute(
+                f"SELECT word, pronunciation FROM pronunciations WHERE model = ? AND word IN ({','.join('?' * len(chunk))}) "
+                "ORDER BY rowid",
+                [model] + chunk,
+            )
+            for word, pronunciation in rows:
+                found.setdefault(word, []).append(pronunciation)
+        return found
+
+    def add(self, model, entries):
+        """
+        Stores the ``(word, pronunciation)`` ``entries`` generated by ``model``.
+        """
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR IGNORE INTO pronunciations (model, word, pronunciation) VALUES (?, ?, ?)",
+                [(model, word, pronunciation) for word, pronunciation in entries],
+            )
+
+    def __len__(self):
+        return self.connection.execute("SELECT COUNT(*) FROM pronunciations").fetchone()[0]
+
+    def close(self):
+        self.connection.close()
@@ -0,0 +1,72 @@
+"""
+Persistent index of parsed alignments, written next to the aligned corpus.
+
+After the first ``_load_files`` the parsed items are stored in a single binary
+container (see ``alignments.container``). Later constructions memory-map that file
+instead of globbing and re-parsing every TextGrid and ``.lab`` file.
+"""
+from pathlib import Path
+
+from alignments.container import write_cache, read_container
+from alignments.columnar import ColumnarData
+from alignments.manifest import Manifest
+
+INDEX_NAME = ".alignments.index"
+INDEX_VERSION = 4
+# bump whenever the output of AlignmentDataset._create_item changes, this invalidates existing indices
+PARSER_VERSION = 2
+
+
+def index_path(target_directory):
+    return Path(target_directory) / INDEX_NAME
+
+
+def write_index(path, data, manifest, punctuation_marks, parser_version):
+    """
+    Writes ``data`` (a ``ColumnarData``) and the ``Manifest`` of the files it was parsed from to ``path``.
+    Returns False (after a warning) if ``path`` isn't writable.
+    """
+    meta = {
+        "index_version": INDEX_VERSION,
+        "parser_version": parser_version,
+        "punctuation_marks": punctuation_marks,
+        "vocab": data.vocab,
+    }
+    arrays = data.to_arrays()
+    arrays.update(manifest.to_arrays())
+    return write_cache(path, meta, arrays)
+
+
+def _read_index(path, punctuation_marks, parser_version):
+    container = read_container(path)
+    if container is None:
+        return None
+    meta, arrays = container
+    if (
+        meta.get("index_version") != INDEX_VERSION
+        or meta.get("parser_version") != parser_version
+        or meta.get("punctuation_marks") != punctuation_marks
+    ):
+        return None
+    return meta, arrays
+
+
+def load_index(path, target_directory, punctuation_marks, parser_version, phones_format="tuples"):
+    """
+    Returns a memory-mapped ``ColumnarData`` for the index at ``path``, or ``None`` if it is missing or stale.
+    """
+    index = _read_index(path, punctuation_marks, parser_version)
+    if index is None:
+        return None
+    meta, arrays = index
+    return ColumnarData.from_arrays(target_directory, arrays, meta["vocab"], phones_format)
+
+
+def load_manifest(path, punctuation_marks, parser_version):
+    """
+    Returns the ``Manifest`` stored in the index at ``path``, or ``None`` if it is missing or stale.
+    """
+    index = _read_index(path, punctuation_marks, parser_version)
+    if index is None:
+        return None
+    return Manifest.from_arrays(index[1])
@@ -0,0 +1,139 @@
+"""
+Single-pass inventory of the files in a target directory.
+
+The directory tree is walked once with ``os.scandir``, with one thread per top-level
+(speaker) directory, and audio files are paired with their ``.TextGrid`` and ``.lab``
+files by stem in memory. All later existence checks use the inventory instead of
+globbing the tree again.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import os
+
+AUDIO_SUFFIXES = [".wav", ".flac"]
+SUFFIXES = AUDIO_SUFFIXES + [".TextGrid", ".lab"]
+
+
+def _walk(directory):
+    """
+    Returns ``(stem_path, suffix, (mtime_ns, size))`` for all relevant files below ``directory``.
+    """
+    found = []
+    stack = [directory]
+    while len(stack) > 0:
+        try:
+            entries = os.scandir(stack.pop())
+        except (FileNotFoundError, NotADirectoryError):
+            continue
+        with entries:
+            for entry in entries:
+                if entry.name.startswith("."):
+                    continue
+                if entry.is_dir():
+                    stack.append(entry.path)
+                    continue
+                stem, suffix = os.path.splitext(entry.path)
+                if suffix in SUFFIXES:
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        # broken symlink
+                        continue
+                    found.append((stem, suffix, (stat.st_mtime_ns, stat.st_size)))
+    return found
+
+
+def scan_directory(directory, n_workers=16):
+    """
+    Walks ``directory`` once and returns an ``Inventory`` of its audio, TextGrid and lab files.
+    """
+    directory = str(directory)
+    entries = {}
+    if not os.path.isdir(directory):
+        return Inventory(directory, entries)
+    subdirectories = []
+    top_level = []
+    with os.scandir(directory) as it:
+        for entry in it:
+            if entry.name.startswith("."):
+                continue
+            if entry.is_dir():
+                subdirectories.append(entry.path)
+            else:
+                top_level.append(entry)
+    found = []
+    for entry in top_level:
+        stem, suffix = os.path.splitext(entry.path)
+        if suffix in SUFFIXES and os.path.exists(entry.path):
+            stat = entry.stat()
+            found.append((stem, suffix, (stat.st_mtime_ns, stat.st_size)))
+    with ThreadPoolExecutor(max(1, n_workers)) as executor:
+        for result in executor.map(_walk, subdirectories):
+            found += result
+    for stem, suffix, stat in found:
+        entries.setdefault(stem, {})[suffix] = stat
+    return Inventory(directory, entries)
+
+
+class Inventory():
+    """
+    Files of a directory grouped by stem, ``entries`` maps the path without suffix to
+    a dict of suffix -> (mtime_ns, size).
+    """
+    def __init__(self, directory, entries):
+        self.directory = directory
+        self.entries = entries
+
+    def count(self, suffix):
+        return sum(suffix in x for x in self.entries.values())
+
+    def paths(self, suffix):
+        return [Path(stem + suffix) for stem, x in sorted(self.entries.items()) if suffix in x]
+
+    def _audio(self):
+        for stem, suffixes in sorted(self.entries.items()):
+            for suffix in AUDIO_SUFFIXES:
+                if suffix in suffixes:
+                    yield stem, suffix, suffixes
+
+    @property
+    def files(self):
+        """
+        (audio, TextGrid, lab) triples of all audio files that have both a TextGrid and a lab file.
+        """
+        return [
+            [Path(stem + suffix), Path(stem + ".TextGrid"), Path(stem + ".lab")]
+            for stem, suffix, suffixes in self._audio()
+            if ".TextGrid" in suffixes and ".lab" in suffixes
+        ]
+
+    @property
+    def missing(self):
+        """
+        Number of audio files without a TextGrid or lab file.
+        """
+        return sum(
+            ".TextGrid" not in suffixes or ".lab" not in suffixes
+            for _, _, suffixes in self._audio()
+        )
+
+    @property
+    def unaligned(self):
+        """
+        Audio files which have a lab file but no TextGrid.
+        """
+        return [
+            Path(stem + suffix)
+            for stem, suffix, suffixes in self._audio()
+            if ".lab" in suffixes and ".TextGrid" not in suffixes
+        ]
+
+    def stats(self, file):
+        """
+        Same as ``alignments.manifest.file_stats``, but without any system calls.
+        """
+        stats = []
+        for path in file:
+            stem, suffix = os.path.splitext(str(path))
+            stats += list(self.entries[stem][suffix])
+        return tuple(stats)
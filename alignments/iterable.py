@@ -0,0 +1,93 @@
+"""
+Streaming access to an ``AlignmentDataset`` as a ``torch.utils.data.IterableDataset``.
+
+Indices are split into blocks of neighbouring items, and the blocks are distributed
+round-robin over all distributed ranks and DataLoader workers, so no item is read twice.
+Items are only parsed (in lazy mode) or read from the index when they are reached, and
+shuffling uses a shuffled block order plus a bounded shuffle buffer, so memory does not
+grow with the size of the corpus.
+"""
+import numpy as np
+from torch.utils.data import IterableDataset, get_worker_info
+
+
+class IterableAlignmentDataset(IterableDataset):
+    """
+    Iterates over the items of ``dataset`` (see ``AlignmentDataset.iterable``), skipping items which are None.
+
+    ``block_size`` neighbouring items are always read by the same worker. With ``shuffle``, the order
+    of the blocks is shuffled, and items are drawn at random from a buffer of ``buffer_size`` items.
+    ``num_replicas`` and ``rank`` default to the values of ``torch.distributed`` if it is initialized,
+    ranks can receive up to one block more than others.
+    Call ``set_epoch`` at the start of each epoch to get a different shuffle.
+    """
+    def __init__(
+        self,
+        dataset,
+        shuffle=False,
+        buffer_size=10_000,
+        block_size=1_000,
+        seed=0,
+        num_replicas=None,
+        rank=None,
+    ):
+        super().__init__()
+        if num_replicas is None or rank is None:
+            import torch.distributed as dist
+            initialized = dist.is_available() and dist.is_initialized()
+            if num_replicas is None:
+                num_replicas = dist.get_world_size() if initialized else 1
+            if rank is None:
+                rank = dist.get_rank() if initialized else 0
+        if rank >= num_replicas or rank < 0:
+            raise ValueError(f"invalid rank {rank}, rank should be in the interval [0, {num_replicas - 1}]")
+        self.dataset = dataset
+        self.shuffle = shuffle
+        self.buffer_size = buffer_size
+        self.block_size = block_size
+        self.seed = seed
+        self.num_replicas = num_replicas
+        self.rank = rank
+        self.epoch = 0
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    def _blocks(self):
+        """
+        Start indices of the blocks of the current rank and worker.
+        """
+        worker_info = get_worker_info()
+        num_workers = 1 if worker_info is None else worker_info.num_workers
+        worker_id = 0 if worker_info is None else worker_info.id
+        blocks = np.arange(0, len(self.dataset), self.block_size)
+        if self.shuffle:
+            # the same permutation on all ranks and workers
+            blocks = np.random.default_rng(self.seed + self.epoch).permutation(blocks)
+        return blocks[self.rank * num_workers + worker_id::self.num_replicas * num_workers]
+
+    def _items(self, blocks):
+        for start in blocks.tolist():
+            for index in range(start, min(start + self.block_size, len(self.dataset))):
+                item = self.dataset._stream_item(index)
+                if item is not None:
+                    yield item
+
+    def __iter__(self):
+        blocks = self._blocks()
+        if not self.shuffle or self.buffer_size <= 1:
+            yield from self._items(blocks)
+            return
+        worker_info = get_worker_info()
+        worker_id = 0 if worker_info is None else worker_info.id
+        rng = np.random.default_rng((self.seed, self.epoch, self.rank, worker_id))
+        buffer = []
+        for item in self._items(blocks):
+            if len(buffer) < self.buffer_size:
+                buffer.append(item)
+                continue
+            i = rng.integers(len(buffer))
+            yield buffer[i]
+            buffer[i] = item
+        for i in rng.permutation(len(buffer)).tolist():
+            yield buffer[i]
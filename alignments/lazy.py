@@ -0,0 +1,68 @@
+"""
+Lazy item access for ``AlignmentDataset(lazy=True)``.
+
+Only the file inventory is built up front, items are parsed on first access and
+kept in a size-bounded LRU cache.
+"""
+from collections import OrderedDict
+
+
+class LazyData():
+    """
+    Sequence of items parsed on demand from ``files`` with ``create_item``.
+
+    Items that ``create_item`` marks as ``"incorrect"`` are remembered in ``self.skipped``
+    (index -> reason) and returned as ``None``, so indices always refer to the same file.
+    """
+    def __init__(self, files, create_item, cache_size=10_000, on_skip=None):
+        self.files = files
+        self.create_item = create_item
+        self.cache_size = cache_size
+        self.on_skip = on_skip
+        self.cache = OrderedDict()
+        self.skipped = {}
+        self.hits = 0
+        self.misses = 0
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if index < 0 or index >= len(self):
+            raise IndexError("index out of range")
+        if index in self.skipped:
+            return None
+        if index in self.cache:
+            self.hits += 1
+            self.cache.move_to_end(index)
+            return self.cache[index]
+        self.misses += 1
+        item = self.parse(index)
+        if item is None:
+            return None
+        if self.cache_size > 0:
+            self.cache[index] = item
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        return item
+
+    def parse(self, index):
+        """
+        Parses item ``index`` without using the cache, returns None if it is skipped.
+        """
+        item = self.create_item(self.files[index])
+        if "incorrect" in item:
+            self.skipped[index] = item["incorrect"]
+            if self.on_skip is not None:
+                self.on_skip(item)
+            return None
+        return item
+
+    def __len__(self):
+        return len(self.files)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def phones(self, index):
+        raise ValueError("phone arrays are not available in lazy mode, use the \"phones\" of the item instead")
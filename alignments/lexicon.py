@@ -0,0 +1,79 @@
+"""
+Reading and writing of MFA lexicons, and the words of a corpus.
+"""
+from multiprocessing import Pool
+from pathlib import Path
+import re
+
+# characters MFA strips from words by default
+PUNCTUATION = "、。।，@<>\"(),.:;¿?¡!\\&%#*~【】，…‥「」『』〝〟″⟨⟩♪・‹›«»～′$+="
+
+
+def read_lexicon(path):
+    """
+    Returns the ``(word, pronunciation)`` entries of the lexicon at ``path``.
+    """
+    entries = []
+    for line in Path(path).read_text().splitlines():
+        parts = line.strip().split(maxsplit=1)
+        if len(parts) == 2:
+            entries.append((parts[0], parts[1]))
+    return entries
+
+
+def write_lexicon(path, entries):
+    Path(path).write_text("".join(f"{word}\t{pronunciation}\n" for word, pronunciation in entries))
+
+
+def normalize_lexicon(path):
+    """
+    Makes sure words and pronunciations of the lexicon at ``path`` are separated by tabs.
+    """
+    with open(path, "r") as f:
+        content = f.read()
+        content_new = re.sub(r'^(\S+)\s+', r'\1\t', content, flags=re.M)
+    with open(path, "w") as f:
+        f.write(content_new)
+
+
+def tokenize(text):
+    """
+    Splits a transcript into words the way MFA does by default: lowercased, split at whitespace,
+    with punctuation stripped from both ends of each word.
+    """
+    words = []
+    for token in text.lower().split():
+        token = token.strip(PUNCTUATION)
+        if len(token) > 0:
+            words.append(token)
+    return words
+
+
+def _read_words(path):
+    return set(tokenize(Path(path).read_text()))
+
+
+def corpus_words(lab_paths, n_workers=16):
+    """
+    Returns the set of words in the .lab files ``lab_paths``, read in ``n_workers`` processes.
+    """
+    words = set()
+    if n_workers <= 1:
+        for path in lab_paths:
+            words |= _read_words(path)
+        return words
+    with Pool(n_workers) as pool:
+        for result in pool.imap_unordered(_read_words, lab_paths, chunksize=256):
+            words |= result
+    return words
+
+
+def find_oovs(lab_paths, lexicon_path, n_workers=16):
+    """
+    Returns the sorted words of the .lab files ``lab_paths`` which are not in the lexicon at ``lexicon_path``,
+    like the ``oovs_found_lexicon.txt`` file of ``mfa validate``.
+    Only punctuation is stripped (see ``tokenize``), MFA's splitting of clitics and compound words is not replicated,
+    so the OOVs can differ from the ones ``mfa validate`` reports.
+    """
+    known = {word.lower() for word, _ in read_lexicon(lexicon_path)}
+    return sorted(corpus_words(lab_paths, n_workers) - known)
@@ -0,0 +1,78 @@
+"""
+Manifest of the files an index was built from.
+
+For every (wav, TextGrid, lab) triple the manifest records the modification time and
+size of the three files and the row of the parsed item in the index (or why it was
+skipped). ``AlignmentDataset.refresh`` compares it with the directory to only
+re-parse triples that are new or have changed.
+"""
+from pathlib import Path
+import os
+
+import numpy as np
+
+from alignments.container import StringColumn
+
+STAT_COLUMNS = ["wav_mtime", "wav_size", "textgrid_mtime", "textgrid_size", "lab_mtime", "lab_size"]
+
+
+def file_stats(file):
+    """
+    Returns the (mtime_ns, size) pairs of a (wav, TextGrid, lab) triple as a flat tuple.
+    """
+    stats = []
+    for path in file:
+        stat = os.stat(path)
+        stats += [stat.st_mtime_ns, stat.st_size]
+    return tuple(stats)
+
+
+class Manifest():
+    """
+    ``wavs`` are paths relative to the target directory, ``items`` the index row of each
+    triple (-1 if it was skipped) and ``reasons`` the reason it was skipped (or "").
+    """
+    def __init__(self, wavs, stats, items, reasons):
+        self.wavs = wavs
+        self.stats = stats
+        self.items = items
+        self.reasons = reasons
+        self._lookup = None
+
+    @classmethod
+    def build(cls, target_directory, files, stats, items, reasons):
+        return cls(
+            StringColumn.from_strings([str(Path(wav).relative_to(target_directory)) for wav, _, _ in files]),
+            np.array(stats, dtype=np.int64).reshape(-1, len(STAT_COLUMNS)),
+            np.array(items, dtype=np.int64),
+            StringColumn.from_strings(reasons),
+        )
+
+    def lookup(self, wav):
+        """
+        Returns the manifest row for ``wav`` (relative to the target directory) or ``None``.
+        """
+        if self._lookup is None:
+            self._lookup = {x: i for i, x in enumerate(self.wavs)}
+        return self._lookup.get(wav)
+
+    def __len__(self):
+        return len(self.items)
+
+    def to_arrays(self):
+        arrays = {
+            "manifest_stats": self.stats,
+            "manifest_items": self.items,
+        }
+        arrays.update(self.wavs.to_arrays("manifest_wavs"))
+        arrays.update(self.reasons.to_arrays("manifest_reasons"))
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        return cls(
+            StringColumn.from_arrays(arrays, "manifest_wavs"),
+            arrays["manifest_stats"],
+            arrays["manifest_items"],
+            StringColumn.from_arrays(arrays, "manifest_reasons"),
+        )
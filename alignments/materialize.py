@@ -0,0 +1,105 @@
+"""
+Materialization of a corpus in the target directory (the LOAD stage of ``AlignmentDataset``).
+
+Items are taken from ``collect_data`` in the calling thread while a thread pool links the
+audio files and writes the .lab files in batches, so transcript normalization overlaps with
+the (syscall-bound) filesystem work. Speaker directories are only created once.
+"""
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED, ALL_COMPLETED
+from pathlib import Path
+import errno
+import os
+import shutil
+
+from tqdm.auto import tqdm
+
+LINK_MODES = ["symlink", "hardlink", "reflink", "copy"]
+# ioctl request cloning a file on copy-on-write filesystems (btrfs, xfs), see ioctl_ficlone(2)
+FICLONE = 0x40049409
+
+
+def _reflink(source, target):
+    import fcntl
+    with open(source, "rb") as s, open(target, "wb") as t:
+        fcntl.ioctl(t.fileno(), FICLONE, s.fileno())
+
+
+def link_file(source, target, link_mode="symlink"):
+    """
+    Makes the file ``source`` available at ``target`` using ``link_mode`` (one of ``LINK_MODES``).
+    Hardlinks and reflinks fall back to copies where the filesystem doesn't support them.
+    """
+    if os.path.lexists(target):
+        os.unlink(target)
+    if link_mode == "symlink":
+        os.symlink(Path(source).resolve(), target)
+    elif link_mode == "hardlink":
+        try:
+            os.link(Path(source).resolve(), target)
+        except OSError as e:
+            if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK):
+                raise
+            shutil.copy(source, target)
+    elif link_mode == "reflink":
+        try:
+            _reflink(source, target)
+        except (OSError, ImportError):
+            shutil.copy(source, target)
+    elif link_mode == "copy":
+        shutil.copy(source, target)
+    else:
+        raise ValueError(f"link_mode must be one of {LINK_MODES}")
+
+
+def _write_batch(batch, link_mode):
+    for source, target, transcript, textgrid in batch:
+        link_file(source, target, link_mode)
+        if transcript is not None:
+            target.with_suffix(".lab").write_text(transcript)
+        else:
+            # symlink to textgrid instead of creating a lab file
+            link_file(textgrid, target.with_suffix(".TextGrid"), "symlink")
+    return len(batch)
+
+
+def materialize(items, target_directory, link_mode="symlink", n_workers=16, batch_size=256):
+    """
+    Writes the ``items`` of ``AlignmentDataset.collect_data`` to ``target_directory/<speaker>/``,
+    returns the number of items.
+    """
+    if link_mode not in LINK_MODES:
+        raise ValueError(f"link_mode must be one of {LINK_MODES}")
+    speaker_directories = set()
+    n_items = 0
+    max_pending = 2 * n_workers
+    with ThreadPoolExecutor(n_workers) as executor, tqdm(desc="materializing corpus", unit=" files") as pbar:
+        pending = set()
+        def collect(return_when):
+            nonlocal pending
+            done, pending = wait(pending, return_when=return_when)
+            for future in done:
+                pbar.update(future.result())
+        def submit(batch):
+            pending.add(executor.submit(_write_batch, batch, link_mode))
+            if len(pending) >= max_pending:
+                collect(FIRST_COMPLETED)
+        batch = []
+        for item in items:
+            if not item["path"].suffix in [".wav", ".flac"]:
+                raise ValueError("Only .wav and .flac files are supported.")
+            if "transcript" not in item and "textgrid" not in item:
+                raise ValueError("Either transcript or textgrid must be provided.")
+            speaker_directory = Path(target_directory) / item["speaker"]
+            if speaker_directory not in speaker_directories:
+                speaker_directory.mkdir(exist_ok=True, parents=True)
+                speaker_directories.add(speaker_directory)
+            batch.append((item["path"], speaker_directory / item["path"].name, item.get("transcript"), item.get("textgrid")))
+            n_items += 1
+            if len(batch) >= batch_size:
+                submit(batch)
+                batch = []
+        if len(batch) > 0:
+            submit(batch)
+        if len(pending) > 0:
+            collect(ALL_COMPLETED)
+    return n_items
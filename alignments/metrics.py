@@ -0,0 +1,244 @@
+"""
+Per-stage metrics of the ``AlignmentDataset`` pipeline.
+
+Each stage records its wall time, CPU time (of this process and of finished child
+processes, such as MFA and worker pools), the number of files and bytes it processed,
+the bytes read from disk, the resident memory of this process at its end and the peak
+resident memory of the whole run so far. Stages can be nested, e.g. MFA calls within the
+alignment stage, which also record the peak memory of the MFA process. Hooks are called
+with every finished stage, and the report can be written as JSON.
+"""
+from contextlib import contextmanager
+from pathlib import Path
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+try:
+    import resource
+except ImportError:
+    # not available on windows
+    resource = None
+
+
+def _usage():
+    """
+    Returns CPU seconds, bytes read from disk and peak RSS in bytes of this process and its finished children,
+    the peak is the maximum since the process started.
+    """
+    times = os.times()
+    cpu = times.user + times.system + times.children_user + times.children_system
+    if resource is None:
+        return cpu, 0, 0
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return cpu, (own.ru_inblock + children.ru_inblock) * 512, max(own.ru_maxrss, children.ru_maxrss) * _RSS_UNIT
+
+
+# ru_maxrss is in kilobytes on linux and in bytes on macOS
+_RSS_UNIT = 1 if sys.platform == "darwin" else 1024
+
+
+def _current_rss():
+    """
+    Returns the current RSS of this process in bytes, 0 where /proc is not available.
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return 0
+
+
+def run_command(command, capture=True, cwd=None):
+    """
+    Runs the shell ``command`` like ``subprocess.run`` and returns its ``CompletedProcess``, which also has
+    the ``cpu_time`` and ``peak_rss`` (in bytes) of the command and the processes it waited for (0 if unknown).
+    """
+    pipe = subprocess.PIPE if capture else None
+    process = subprocess.Popen(command, shell=True, cwd=cwd, stdout=pipe, stderr=pipe)
+    outputs = {}
+    # both pipes are read at the same time, so the command never blocks on a full pipe
+    readers = [
+        threading.Thread(target=lambda name, f: outputs.__setitem__(name, f.read()), args=(name, f))
+        for name, f in [("stdout", process.stdout), ("stderr", process.stderr)] if f is not None
+    ]
+    for reader in readers:
+        reader.start()
+    for reader in readers:
+        reader.join()
+    cpu_time, peak_rss = 0.0, 0
+    if hasattr(os, "wait4"):
+        # waiting with wait4 returns the resource usage of this command only
+        _, status, usage = os.wait4(process.pid, 0)
+        process.returncode = -os.WTERMSIG(status) if os.WIFSIGNALED(status) else os.WEXITSTATUS(status)
+        cpu_time, peak_rss = usage.ru_utime + usage.ru_stime, usage.ru_maxrss * _RSS_UNIT
+    else:
+        process.wait()
+    for f in [process.stdout, process.stderr]:
+        if f is not None:
+            f.close()
+    out = subprocess.CompletedProcess(command, process.returncode, outputs.get("stdout"), outputs.get("stderr"))
+    out.cpu_time = cpu_time
+    out.peak_rss = peak_rss
+    return out
+
+
+class StageRecord():
+    """
+    Metrics of one stage, ``files`` and ``bytes`` are counted by the stage itself with ``add``.
+    """
+    def __init__(self, name, parent=None):
+        self.name = name
+        self.parent = parent
+        self.files = 0
+        self.bytes = 0
+        self.status = "running"
+        self.wall_time = 0.0
+        self.cpu_time = 0.0
+        self.read_bytes = 0
+        self.rss = 0 # of this process, at the end of the stage
+        self.lifetime_peak_rss = 0 # of this process and its finished children, since the process started
+        self.command_peak_rss = 0 # of the shell command of the stage, if it is one
+        self._start = None
+
+    def add(self, files=0, bytes=0):
+        self.files += files
+        self.bytes += bytes
+
+    def skip(self):
+        """
+        Marks the stage as skipped, e.g. because its outputs already exist.
+        """
+        self.status = "skipped"
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "parent": self.parent,
+            "status": self.status,
+            "wall_time": self.wall_time,
+            "cpu_time": self.cpu_time,
+            "files": self.files,
+            "bytes": self.bytes,
+            "read_bytes": self.read_bytes,
+            "rss": self.rss,
+            "lifetime_peak_rss": self.lifetime_peak_rss,
+            "command_peak_rss": self.command_peak_rss,
+        }
+
+
+class Metrics():
+    """
+    Collects ``StageRecord``s. ``hooks`` are called with the dict of every finished stage.
+    If ``path`` is given, the JSON report is written there after every stage.
+    """
+    def __init__(self, hooks=None, path=None):
+        self.hooks = list(hooks or [])
+        self.path = path
+        self.stages = []
+        self._stack = []
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        # datasets are pickled for worker processes, which must not call hooks or write reports
+        state = self.__dict__.copy()
+        state["hooks"] = []
+        state["path"] = None
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def add_hook(self, hook):
+        self.hooks.append(hook)
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Context manager measuring the stage ``name``, yields its ``StageRecord``.
+        """
+        record = StageRecord(name, self._stack[-1].name if len(self._stack) > 0 else None)
+        self.stages.append(record)
+        self._stack.append(record)
+        wall = time.perf_counter()
+        cpu, read_bytes, _ = _usage()
+        try:
+            yield record
+            if record.status == "running":
+                record.status = "done"
+        except BaseException:
+            record.status = "failed"
+            raise
+        finally:
+            self._stack.pop()
+            end_cpu, end_read_bytes, peak_rss = _usage()
+            record.wall_time = time.perf_counter() - wall
+            record.cpu_time = end_cpu - cpu
+            record.read_bytes = end_read_bytes - read_bytes
+            record.rss = _current_rss()
+            record.lifetime_peak_rss = peak_rss
+            self._finish(record)
+
+    def _finish(self, record):
+        with self._lock:
+            for hook in self.hooks:
+                hook(record.to_dict())
+            if self.path is not None:
+                self.write(self.path)
+
+    def add_command(self, name, out, wall_time):
+        """
+        Adds the finished shell command ``out`` (as returned by ``run_command``) as a stage nested in the current one.
+        Unlike ``stage``, this can be called from several threads, e.g. for commands running concurrently.
+        """
+        record = StageRecord(name, self._stack[-1].name if len(self._stack) > 0 else None)
+        record.status = "done" if out.returncode == 0 else "failed"
+        record.wall_time = wall_time
+        record.cpu_time = out.cpu_time
+        record.rss = _current_rss()
+        record.lifetime_peak_rss = _usage()[2]
+        record.command_peak_rss = out.peak_rss
+        with self._lock:
+            self.stages.append(record)
+        self._finish(record)
+
+    def report(self):
+        """
+        All stages and the totals of the top-level stages as a dict.
+        """
+        top_level = [x for x in self.stages if x.parent is None]
+        return {
+            "stages": [x.to_dict() for x in self.stages],
+            "total": {
+                "wall_time": sum(x.wall_time for x in top_level),
+                "cpu_time": sum(x.cpu_time for x in top_level),
+                "files": sum(x.files for x in top_level),
+                "bytes": sum(x.bytes for x in top_level),
+                "read_bytes": sum(x.read_bytes for x in top_level),
+                "lifetime_peak_rss": max([x.lifetime_peak_rss for x in self.stages], default=0),
+            },
+        }
+
+    def write(self, path):
+        Path(path).write_text(json.dumps(self.report(), indent=2))
+
+    def summary(self):
+        """
+        One line per stage, for printing.
+        """
+        lines = []
+        for x in self.stages:
+            indent = "  " if x.parent is not None else ""
+            command = f", command peak rss {x.command_peak_rss / 2**20:.0f} MiB" if x.command_peak_rss > 0 else ""
+            lines.append(
+                f"{indent}{x.name}: {x.wall_time:.2f}s wall, {x.cpu_time:.2f}s cpu, {x.files} files, "
+                f"{x.bytes / 2**20:.1f} MiB, rss {x.rss / 2**20:.0f} MiB{command}, "
+                f"lifetime peak rss {x.lifetime_peak_rss / 2**20:.0f} MiB ({x.status})"
+            )
+        return "\n".join(lines)
@@ -0,0 +1,163 @@
+"""
+Background decoding of the audio of upcoming items.
+
+``AudioPrefetcher`` decodes the audio of the items which will be requested next in a
+bounded thread pool (libsndfile releases the GIL while decoding), so decoding overlaps
+with whatever the consumer does in between. Upcoming items are either scheduled
+explicitly (``AlignmentDataset.__getitems__`` schedules the whole batch a DataLoader asks
+for) or guessed: as long as items are requested in order, the next ``depth`` items are
+read ahead. Items can be cropped to a segment, then only the frames of the segment are
+decoded.
+"""
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from alignments.textgrids import ROUND_DIGITS
+
+
+def read_segment(path, start=None, end=None):
+    """
+    Reads the audio file at ``path`` as mono float32, only the frames between ``start`` and ``end`` seconds if given.
+    Returns ``(audio, sampling_rate)``.
+    """
+    import soundfile as sf
+    with sf.SoundFile(str(path)) as f:
+        sampling_rate = f.samplerate
+        if start is not None:
+            f.seek(min(int(round(start * sampling_rate)), f.frames))
+        n_frames = -1 if end is None else max(int(round(end * sampling_rate)) - int(round((start or 0) * sampling_rate)), 0)
+        audio = f.read(n_frames, dtype="float32", always_2d=True)
+    return audio.mean(axis=1), sampling_rate
+
+
+def phone_segment(starts, ends, max_seconds, rng):
+    """
+    A random segment of at most ``max_seconds`` which starts and ends at phone boundaries, as ``(start, end)``
+    in seconds, or None if the item is shorter. A single phone longer than ``max_seconds`` is never cut.
+    """
+    starts = np.round(np.asarray(starts, dtype=np.float64), ROUND_DIGITS)
+    ends = np.round(np.asarray(ends, dtype=np.float64), ROUND_DIGITS)
+    if len(ends) == 0 or ends[-1] <= max_seconds:
+        return None
+    first = rng.integers(np.searchsorted(starts, ends[-1] - max_seconds, side="right"))
+    last = max(first, np.searchsorted(ends, starts[first] + max_seconds, side="right") - 1)
+    return float(starts[first]), float(ends[last])
+
+
+def crop_item(item, start, end):
+    """
+    Returns a copy of ``item`` with only the phones and words between ``start`` and ``end`` seconds,
+    shifted so the segment starts at 0. The transcript is the one of the whole item.
+    """
+    item = dict(item, crop=(start, end))
+    if "phones" in item:
+        item["phones"] = [
+            (round(s - start, ROUND_DIGITS), round(e - start, ROUND_DIGITS), p)
+            for s, e, p in item["phones"] if s >= start and e <= end
+        ]
+    else:
+        starts, ends = np.round(item["phone_starts"], ROUND_DIGITS), np.round(item["phone_ends"], ROUND_DIGITS)
+        inside = (starts >= start) & (ends <= end)
+        item["phone_starts"] = item["phone_starts"][inside] - np.float32(start)
+        item["phone_ends"] = item["phone_ends"][inside] - np.float32(start)
+        item["phone_ids"] = item["phone_ids"][inside]
+    item["words"] = [
+        (round(s - start, ROUND_DIGITS), round(e - start, ROUND_DIGITS), w)
+        for s, e, w in item["words"] if s >= start and e <= end
+    ]
+    return item
+
+
+class AudioPrefetcher():
+    """
+    Calls ``load(index)`` for upcoming indices in ``n_threads`` threads, keeping at most ``depth`` results
+    (decoded or in progress) ahead of the consumer. ``n_items`` bounds the indices which are read ahead.
+    Only one thread may call ``schedule`` and ``get``.
+    """
+    def __init__(self, load, n_items, n_threads=4, depth=16):
+        self.load = load
+        self.n_items = n_items
+        self.depth = depth
+        self.executor = ThreadPoolExecutor(max(1, n_threads))
+        self.futures = OrderedDict()
+        self.queue = deque()
+        self.queued = set()
+        self.last = None
+        self.hits = 0 # decoded before it was requested
+        self.waits = 0 # still decoding when it was requested
+        self.misses = 0 # not scheduled, decoded by the consumer
+        self.unused = 0 # decoded or scheduled, but never requested
+
+    def schedule(self, indices):
+        """
+        Decodes ``indices`` in this order, ahead of the requests for them.
+        """
+        for index in indices:
+            if index not in self.futures and index not in self.queued:
+                self.queue.append(index)
+                self.queued.add(index)
+        self._fill()
+
+    def _fill(self):
+        while len(self.futures) < self.depth and len(self.queue) > 0:
+            index = self.queue.popleft()
+            self.queued.discard(index)
+            if index not in self.futures:
+                self.futures[index] = self.executor.submit(self.load, index)
+
+    def _drop(self, keep):
+        # results scheduled before the requested one will not be requested anymore
+        while len(self.futures) > 0 and next(iter(self.futures)) != keep:
+            _, future = self.futures.popitem(last=False)
+            future.cancel()
+            self.unused += 1
+
+    def get(self, index):
+        """
+        The result of ``load(index)``, decoded ahead of time if it was scheduled or guessed.
+        """
+        if index in self.futures:
+            self._drop(index)
+            future = self.futures.pop(index)
+            if future.done():
+                self.hits += 1
+            else:
+                self.waits += 1
+            result = future.result()
+        else:
+            # everything in progress was scheduled before this index, or the order changed
+            self._drop(None)
+            if index in self.queued:
+                while self.queue.popleft() != index:
+                    self.unused += 1
+                self.queued = set(self.queue)
+            else:
+                self.unused += len(self.queue)
+                self.queue.clear()
+                self.queued.clear()
+            self.misses += 1
+            result = self.load(index)
+        if self.last is not None and index == self.last + 1:
+            self.schedule(range(index + 1, min(index + 1 + self.depth, self.n_items)))
+        self.last = index
+        self._fill()
+        return result
+
+    def stats(self):
+        """
+        Number of hits, waits, misses and unused results, and the fraction of requests which were hits.
+        """
+        requests = self.hits + self.waits + self.misses
+        return {
+            "hits": self.hits,
+            "waits": self.waits,
+            "misses": self.misses,
+            "unused": self.unused,
+            "hit_rate": self.hits / requests if requests > 0 else 0.0,
+        }
+
+    def close(self):
+        self._drop(None)
+        self.executor.shutdown(wait=False)
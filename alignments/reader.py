@@ -0,0 +1,113 @@
+"""
+Read-only access to an aligned corpus.
+
+``AlignmentReader`` opens the index an ``AlignmentDataset`` wrote to its ``target_directory``
+and returns the same items, but only imports NumPy and the modules of this package which
+read the index: no torch, no MFA, no audio libraries. Use it in inference or analysis
+processes which only read a corpus that was aligned before. ``AlignmentReader.from_shards``
+reads a corpus exported with ``AlignmentDataset.export_shards`` instead (needs pyarrow).
+"""
+from pathlib import Path
+
+from alignments.index import index_path, load_index, PARSER_VERSION
+from alignments.audio_store import AudioStore, AUDIO_STORE_NAME
+from alignments.resample import resampled_directory
+from alignments.search import SearchIndex, SEARCH_NAME
+from alignments.shards import ShardedCorpus
+
+
+def finish_item(index, item, target_directory, resampled_directory=None, audio_store=None):
+    """
+    Points ``item`` to its resampled audio file and adds its packed audio, if any.
+    """
+    if resampled_directory is not None and item is not None:
+        item = dict(item, wav=resampled_directory / Path(item["wav"]).relative_to(target_directory))
+    if audio_store is not None:
+        item["audio"] = audio_store[index]
+    return item
+
+
+class AlignmentReader():
+    """
+    Items of the corpus aligned in ``target_directory``, read from its index.
+    ``punctuation_marks`` have to be the same as the ones of the dataset which wrote the index.
+    Audio which was resampled or packed by the dataset is used if ``target_sampling_rate`` or ``packed_audio`` are set,
+    but nothing is resampled or packed here.
+    """
+    def __init__(
+        self,
+        target_directory,
+        punctuation_marks="!?.,;",
+        phones_format="tuples", # "tuples" for lists of (start, end, phone), "arrays" for numpy views
+        target_sampling_rate=None,
+        resample_directory=None, # as given to the dataset, defaults to target_directory
+        packed_audio=False,
+        data=None, # a ColumnarData to read instead of the index
+    ):
+        self.target_directory = target_directory
+        self.data = data
+        if data is None:
+            self.data = load_index(index_path(target_directory), target_directory, punctuation_marks, PARSER_VERSION, phones_format)
+        if self.data is None:
+            raise ValueError(f"no valid index in {target_directory}, create an AlignmentDataset with use_index=True first")
+        self.vocab = self.data.vocab
+        self.tokens = set(self.vocab)
+        self.resampled_directory = None
+        if target_sampling_rate is not None:
+            self.resampled_directory = resampled_directory(resample_directory or target_directory, target_sampling_rate)
+            if not self.resampled_directory.exists():
+                raise ValueError(f"audio was not resampled to {target_sampling_rate}")
+        self.search = None
+        self.shards = None
+        self.audio_store = None
+        if packed_audio:
+            self.audio_store = AudioStore.open(Path(target_directory) / AUDIO_STORE_NAME, self.data.signature(), target_sampling_rate)
+            if self.audio_store is None:
+                raise ValueError("audio was not packed, use packed_audio=True with the dataset first")
+
+    @classmethod
+    def from_shards(cls, directory, target_directory=None, columns=None, memory_map=True, phones_format="tuples"):
+        """
+        Items of the shards exported to ``directory``, reading only ``columns`` (see ``alignments.shards``).
+        Audio paths are relative to ``target_directory``, which defaults to ``directory``.
+        If the audio was exported and read, items contain the bytes of their audio file in ``"audio_bytes"``.
+        """
+        shards = ShardedCorpus(directory, columns, memory_map)
+        target_directory = directory if target_directory is None else target_directory
+        reader = cls(target_directory, phones_format=phones_format, data=shards.to_columnar(target_directory, phones_format))
+        reader.shards = shards
+        return reader
+
+    @property
+    def token_counts(self):
+        return self.data.token_counts
+
+    def phone_arrays(self, index):
+        """
+        Returns ``(starts, ends, phone_ids)`` numpy views for the item at ``index``, ids index into ``self.vocab``.
+        """
+        return self.data.phones(index)
+
+    def durations(self):
+        """
+        Returns the duration of each item in seconds, the end of its last phone.
+        """
+        return self.data.durations()
+
+    def search_index(self):
+        """
+        Returns the ``SearchIndex`` (see ``alignments.search``) of the corpus, which is only built
+        in memory if the dataset didn't store it.
+        """
+        if self.search is None:
+            self.search = SearchIndex.open(self.data, Path(self.target_directory) / SEARCH_NAME, write=False)
+        return self.search
+
+    def __getitem__(self, index):
+        item = finish_item(index, self.data[index], self.target_directory, self.resampled_directory, self.audio_store)
+        if self.shards is not None and "audio" in self.shards.columns:
+            item["audio_bytes"] = self.shards.audio_bytes(index)
+        return item
+
+    def __len__(self):
+        return len(self.data)
@@ -0,0 +1,47 @@
+"""
+Resampling stage for ``AlignmentDataset(target_sampling_rate=...)``.
+
+Audio is resampled exactly once with a polyphase filter and written to a cache
+directory per sampling rate, the source corpus (which is usually symlinked into the
+target directory) is never modified. Files that have already been resampled are skipped.
+"""
+from math import gcd
+from pathlib import Path
+import os
+
+RESAMPLED_NAME = ".resampled"
+
+
+def resampled_directory(directory, sampling_rate):
+    """
+    Cache directory for audio at ``sampling_rate``, ``directory`` is usually the target directory.
+    """
+    return Path(directory) / RESAMPLED_NAME / str(sampling_rate)
+
+
+def resample_file(args):
+    """
+    Resamples ``source`` to ``sampling_rate`` and writes the result to ``target``, given as one ``(source, target, sampling_rate)`` tuple.
+    Files already at the right sampling rate are symlinked instead.
+    """
+    import soundfile as sf
+    from scipy.signal import resample_poly
+    source, target, sampling_rate = args
+    target = Path(target)
+    if target.exists():
+        return
+    target.parent.mkdir(parents=True, exist_ok=True)
+    info = sf.info(str(source))
+    if info.samplerate == sampling_rate:
+        try:
+            target.symlink_to(Path(source).resolve())
+        except FileExistsError:
+            pass
+        return
+    audio, source_rate = sf.read(str(source), dtype="float32")
+    factor = gcd(sampling_rate, source_rate)
+    audio = resample_poly(audio, sampling_rate // factor, source_rate // factor, axis=0)
+    # write to a temporary file first, so interrupted runs never leave truncated files behind
+    tmp_path = target.with_name(f".{target.name}.{os.getpid()}.tmp")
+    sf.write(str(tmp_path), audio, sampling_rate, subtype=info.subtype, format=info.format)
+    os.replace(tmp_path, target)
@@ -0,0 +1,114 @@
+"""
+Batch sampler which groups items of similar duration.
+
+Items are sorted by duration and split into buckets of neighbouring items. Batches
+are filled from within the buckets until the padded size of the batch (number of
+items times the longest item) would exceed the budget, so little compute is spent
+on padding. Shuffling happens within buckets and across batches, and batches are
+split across distributed ranks without overlap.
+"""
+import math
+
+import numpy as np
+from torch.utils.data import Sampler
+
+
+class DurationBatchSampler(Sampler):
+    """
+    ``batch_sampler`` for ``torch.utils.data.DataLoader``.
+
+    ``durations`` are the durations of all items in seconds. The budget is either
+    ``max_seconds`` or ``max_frames`` (which requires ``sampling_rate`` and ``hop_length``)
+    of padded audio per batch, optionally limited to ``max_batch_size`` items.
+    ``bucket_size`` is the number of neighbouring items (by duration) shuffled together.
+    ``num_replicas`` and ``rank`` default to the values of ``torch.distributed`` if it is initialized.
+    Call ``set_epoch`` at the start of each epoch to get a different shuffle.
+    """
+    def __init__(
+        self,
+        durations,
+        max_seconds=None,
+        max_frames=None,
+        sampling_rate=None,
+        hop_length=None,
+        max_batch_size=None,
+        bucket_size=1000,
+        shuffle=True,
+        seed=0,
+        num_replicas=None,
+        rank=None,
+        drop_last=False,
+    ):
+        if (max_seconds is None) == (max_frames is None):
+            raise ValueError("exactly one of max_seconds and max_frames has to be given")
+        durations = np.asarray(durations, dtype=np.float64)
+        if max_frames is not None:
+            if sampling_rate is None or hop_length is None:
+                raise ValueError("max_frames requires sampling_rate and hop_length")
+            self.costs = np.ceil(durations * sampling_rate / hop_length)
+            self.budget = max_frames
+        else:
+            self.costs = durations
+            self.budget = max_seconds
+        if num_replicas is None or rank is None:
+            import torch.distributed as dist
+            initialized = dist.is_available() and dist.is_initialized()
+            if num_replicas is None:
+                num_replicas = dist.get_world_size() if initialized else 1
+            if rank is None:
+                rank = dist.get_rank() if initialized else 0
+        if rank >= num_replicas or rank < 0:
+            raise ValueError(f"invalid rank {rank}, rank should be in the interval [0, {num_replicas - 1}]")
+        self.max_batch_size = max_batch_size
+        self.bucket_size = bucket_size
+        self.shuffle = shuffle
+        self.seed = seed
+        self.num_replicas = num_replicas
+        self.rank = rank
+        self.drop_last = drop_last
+        self.epoch = 0
+        self._cache = None
+        self.order = np.argsort(self.costs, kind="stable")
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    def _batches(self):
+        if self._cache is not None and self._cache[0] == self.epoch:
+            return self._cache[1]
+        rng = np.random.default_rng(self.seed + self.epoch)
+        order = self.order.copy()
+        if self.shuffle:
+            for start in range(0, len(order), self.bucket_size):
+                rng.shuffle(order[start:start + self.bucket_size])
+        batches = []
+        batch = []
+        longest = 0
+        for index, cost in zip(order.tolist(), self.costs[order].tolist()):
+            new_longest = max(longest, cost)
+            full = self.max_batch_size is not None and len(batch) >= self.max_batch_size
+            if len(batch) > 0 and (full or (len(batch) + 1) * new_longest > self.budget):
+                batches.append(batch)
+                batch = []
+                new_longest = cost
+            batch.append(index)
+            longest = new_longest
+        if len(batch) > 0:
+            batches.append(batch)
+        if self.shuffle:
+            batches = [batches[i] for i in rng.permutation(len(batches))]
+        # every rank needs the same number of batches
+        if self.drop_last:
+            batches = batches[:len(batches) - len(batches) % self.num_replicas]
+        elif len(batches) % self.num_replicas != 0:
+            padding = self.num_replicas - len(batches) % self.num_replicas
+            batches += (batches * math.ceil(padding / max(len(batches), 1)))[:padding]
+        batches = batches[self.rank::self.num_replicas]
+        self._cache = (self.epoch, batches)
+        return batches
+
+    def __iter__(self):
+        return iter(self._batches())
+
+    def __len__(self):
+        return len(self._batches())
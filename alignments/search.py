@@ -0,0 +1,231 @@
+"""
+Inverted index over the phones and words of a dataset.
+
+Posting lists map each phone, each bigram and trigram of phones and each word of the word
+tier to the positions of its occurrences in the global columnar arrays (see
+``alignments.columnar``), in corpus order. They are built with a few NumPy sorts over all
+phones at once and stored in a container next to the index, so a query is a lookup of
+one posting list in memory-mapped arrays. N-grams are built over the speech phones: pause
+tokens (``[SILENCE]`` and the punctuation tokens) between words are skipped, so n-grams
+can span word boundaries. Longer phone sequences and word sequences are found by checking
+the following positions of the occurrences of their start.
+"""
+from bisect import bisect_left
+import hashlib
+
+import numpy as np
+
+from alignments.columnar import _id_dtype
+from alignments.container import read_container, write_cache
+from alignments.stats import data_signature
+from alignments.textgrids import ROUND_DIGITS
+
+SEARCH_NAME = ".alignments.search"
+SEARCH_VERSION = 1
+NGRAM_SIZES = [2, 3]
+
+
+def search_signature(data):
+    """
+    Hash of the phones and words of a ``ColumnarData``, the search index is rebuilt when it changes.
+    """
+    sha = hashlib.sha1(data_signature(data).encode("utf-8"))
+    for array in [data.word_offsets, data.word_ids, data.word_vocab.offsets, data.word_vocab.data]:
+        sha.update(np.ascontiguousarray(array).tobytes())
+    return sha.hexdigest()
+
+
+def _position_dtype(n):
+    return np.int32 if n < np.iinfo(np.int32).max else np.int64
+
+
+def _sort_order(digits, n_ids):
+    """
+    Stable order sorting by several arrays of ids < ``n_ids`` (the most significant first).
+    Sorts by one array at a time, as NumPy uses radix sort for stable sorts of 16 bit integers.
+    """
+    order = np.argsort(digits[-1].astype(_id_dtype(n_ids)), kind="stable")
+    for digit in reversed(digits[:-1]):
+        order = order[np.argsort(digit[order].astype(_id_dtype(n_ids)), kind="stable")]
+    return order
+
+
+def _postings(ids, n_ids):
+    """
+    Positions of ``ids`` grouped by id (in order of position within each group), and the offsets of the groups.
+    """
+    postings = _sort_order([ids], n_ids).astype(_position_dtype(len(ids)))
+    offsets = np.zeros(n_ids + 1, dtype=np.int64)
+    np.cumsum(np.bincount(ids, minlength=n_ids), out=offsets[1:])
+    return postings, offsets
+
+
+def _items(offsets, positions):
+    # the item of each position, items without intervals are skipped by searching from the right
+    return np.searchsorted(offsets, positions, side="right") - 1
+
+
+class SearchIndex():
+    """
+    Occurrences of phones, phone sequences and words in a ``ColumnarData``, see ``AlignmentDataset.search_index``.
+
+    All queries return a dict of arrays with one entry per occurrence, in corpus order:
+    ``"items"`` (dataset indices), ``"intervals"`` (the index of the first phone or word within the item),
+    ``"starts"`` and ``"ends"`` (in seconds, of the first and last phone or word) and ``"speaker_ids"``
+    (indices into ``data.speakers``).
+    """
+    def __init__(self, data, arrays):
+        self.data = data
+        self.arrays = arrays
+        self.token_to_id = {token: i for i, token in enumerate(data.vocab)}
+
+    @classmethod
+    def build(cls, data):
+        """
+        Builds the posting lists of a ``ColumnarData``.
+        """
+        vocab_size = len(data.vocab)
+        phone_ids = np.asarray(data.phone_ids, dtype=np.int64)
+        offsets = np.asarray(data.phone_offsets, dtype=np.int64)
+        arrays = {}
+        arrays["phone_postings"], arrays["phone_posting_offsets"] = _postings(phone_ids, vocab_size)
+        arrays["word_postings"], arrays["word_posting_offsets"] = _postings(
+            np.asarray(data.word_ids, dtype=np.int64), len(data.word_vocab)
+        )
+        is_speech = np.array([not x.startswith("[") for x in data.vocab], dtype=bool)
+        speech_positions = np.flatnonzero(is_speech[phone_ids]) if len(phone_ids) > 0 else np.zeros(0, dtype=np.int64)
+        speech_items = _items(offsets, speech_positions)
+        speech_ids = phone_ids[speech_positions]
+        arrays["speech_positions"] = speech_positions.astype(_position_dtype(len(phone_ids)))
+        for n in NGRAM_SIZES:
+            # rank of each n-gram in the speech phones, and its key with one digit of base vocab_size per phone
+            ranks = np.flatnonzero(speech_items[n - 1:] == speech_items[:len(speech_items) - n + 1])
+            digits = [speech_ids[ranks + k] for k in range(n)]
+            keys = np.zeros(len(ranks), dtype=np.int64)
+            for digit in digits:
+                keys = keys * vocab_size + digit
+            order = _sort_order(digits, vocab_size)
+            keys = keys[order]
+            first = np.flatnonzero(np.diff(keys, prepend=-1))
+            arrays[f"ngram{n}_keys"] = keys[first]
+            arrays[f"ngram{n}_offsets"] = np.append(first, len(keys)).astype(np.int64)
+            arrays[f"ngram{n}_postings"] = ranks[order].astype(_position_dtype(len(speech_positions)))
+        return cls(data, arrays)
+
+    @classmethod
+    def open(cls, data, path, write=True):
+        """
+        Returns the search index of ``data`` stored at ``path``, which is built (and written, if ``write``)
+        if it is missing or was built for different data.
+        """
+        signature = search_signature(data)
+        container = read_container(path)
+        if container is not None:
+            meta, arrays = container
+            if meta.get("version") == SEARCH_VERSION and meta.get("signature") == signature:
+                return cls(data, arrays)
+        index = cls.build(data)
+        if write:
+            write_cache(path, {"version": SEARCH_VERSION, "signature": signature}, index.arrays)
+        return index
+
+    def _hits(self, offsets, starts, ends, firsts, lasts):
+        items = _items(offsets, firsts)
+        return {
+            "items": items,
+            "intervals": firsts - offsets[items],
+            "starts": np.round(np.asarray(starts[firsts], dtype=np.float64), ROUND_DIGITS),
+            "ends": np.round(np.asarray(ends[lasts], dtype=np.float64), ROUND_DIGITS),
+            "speaker_ids": np.asarray(self.data.speaker_ids)[items],
+        }
+
+    def _phone_hits(self, firsts, lasts):
+        data = self.data
+        offsets = np.asarray(data.phone_offsets, dtype=np.int64)
+        return self._hits(offsets, data.phone_starts, data.phone_ends, np.asarray(firsts, dtype=np.int64), np.asarray(lasts, dtype=np.int64))
+
+    def phone(self, token):
+        """
+        All occurrences of the phone (or pause token) ``token``.
+        """
+        if token not in self.token_to_id:
+            return self._phone_hits([], [])
+        i = self.token_to_id[token]
+        offsets = self.arrays["phone_posting_offsets"]
+        positions = self.arrays["phone_postings"][offsets[i]:offsets[i + 1]]
+        return self._phone_hits(positions, positions)
+
+    def phones(self, tokens):
+        """
+        All occurrences of the sequence of phones ``tokens`` (a list, or a string separated by spaces),
+        ignoring pauses between them. Pause tokens can only be searched on their own, with ``phone``.
+        """
+        if isinstance(tokens, str):
+            tokens = tokens.split()
+        if len(tokens) == 0:
+            raise ValueError("at least one phone is needed")
+        if len(tokens) == 1:
+            return self.phone(tokens[0])
+        if any(token.startswith("[") for token in tokens):
+            raise ValueError("phone sequences can't contain pause tokens")
+        if any(token not in self.token_to_id for token in tokens):
+            return self._phone_hits([], [])
+        ids = [self.token_to_id[token] for token in tokens]
+        n = min(len(ids), max(NGRAM_SIZES))
+        key = 0
+        for i in ids[:n]:
+            key = key * len(self.data.vocab) + i
+        keys = self.arrays[f"ngram{n}_keys"]
+        j = np.searchsorted(keys, key)
+        if j == len(keys) or keys[j] != key:
+            return self._phone_hits([], [])
+        offsets = self.arrays[f"ngram{n}_offsets"]
+        ranks = np.asarray(self.arrays[f"ngram{n}_postings"][offsets[j]:offsets[j + 1]], dtype=np.int64)
+        speech_positions = self.arrays["speech_positions"]
+        if len(ids) > n:
+            # check the following speech phones of each candidate
+            phone_ids = np.asarray(self.data.phone_ids)
+            phone_offsets = np.asarray(self.data.phone_offsets, dtype=np.int64)
+            ranks = ranks[ranks + len(ids) - 1 < len(speech_positions)]
+            items = _items(phone_offsets, speech_positions[ranks])
+            for k in range(n, len(ids)):
+                positions = speech_positions[ranks + k]
+                keep = (phone_ids[positions] == ids[k]) & (_items(phone_offsets, positions) == items)
+                ranks, items = ranks[keep], items[keep]
+        return self._phone_hits(speech_positions[ranks], speech_positions[ranks + len(ids) - 1])
+
+    def word(self, words):
+        """
+        All occurrences of a word, or of a sequence of words separated by spaces, as written in the word tier.
+        """
+        words = words.split() if isinstance(words, str) else list(words)
+        if len(words) == 0:
+            raise ValueError("at least one word is needed")
+        data = self.data
+        offsets = np.asarray(data.word_offsets, dtype=np.int64)
+        ids = []
+        for word in words:
+            i = bisect_left(data.word_vocab, word)
+            if i == len(data.word_vocab) or data.word_vocab[i] != word:
+                return self._hits(offsets, data.word_starts, data.word_ends, np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64))
+            ids.append(i)
+        posting_offsets = self.arrays["word_posting_offsets"]
+        positions = np.asarray(self.arrays["word_postings"][posting_offsets[ids[0]]:posting_offsets[ids[0] + 1]], dtype=np.int64)
+        if len(ids) > 1:
+            word_ids = np.asarray(data.word_ids)
+            positions = positions[positions + len(ids) - 1 < len(word_ids)]
+            items = _items(offsets, positions)
+            for k in range(1, len(ids)):
+                keep = (word_ids[positions + k] == ids[k]) & (_items(offsets, positions + k) == items)
+                positions, items = positions[keep], items[keep]
+        return self._hits(offsets, data.word_starts, data.word_ends, positions, positions + len(ids) - 1)
+
+    def count(self, token):
+        """
+        Number of occurrences of the phone (or pause token) ``token``, without collecting them.
+        """
+        if token not in self.token_to_id:
+            return 0
+        i = self.token_to_id[token]
+        offsets = self.arrays["phone_posting_offsets"]
+        return int(offsets[i + 1] - offsets[i])
@@ -0,0 +1,132 @@
+"""
+Sharded alignment with the Montreal Forced Aligner.
+
+The corpus is split by speaker into shards with a similar number of utterances, and
+``mfa align`` runs on each shard separately, either concurrently on this machine or
+as separate commands (e.g. cluster jobs). Finished shards are marked with a ``.done``
+file, so a failure only requires re-running the shards that did not finish.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import heapq
+import json
+import shutil
+import time
+
+from rich import print
+
+from alignments.metrics import run_command
+
+ASSIGNMENT_NAME = "assignment.json"
+DONE_NAME = ".done"
+
+
+def split_speakers(speaker_counts, n_shards):
+    """
+    Splits speakers into ``n_shards`` lists with similar numbers of utterances,
+    ``speaker_counts`` maps each speaker to its number of utterances.
+    """
+    shards = [[] for _ in range(n_shards)]
+    heap = [(0, i) for i in range(n_shards)]
+    for speaker, count in sorted(speaker_counts.items(), key=lambda x: (-x[1], x[0])):
+        size, i = heapq.heappop(heap)
+        shards[i].append(speaker)
+        heapq.heappush(heap, (size + count, i))
+    return [sorted(x) for x in shards if len(x) > 0]
+
+
+class ShardedAlignment():
+    """
+    Shards of the utterances ``files`` (pairs of audio and lab paths) in ``target_directory``,
+    prepared in ``shard_directory``. ``command`` is called with the corpus and output directory
+    of a shard and the number of jobs and has to return the shell command aligning it.
+    """
+    def __init__(self, target_directory, files, shard_directory, n_shards, command, n_workers):
+        self.target_directory = Path(target_directory)
+        self.shard_directory = Path(shard_directory)
+        self.command = command
+        self.n_jobs = max(1, n_workers // n_shards)
+        speakers = {}
+        for audio, lab in files:
+            speaker = str(Path(audio).relative_to(self.target_directory).parent)
+            speakers.setdefault(speaker, []).append((audio, lab))
+        assignment = {
+            "n_shards": n_shards,
+            "shards": split_speakers({k: len(v) for k, v in speakers.items()}, n_shards),
+        }
+        assignment_path = self.shard_directory / ASSIGNMENT_NAME
+        if not assignment_path.exists() or json.loads(assignment_path.read_text()) != assignment:
+            # the corpus or number of shards changed, finished shards can't be reused
+            shutil.rmtree(self.shard_directory, ignore_errors=True)
+            self.shard_directory.mkdir(parents=True)
+            for i, shard in enumerate(assignment["shards"]):
+                for speaker in shard:
+                    for audio, lab in speakers[speaker]:
+                        relative_path = Path(audio).relative_to(self.target_directory)
+                        corpus_path = self.corpus_directory(i) / relative_path
+                        corpus_path.parent.mkdir(parents=True, exist_ok=True)
+                        corpus_path.symlink_to(Path(audio).resolve())
+                        corpus_path.with_suffix(".lab").symlink_to(Path(lab).resolve())
+            assignment_path.write_text(json.dumps(assignment))
+        self.shards = assignment["shards"]
+
+    def corpus_directory(self, shard):
+        # MFA names its temporary directory after the corpus directory, so the name has to be unique
+        return self.shard_directory / f"{self.target_directory.name}_shard_{shard}"
+
+    def output_directory(self, shard):
+        return self.shard_directory / "output" / str(shard)
+
+    def done_path(self, shard):
+        return self.shard_directory / f"shard_{shard}{DONE_NAME}"
+
+    @property
+    def pending(self):
+        return [i for i in range(len(self.shards)) if not self.done_path(i).exists()]
+
+    def shard_command(self, shard):
+        """
+        Shell command which aligns ``shard`` and marks it as done.
+        """
+        self.output_directory(shard).mkdir(parents=True, exist_ok=True)
+        command = self.command(self.corpus_directory(shard), self.output_directory(shard), self.n_jobs)
+        return f"({command}) && touch {self.done_path(shard)}"
+
+    def write_commands(self, path):
+        """
+        Writes one command per pending shard to ``path``, e.g. to submit them as cluster jobs.
+        """
+        Path(path).write_text("\n".join(self.shard_command(i) for i in self.pending) + "\n")
+
+    def run(self, max_parallel=None, metrics=None):
+        """
+        Aligns all pending shards concurrently, raises an exception listing the shards that failed.
+        The command of each shard is added to ``metrics`` (see ``alignments.metrics``) as a stage, if given.
+        """
+        pending = self.pending
+        if len(pending) == 0:
+            return
+        def run_shard(shard):
+            start = time.perf_counter()
+            out = run_command(self.shard_command(shard))
+            if metrics is not None:
+                metrics.add_command(f"aligning shard {shard}", out, time.perf_counter() - start)
+            if out.returncode != 0:
+                print(f"[red]✕[/red] aligning shard {shard}")
+                return shard, out.stderr.decode()
+            print(f"[green]✓[/green] aligning shard {shard}")
+            return shard, None
+        with ThreadPoolExecutor(max_parallel or len(pending)) as executor:
+            errors = [x for x in executor.map(run_shard, pending) if x[1] is not None]
+        if len(errors) > 0:
+            raise Exception(
+                f"aligning shards {[x[0] for x in errors]} failed, finished shards are skipped when running again:\n"
+                + "\n".join(x[1] for x in errors)
+            )
+
+    def merge(self):
+        """
+        Copies the TextGrids of all shards to the target directory.
+        """
+        for i in range(len(self.shards)):
+            shutil.copytree(self.output_directory(i), self.target_directory, dirs_exist_ok=True)
@@ -0,0 +1,273 @@
+"""
+Export of aligned corpora to Arrow or Parquet shards, and reading them back.
+
+Items are streamed in batches into shards of a bounded size, one row per utterance with
+the columns ``key`` (the audio path relative to the target directory), ``speaker``,
+``transcript``, the list columns ``phone_starts``, ``phone_ends``, ``phones``,
+``word_starts``, ``word_ends`` and ``words``, and optionally ``audio`` (the bytes of the
+audio file). A ``manifest.json`` lists the shards. Shards can be copied as a few large
+files instead of a tree of audio, ``.lab`` and TextGrid files, and read without walking
+directories or parsing TextGrids: Arrow shards are memory-mapped without copying, Parquet
+shards are smaller but decoded when read.
+
+pyarrow is only needed for these functions, it is imported when they are called.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import json
+
+import numpy as np
+from tqdm.auto import tqdm
+
+from alignments.columnar import ColumnarData, _id_dtype
+from alignments.container import StringColumn
+
+MANIFEST_NAME = "manifest.json"
+SHARDS_VERSION = 1
+SHARD_FORMATS = ["parquet", "arrow"]
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+    except ImportError:
+        raise ImportError("exporting and reading shards requires pyarrow, install it with \"pip install pyarrow\"")
+    return pyarrow
+
+
+def _list_array(pa, offsets, values):
+    offsets = np.asarray(offsets, dtype=np.int64)
+    return pa.LargeListArray.from_arrays(pa.array(offsets - offsets[0]), values)
+
+
+def _batch(pa, data, start, end, vocab, word_vocab, audio, executor):
+    """
+    Record batch of items ``start`` to ``end`` of a ``ColumnarData``, ``vocab`` and ``word_vocab`` are its vocabularies as pyarrow arrays.
+    """
+    phone_offsets = np.asarray(data.phone_offsets[start:end + 1])
+    word_offsets = np.asarray(data.word_offsets[start:end + 1])
+    first_phone, last_phone = int(phone_offsets[0]), int(phone_offsets[-1])
+    first_word, last_word = int(word_offsets[0]), int(word_offsets[-1])
+    keys = [data.wavs[i] for i in range(start, end)]
+    columns = {
+        "key": pa.array(keys, type=pa.large_string()),
+        "speaker": pa.array([data.speakers[i] for i in np.asarray(data.speaker_ids[start:end]).tolist()], type=pa.large_string()),
+        "transcript": pa.array([data.transcripts[i] for i in range(start, end)], type=pa.large_string()),
+        "phone_starts": _list_array(pa, phone_offsets, pa.array(np.asarray(data.phone_starts[first_phone:last_phone], dtype=np.float32))),
+        "phone_ends": _list_array(pa, phone_offsets, pa.array(np.asarray(data.phone_ends[first_phone:last_phone], dtype=np.float32))),
+        "phones": _list_array(pa, phone_offsets, vocab.take(pa.array(np.asarray(data.phone_ids[first_phone:last_phone], dtype=np.int32)))),
+        "word_starts": _list_array(pa, word_offsets, pa.array(np.asarray(data.word_starts[first_word:last_word], dtype=np.float32))),
+        "word_ends": _list_array(pa, word_offsets, pa.array(np.asarray(data.word_ends[first_word:last_word], dtype=np.float32))),
+        "words": _list_array(pa, word_offsets, word_vocab.take(pa.array(np.asarray(data.word_ids[first_word:last_word], dtype=np.int32)))),
+    }
+    if audio:
+        paths = [data.target_directory / key for key in keys]
+        columns["audio"] = pa.array(list(executor.map(lambda path: Path(path).read_bytes(), paths)), type=pa.large_binary())
+    return pa.RecordBatch.from_arrays(list(columns.values()), names=list(columns))
+
+
+class _ShardWriter():
+    """
+    Writes record batches to shards of at most about ``max_shard_bytes`` (a shard holds at least one batch).
+    """
+    def __init__(self, pa, directory, format, max_shard_bytes, compression):
+        self.pa = pa
+        self.directory = Path(directory)
+        self.format = format
+        self.max_shard_bytes = max_shard_bytes
+        self.compression = compression
+        self.shards = []
+        self.sink = None
+        self.writer = None
+
+    def _open(self, schema):
+        name = f"shard_{len(self.shards):05d}.{self.format}"
+        self.sink = self.pa.OSFile(str(self.directory / name), "wb")
+        if self.format == "parquet":
+            import pyarrow.parquet as pq
+            self.writer = pq.ParquetWriter(self.sink, schema, compression=self.compression)
+        else:
+            self.writer = self.pa.ipc.new_file(self.sink, schema)
+        self.shards.append({"name": name, "rows": 0})
+
+    def write(self, batch):
+        if self.writer is not None and self.sink.tell() + batch.nbytes > self.max_shard_bytes:
+            self.close()
+        if self.writer is None:
+            self._open(batch.schema)
+        if self.format == "parquet":
+            self.writer.write_batch(batch, row_group_size=batch.num_rows)
+        else:
+            self.writer.write_batch(batch)
+        self.shards[-1]["rows"] += batch.num_rows
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.sink.close()
+            self.writer = None
+
+
+def export_shards(data, directory, format="parquet", audio=False, max_shard_bytes=2**30, batch_size=1000, compression="zstd", n_workers=16):
+    """
+    Streams the items of a ``ColumnarData`` into shards of at most about ``max_shard_bytes`` in ``directory``,
+    ``batch_size`` items at a time. With ``audio``, the audio files are read with ``n_workers`` threads and stored too.
+    ``compression`` is only used for Parquet shards. Returns the number of shards.
+    """
+    pa = _import_pyarrow()
+    if format not in SHARD_FORMATS:
+        raise ValueError(f"format must be one of {SHARD_FORMATS}")
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    (directory / MANIFEST_NAME).unlink(missing_ok=True)
+    for path in list(directory.glob(f"shard_*.{format}")):
+        path.unlink()
+    writer = _ShardWriter(pa, directory, format, max_shard_bytes, compression)
+    vocab = pa.array(list(data.vocab), type=pa.large_string())
+    word_vocab = pa.array(list(data.word_vocab), type=pa.large_string())
+    with ThreadPoolExecutor(max(1, n_workers)) as executor:
+        for start in tqdm(range(0, len(data), batch_size), desc=f"exporting {format} shards"):
+            writer.write(_batch(pa, data, start, min(start + batch_size, len(data)), vocab, word_vocab, audio, executor))
+    writer.close()
+    manifest = {
+        "version": SHARDS_VERSION,
+        "format": format,
+        "audio": audio,
+        "shards": writer.shards,
+    }
+    # written last, so shards without a manifest are recognisable as incomplete
+    (directory / MANIFEST_NAME).write_text(json.dumps(manifest, indent=2))
+    return len(writer.shards)
+
+
+def _numpy(array):
+    # zero-copy for arrays without nulls
+    return array.to_numpy(zero_copy_only=False)
+
+
+def _list_columns(table, name):
+    """
+    Offsets (starting at 0) and values of a list column as a numpy array and a pyarrow array.
+    """
+    column = table.column(name).combine_chunks()
+    offsets = _numpy(column.offsets).astype(np.int64)
+    return offsets - offsets[0], column.values.slice(int(offsets[0]), int(offsets[-1] - offsets[0]))
+
+
+def _string_column(array):
+    """
+    ``StringColumn`` of a large string array, sharing its buffer.
+    """
+    _, offsets, data = array.buffers()
+    offsets = np.frombuffer(offsets, dtype=np.int64)[array.offset:array.offset + len(array) + 1]
+    data = np.zeros(0, dtype=np.uint8) if data is None else np.frombuffer(data, dtype=np.uint8)
+    return StringColumn(offsets - offsets[0], data[offsets[0]:offsets[-1]])
+
+
+def _sorted_ids(values):
+    """
+    Ids of the strings in ``values`` into their sorted vocabulary, and the vocabulary.
+    """
+    encoded = values.dictionary_encode()
+    dictionary = encoded.dictionary.to_pylist()
+    positions = {x: i for i, x in enumerate(sorted(dictionary))}
+    remap = np.array([positions[x] for x in dictionary], dtype=np.int64)
+    return remap[_numpy(encoded.indices).astype(np.int64)], sorted(dictionary)
+
+
+class ShardedCorpus():
+    """
+    The shards in ``directory`` as one ``pyarrow.Table`` with only the given ``columns`` (all if None),
+    memory-mapped if ``memory_map``.
+    """
+    def __init__(self, directory, columns=None, memory_map=True):
+        pa = _import_pyarrow()
+        self.pa = pa
+        self.directory = Path(directory)
+        manifest_path = self.directory / MANIFEST_NAME
+        if not manifest_path.exists():
+            raise ValueError(f"{directory} contains no complete export, {MANIFEST_NAME} is missing")
+        self.manifest = json.loads(manifest_path.read_text())
+        if self.manifest.get("version") != SHARDS_VERSION:
+            raise ValueError(f"shards in {directory} were written by a different version")
+        tables = []
+        for shard in self.manifest["shards"]:
+            path = str(self.directory / shard["name"])
+            if self.manifest["format"] == "parquet":
+                import pyarrow.parquet as pq
+                tables.append(pq.read_table(path, columns=columns, memory_map=memory_map))
+            else:
+                source = pa.memory_map(path) if memory_map else pa.OSFile(path)
+                table = pa.ipc.open_file(source).read_all()
+                tables.append(table.select(columns) if columns is not None else table)
+        if len(tables) == 0:
+            raise ValueError(f"{directory} contains no shards")
+        self.table = pa.concat_tables(tables)
+        self.columns = self.table.column_names
+
+    def __len__(self):
+        return self.table.num_rows
+
+    def __getitem__(self, index):
+        """
+        The row ``index`` as a dict, with phones and words as ``(start, end, token)`` tuples if their columns were read.
+        """
+        row = {name: values[0] for name, values in self.table.slice(index, 1).to_pydict().items()}
+        for kind in ["phone", "word"]:
+            name = kind + "s"
+            if all(x in row for x in [f"{kind}_starts", f"{kind}_ends", name]):
+                row[name] = list(zip(row.pop(f"{kind}_starts"), row.pop(f"{kind}_ends"), row[name]))
+        return row
+
+    def audio_bytes(self, index):
+        if "audio" not in self.columns:
+            raise ValueError("the audio column was not exported or not read")
+        return self.table.column("audio")[index].as_py()
+
+    def to_columnar(self, target_directory, phones_format="tuples"):
+        """
+        Builds a ``ColumnarData`` of the shards, ``target_directory`` is the directory the keys are relative to.
+        Needs the ``key``, ``speaker`` and phone columns, transcripts and words are empty if their columns weren't read.
+        """
+        table = self.table
+        required = ["key", "speaker", "phone_starts", "phone_ends", "phones"]
+        missing = [x for x in required if x not in self.columns]
+        if len(missing) > 0:
+            raise ValueError(f"the columns {missing} are needed to build the data")
+        n = len(self)
+        speaker_ids, speakers = _sorted_ids(table.column("speaker").combine_chunks())
+        if "transcript" in self.columns:
+            transcripts = _string_column(table.column("transcript").combine_chunks())
+        else:
+            transcripts = StringColumn.from_strings([""] * n)
+        phone_offsets, starts = _list_columns(table, "phone_starts")
+        _, ends = _list_columns(table, "phone_ends")
+        _, phones = _list_columns(table, "phones")
+        phone_ids, vocab = _sorted_ids(phones)
+        if all(x in self.columns for x in ["word_starts", "word_ends", "words"]):
+            word_offsets, word_starts = _list_columns(table, "word_starts")
+            _, word_ends = _list_columns(table, "word_ends")
+            _, words = _list_columns(table, "words")
+            word_ids, word_vocab = _sorted_ids(words)
+            word_starts, word_ends = _numpy(word_starts), _numpy(word_ends)
+        else:
+            word_offsets = np.zeros(n + 1, dtype=np.int64)
+            word_starts, word_ends, word_ids, word_vocab = np.zeros(0, np.float32), np.zeros(0, np.float32), np.zeros(0, np.int64), []
+        return ColumnarData(
+            target_directory,
+            wavs=_string_column(table.column("key").combine_chunks()),
+            speakers=StringColumn.from_strings(speakers),
+            speaker_ids=speaker_ids.astype(np.int32),
+            transcripts=transcripts,
+            phone_offsets=phone_offsets,
+            phone_starts=_numpy(starts),
+            phone_ends=_numpy(ends),
+            phone_ids=phone_ids.astype(_id_dtype(len(vocab))),
+            vocab=vocab,
+            word_offsets=word_offsets,
+            word_starts=word_starts,
+            word_ends=word_ends,
+            word_ids=word_ids.astype(np.int32),
+            word_vocab=StringColumn.from_strings(word_vocab),
+            phones_format=phones_format,
+        )
@@ -0,0 +1,174 @@
+"""
+Corpus statistics computed from the columnar phone arrays of an ``AlignmentDataset``.
+
+All statistics are computed with NumPy reductions over all phones at once: counts,
+means and standard deviations with ``bincount``, percentiles per phone by sorting the
+durations grouped by phone once. Tokens in square brackets (``[SILENCE]`` and the
+punctuation tokens) are treated as pauses, all other tokens as speech.
+"""
+import hashlib
+
+import numpy as np
+
+from alignments.textgrids import ROUND_DIGITS
+
+STATS_NAME = ".alignments.stats"
+STATS_VERSION = 1
+PERCENTILES = [1, 5, 10, 25, 50, 75, 90, 95, 99]
+
+
+def data_signature(data):
+    """
+    Hash of the phones and audio paths of a ``ColumnarData``, stats are recomputed when it changes.
+    """
+    sha = hashlib.sha1(data.signature().encode("utf-8"))
+    sha.update("\n".join(data.vocab).encode("utf-8"))
+    for array in [data.phone_offsets, data.phone_ends, data.phone_ids, data.speaker_ids]:
+        sha.update(np.ascontiguousarray(array).tobytes())
+    return sha.hexdigest()
+
+
+def phone_durations_seconds(data):
+    """
+    Durations in seconds of all phones of a ``ColumnarData``.
+    """
+    starts = np.round(np.asarray(data.phone_starts, dtype=np.float64), ROUND_DIGITS)
+    ends = np.round(np.asarray(data.phone_ends, dtype=np.float64), ROUND_DIGITS)
+    return np.round(ends - starts, ROUND_DIGITS)
+
+
+def grouped_percentiles(values, groups, n_groups, percentiles=PERCENTILES):
+    """
+    Percentiles of ``values`` for each group (with linear interpolation, like ``np.percentile``),
+    returns an array of shape (n_groups, len(percentiles)) which is nan for empty groups.
+    """
+    order = np.lexsort((values, groups))
+    values = values[order]
+    counts = np.bincount(groups, minlength=n_groups)
+    first = np.cumsum(counts) - counts
+    result = np.full((n_groups, len(percentiles)), np.nan)
+    nonempty = counts > 0
+    for j, q in enumerate(percentiles):
+        position = first[nonempty] + q / 100 * (counts[nonempty] - 1)
+        low = np.floor(position).astype(np.int64)
+        high = np.ceil(position).astype(np.int64)
+        result[nonempty, j] = values[low] + (values[high] - values[low]) * (position - low)
+    return result
+
+
+class CorpusStats():
+    """
+    Phone and speaker statistics of a dataset, see ``AlignmentDataset.stats``.
+
+    Per phone (in the order of ``vocab``): ``phone_counts``, ``phone_means``, ``phone_stds`` and
+    ``phone_percentiles`` of the durations in seconds, and ``phone_zeros``, the number of phones of length 0.
+    Per speaker (in the order of ``speakers``): ``speaker_items``, ``speaker_seconds`` (total duration),
+    ``speaker_speech_seconds`` and ``speaker_phones`` (excluding pauses) and ``speaker_rates`` (phones per second of speech).
+    """
+    def __init__(self, vocab, speakers, percentiles, arrays):
+        self.vocab = list(vocab)
+        self.speakers = list(speakers)
+        self.percentiles = list(percentiles)
+        self.token_to_id = {token: i for i, token in enumerate(self.vocab)}
+        self.speaker_to_id = {speaker: i for i, speaker in enumerate(self.speakers)}
+        for name, array in arrays.items():
+            setattr(self, name, array)
+        self.arrays = arrays
+
+    @classmethod
+    def compute(cls, data, percentiles=PERCENTILES):
+        """
+        Computes the statistics of a ``ColumnarData``.
+        """
+        n_tokens, n_speakers = len(data.vocab), len(data.speakers)
+        durations = phone_durations_seconds(data)
+        phone_ids = np.asarray(data.phone_ids, dtype=np.int64)
+        offsets = np.asarray(data.phone_offsets, dtype=np.int64)
+        speaker_ids = np.asarray(data.speaker_ids, dtype=np.int64)
+        lengths = np.diff(offsets)
+        counts = np.bincount(phone_ids, minlength=n_tokens)
+        sums = np.bincount(phone_ids, weights=durations, minlength=n_tokens)
+        squares = np.bincount(phone_ids, weights=durations ** 2, minlength=n_tokens)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            means = sums / counts
+            stds = np.sqrt(np.maximum(squares / counts - means ** 2, 0))
+        is_speech = np.array([not x.startswith("[") for x in data.vocab], dtype=bool)
+        phone_speakers = np.repeat(speaker_ids, lengths)
+        speech = is_speech[phone_ids] if len(phone_ids) > 0 else np.zeros(0, dtype=bool)
+        item_seconds = np.zeros(len(lengths))
+        item_seconds[lengths > 0] = np.round(np.asarray(data.phone_ends, dtype=np.float64)[offsets[1:][lengths > 0] - 1], ROUND_DIGITS)
+        speaker_phones = np.bincount(phone_speakers[speech], minlength=n_speakers)
+        speaker_speech_seconds = np.bincount(phone_speakers, weights=durations * speech, minlength=n_speakers)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            speaker_rates = speaker_phones / speaker_speech_seconds
+        arrays = {
+            "phone_counts": counts,
+            "phone_means": means,
+            "phone_stds": stds,
+            "phone_percentiles": grouped_percentiles(durations, phone_ids, n_tokens, percentiles),
+            "phone_zeros": np.bincount(phone_ids[durations == 0], minlength=n_tokens),
+            "speaker_items": np.bincount(speaker_ids, minlength=n_speakers),
+            "speaker_seconds": np.bincount(speaker_ids, weights=item_seconds, minlength=n_speakers),
+            "speaker_speech_seconds": speaker_speech_seconds,
+            "speaker_phones": speaker_phones,
+            "speaker_rates": speaker_rates,
+        }
+        return cls(data.vocab, list(data.speakers), percentiles, arrays)
+
+    def phone(self, token):
+        """
+        Duration statistics of ``token`` as a dict.
+        """
+        i = self.token_to_id[token]
+        return {
+            "count": int(self.phone_counts[i]),
+            "mean": float(self.phone_means[i]),
+            "std": float(self.phone_stds[i]),
+            "zeros": int(self.phone_zeros[i]),
+            "percentiles": dict(zip(self.percentiles, self.phone_percentiles[i].tolist())),
+        }
+
+    def speaker(self, speaker):
+        """
+        Statistics of ``speaker`` (as in ``item["speaker"]``, relative to the target directory) as a dict.
+        """
+        i = self.speaker_to_id[str(speaker)]
+        return {
+            "items": int(self.speaker_items[i]),
+            "seconds": float(self.speaker_seconds[i]),
+            "speech_seconds": float(self.speaker_speech_seconds[i]),
+            "phones": int(self.speaker_phones[i]),
+            "rate": float(self.speaker_rates[i]),
+        }
+
+    def pauses(self):
+        """
+        Statistics of the silence and punctuation tokens, as a dict of token -> ``phone(token)``.
+        """
+        return {token: self.phone(token) for token in self.vocab if token.startswith("[")}
+
+    def zscores(self, phone_ids, durations):
+        """
+        Z-scores of phone ``durations`` (in seconds) given their ``phone_ids``, e.g. to find outliers.
+        """
+        phone_ids = np.asarray(phone_ids, dtype=np.int64)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return (np.asarray(durations, dtype=np.float64) - self.phone_means[phone_ids]) / self.phone_stds[phone_ids]
+
+    def to_meta(self, signature):
+        return {
+            "version": STATS_VERSION,
+            "signature": signature,
+            "vocab": self.vocab,
+            "speakers": self.speakers,
+            "percentiles": self.percentiles,
+        }
+
+    @classmethod
+    def from_container(cls, meta, arrays, signature):
+        """
+        Returns the stats stored in a container, or None if they were computed for different data.
+        """
+        if meta.get("version") != STATS_VERSION or meta.get("signature") != signature:
+            return None
+        return cls(meta["vocab"], meta["speakers"], meta["percentiles"], arrays)
@@ -0,0 +1,119 @@
+"""
+Fast reader for Praat TextGrids as produced by the Montreal Forced Aligner.
+
+Instead of building a tree of ``Interval`` objects like ``textgrid.TextGrid.fromFile``,
+the file is tokenised with a single regular expression and each tier is returned as
+flat ``starts``, ``ends`` and ``marks`` lists. Both the long and the short text format
+are supported, anything else falls back to the ``textgrid`` package.
+"""
+import re
+
+# values in the long format always follow a "key = ", strings may contain escaped quotes ("") and newlines
+_LONG_VALUE = re.compile(r'=[ \t]*("(?:[^"]|"")*"|[^\s"]+)')
+_SHORT_VALUE = re.compile(r'"(?:[^"]|"")*"|[^\s"]+')
+_HEADER = re.compile(r'\s*File type\s*=\s*"ooTextFile[^"]*"\s*Object class\s*=\s*"TextGrid"')
+_LONG_FORMAT = re.compile(r"^\s*xmin\s*=", re.M)
+
+# the textgrid package rounds all times to this precision, we do the same so both readers agree
+ROUND_DIGITS = 5
+
+
+def _decode(raw):
+    if raw.startswith(b"\xff\xfe") or raw.startswith(b"\xfe\xff"):
+        return raw.decode("utf-16")
+    return raw.decode("utf-8-sig")
+
+
+def _unquote(value):
+    if len(value) < 2 or value[0] != '"' or value[-1] != '"':
+        raise ValueError(f"expected a string, got {value[:20]}")
+    return value[1:-1].replace('""', '"')
+
+
+def _parse(text, n_tiers, round_digits):
+    header = _HEADER.match(text)
+    if header is None:
+        raise ValueError("not a TextGrid")
+    if _LONG_FORMAT.search(text, header.end(), header.end() + 256):
+        values = _LONG_VALUE.findall(text, header.end())
+    else:
+        values = [x for x in _SHORT_VALUE.findall(text, header.end()) if x != "<exists>"]
+    # values: xmin, xmax, size, then the tiers
+    size = int(values[2])
+    if n_tiers is not None:
+        size = min(size, n_tiers)
+    tiers = []
+    i = 3
+    for _ in range(size):
+        tier_class = _unquote(values[i])
+        name = _unquote(values[i + 1])
+        n = int(values[i + 4])
+        i += 5
+        if tier_class == "IntervalTier":
+            block = values[i:i + 3 * n]
+            starts = [round(float(x), round_digits) for x in block[0::3]]
+            ends = [round(float(x), round_digits) for x in block[1::3]]
+            marks = [_unquote(x) for x in block[2::3]]
+            i += 3 * n
+            # skip empty intervals, like the textgrid package does
+            keep = [j for j in range(n) if starts[j] < ends[j]]
+            if len(keep) < n:
+                starts = [starts[j] for j in keep]
+                ends = [ends[j] for j in keep]
+                marks = [marks[j] for j in keep]
+        elif tier_class == "TextTier":
+            block = values[i:i + 2 * n]
+            starts = [round(float(x), round_digits) for x in block[0::2]]
+            ends = starts
+            marks = [_unquote(x) for x in block[1::2]]
+            i += 2 * n
+        else:
+            raise ValueError(f"unknown tier class {tier_class}")
+        if len(marks) != len(starts):
+            raise ValueError("TextGrid is truncated")
+        tiers.append((name, starts, ends, marks))
+    return tiers
+
+
+def read_tiers_fast(path, n_tiers=None, round_digits=ROUND_DIGITS):
+    """
+    Reads the first ``n_tiers`` tiers (or all tiers) of the TextGrid at ``path``.
+    Returns a list of ``(name, starts, ends, marks)`` tuples, raises ``ValueError`` for files it cannot parse.
+    """
+    with open(path, "rb") as f:
+        text = _decode(f.read())
+    try:
+        return _parse(text, n_tiers, round_digits)
+    except IndexError:
+        raise ValueError(f"{path} is truncated")
+
+
+def read_tiers_textgrid(path, n_tiers=None):
+    """
+    Same as ``read_tiers_fast``, but uses the ``textgrid`` package.
+    """
+    import textgrid
+    grid = textgrid.TextGrid.fromFile(str(path))
+    tiers = []
+    for tier in grid.tiers[:n_tiers]:
+        if isinstance(tier, textgrid.PointTier):
+            starts = [x.time for x in tier]
+            tiers.append((tier.name, starts, starts, [x.mark for x in tier]))
+        else:
+            tiers.append((
+                tier.name,
+                [x.minTime for x in tier],
+                [x.maxTime for x in tier],
+                [x.mark for x in tier],
+            ))
+    return tiers
+
+
+def read_tiers(path, n_tiers=None):
+    """
+    Reads the tiers of a TextGrid with ``read_tiers_fast``, falling back to the ``textgrid`` package.
+    """
+    try:
+        return read_tiers_fast(path, n_tiers)
+    except (ValueError, UnicodeDecodeError):
+        return read_tiers_textgrid(path, n_tiers)
@@ -0,0 +1,74 @@
+from pathlib import Path
+import argparse
+import random
+import tempfile
+import time
+
+from alignments.textgrids import read_tiers_fast, read_tiers_textgrid
+
+PHONES = ["AA1", "AE1", "AH0", "B", "D", "DH", "EH1", "ER0", "HH", "IH0", "K", "L", "N", "OW1", "S", "T", "W", "Z"]
+
+def write_textgrid(path, n_words, rng):
+    """
+    Writes a long-format TextGrid with a words and a phones tier, like the ones produced by MFA.
+    """
+    words, phones = [], []
+    time = 0.0
+    for _ in range(n_words):
+        word_start = time
+        for _ in range(rng.randint(2, 6)):
+            end = round(time + rng.uniform(0.03, 0.15), 3)
+            phones.append((time, end, rng.choice(PHONES)))
+            time = end
+        words.append((word_start, time, "word"))
+        if rng.random() < 0.3:
+            end = round(time + rng.uniform(0.05, 0.3), 3)
+            words.append((time, end, ""))
+            phones.append((time, end, ""))
+            time = end
+    lines = [
+        'File type = "ooTextFile"', 'Object class = "TextGrid"', '',
+        'xmin = 0', f'xmax = {time}', 'tiers? <exists>', 'size = 2', 'item []:',
+    ]
+    for i, (name, intervals) in enumerate([("words", words), ("phones", phones)]):
+        lines += [
+            f'    item [{i + 1}]:', '        class = "IntervalTier"', f'        name = "{name}"',
+            '        xmin = 0', f'        xmax = {time}', f'        intervals: size = {len(intervals)}',
+        ]
+        for j, (start, end, mark) in enumerate(intervals):
+            lines += [
+                f'        intervals [{j + 1}]:', f'            xmin = {start}',
+                f'            xmax = {end}', f'            text = "{mark}"',
+            ]
+    Path(path).write_text("\n".join(lines) + "\n")
+
+def benchmark(files, reader):
+    start = time.perf_counter()
+    for file in files:
+        reader(file, 2)
+    return time.perf_counter() - start
+
+if __name__ == "__main__":
+    # get args
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--path', type=str, default=None, help="directory with TextGrids, a synthetic corpus is generated if omitted")
+    parser.add_argument('--num_files', type=int, default=5000)
+    parser.add_argument('--num_words', type=int, default=20)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.path is None:
+            rng = random.Random(0)
+            for i in range(args.num_files):
+                write_textgrid(Path(tmp) / f"{i}.TextGrid", args.num_words, rng)
+            path = tmp
+        else:
+            path = args.path
+        files = sorted(Path(path).glob('**/*.TextGrid'))[:args.num_files]
+        for file in files[:100]:
+            assert read_tiers_fast(file, 2) == read_tiers_textgrid(file, 2), f"readers disagree on {file}"
+        fast = benchmark(files, read_tiers_fast)
+        slow = benchmark(files, read_tiers_textgrid)
+        print(f"{len(files)} files")
+        print(f"textgrid package: {slow:.2f}s ({slow / len(files) * 1000:.3f}ms per file)")
+        print(f"alignments.textgrids: {fast:.2f}s ({fast / len(files) * 1000:.3f}ms per file)")
+        print(f"speedup: {slow / fast:.1f}x")
@@ -3,8 +3,11 @@ import os
 import tarfile
 import shutil
 import argparse
+import multiprocessing
 from tqdm.auto import tqdm
 
+from alignments.archive import pack_alignments
+
 def tar_textgrids(path, archive_path):
     path = Path(path)
     archive_path = Path(archive_path)
@@ -15,11 +18,25 @@ def tar_textgrids(path, archive_path):
         for file in tqdm(path.glob('**/*.TextGrid')):
             tar.add(file, arcname=file.name)
 
+def pack_textgrids(path, archive_path, n_workers):
+    archive_path = Path(archive_path)
+    if archive_path.is_file():
+        print(f"{archive_path} already exists. Skipping.")
+        return
+    n = pack_alignments(path, archive_path, n_workers)
+    print(f"packed {n} TextGrids into {archive_path}")
+
 if __name__ == "__main__":
     # get args
     parser = argparse.ArgumentParser()
     parser.add_argument('--path', type=str, required=True)
     parser.add_argument('--archive_path', type=str, required=True)
+    parser.add_argument('--format', type=str, default="tar", choices=["tar", "alignments"])
+    parser.add_argument('--n_workers', type=int, default=multiprocessing.cpu_count())
     args = parser.parse_args()
-    # tar textgrids
-    tar_textgrids(args.path, args.archive_path)
\ No newline at end of file
+    if args.format == "alignments":
+        # pack textgrids into an alignment archive (use .alignments as suffix to use it as textgrid_url)
+        pack_textgrids(args.path, args.archive_path, args.n_workers)
+    else:
+        # tar textgrids
+        tar_textgrids(args.path, args.archive_path)
@@ -15,7 +15,13 @@ INSTALL_REQUIRES = [
     "librosa>=0.9.2",
     "soundfile>=0.12.1",
     "torchaudio>=0.9.0",
+    "scipy>=1.2.0",
 ]
+EXTRAS_REQUIRE = {
+    'shards': [
+        'pyarrow>=10.0.0',
+    ],
+}
 
 setup_kwargs = {
     'name': 'alignments',
@@ -33,6 +39,7 @@ setup_kwargs = {
     ],
     'package_data': {'': ['*']},
     'install_requires': INSTALL_REQUIRES,
+    'extras_require': EXTRAS_REQUIRE,
     'python_requires': '>=3.6',
 
 }
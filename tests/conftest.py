@@ -0,0 +1,130 @@
+import random
+import stat
+from pathlib import Path
+
+import numpy as np
+import pytest
+import soundfile as sf
+
+from alignments.dataset import AlignmentDataset
+
+SAMPLING_RATE = 16000
+WORDS = {
+    "hello": ["HH", "AH0", "L", "OW1"],
+    "world": ["W", "ER1", "L", "D"],
+    "the": ["DH", "AH0"],
+    "cat": ["K", "AE1", "T"],
+    "sat": ["S", "AE1", "T"],
+}
+
+
+def format_textgrid(tiers, xmax):
+    lines = [
+        'File type = "ooTextFile"', 'Object class = "TextGrid"', "",
+        "xmin = 0 ", f"xmax = {xmax} ", "tiers? <exists> ", f"size = {len(tiers)} ", "item []: ",
+    ]
+    for i, (name, intervals) in enumerate(tiers):
+        lines += [
+            f"    item [{i + 1}]:", '        class = "IntervalTier" ', f'        name = "{name}" ',
+            "        xmin = 0 ", f"        xmax = {xmax} ", f"        intervals: size = {len(intervals)} ",
+        ]
+        for j, (start, end, text) in enumerate(intervals):
+            lines += [
+                f"        intervals [{j + 1}]:", f"            xmin = {start} ",
+                f"            xmax = {end} ", f'            text = "{text}" ',
+            ]
+    return "\n".join(lines) + "\n"
+
+
+def make_corpus(directory, n_items=20, n_speakers=4, seed=0, textgrids=True):
+    """
+    Writes ``n_items`` utterances of noise with a .lab file and (if ``textgrids``) a TextGrid
+    to ``directory/<speaker>/``, returns their audio paths.
+    """
+    rng = random.Random(seed)
+    noise = np.random.default_rng(seed)
+    paths = []
+    for i in range(n_items):
+        speaker = f"spk{i % n_speakers}"
+        words = [rng.choice(list(WORDS)) for _ in range(rng.randint(2, 6))]
+        time = 0.1
+        word_tier, phone_tier = [(0, time, "")], [(0, time, "")]
+        for word in words:
+            start = time
+            for phone in WORDS[word]:
+                end = round(time + rng.choice([0.05, 0.07, 0.11]), 2)
+                phone_tier.append((time, end, phone))
+                time = end
+            word_tier.append((start, time, word))
+            if rng.random() < 0.5:
+                end = round(time + 0.05, 2)
+                word_tier.append((time, end, ""))
+                phone_tier.append((time, end, ""))
+                time = end
+        end = round(time + 0.1, 2)
+        word_tier.append((time, end, ""))
+        phone_tier.append((time, end, ""))
+        path = Path(directory) / speaker / f"{speaker}_{i:05d}.wav"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        sf.write(str(path), noise.uniform(-0.5, 0.5, int(end * SAMPLING_RATE)).astype(np.float32), SAMPLING_RATE)
+        path.with_suffix(".lab").write_text(" ".join(words).upper() + ".")
+        if textgrids:
+            path.with_suffix(".TextGrid").write_text(format_textgrid([("words", word_tier), ("phones", phone_tier)], end))
+        paths.append(path)
+    return paths
+
+
+class LocalDataset(AlignmentDataset):
+    def collect_data(self, directory):
+        for path in sorted(Path(directory).glob("*/*.wav")):
+            yield {
+                "path": path,
+                "speaker": path.parent.name,
+                "transcript": path.with_suffix(".lab").read_text(),
+            }
+
+
+@pytest.fixture
+def aligned_corpus(tmp_path):
+    """
+    Target directory of an aligned corpus.
+    """
+    directory = tmp_path / "corpus"
+    make_corpus(directory)
+    return directory
+
+
+@pytest.fixture
+def dataset(aligned_corpus, tmp_path):
+    return LocalDataset(target_directory=aligned_corpus, n_workers=2, tmp_directory=tmp_path / "tmp")
+
+
+STUB_MFA = """#!/bin/sh
+# logs every call, "g2p" spells words as phones and "align" copies the TextGrids in {grids}
+echo "$@" >> {log}
+if [ "$1" = g2p ]; then
+  awk '{{print $1 "\\t" toupper($1)}}' "$3" > "$4"
+elif [ "$1" = align ]; then
+  case "$2" in *_shard_$STUB_MFA_FAIL) exit 1;; esac
+  cd "$2" && find -L . -name '*.lab' | while read lab; do
+    mkdir -p "$5/$(dirname "$lab")" && cp "{grids}/${{lab%.lab}}.TextGrid" "$5/$(dirname "$lab")/" || exit 1
+  done
+fi
+"""
+
+
+@pytest.fixture
+def stub_mfa(tmp_path, monkeypatch):
+    """
+    Installs a stub MFA through ALIGNMENTS_MFA which "aligns" the corpus of ``make_corpus`` in ``tmp_path / "grids"``,
+    returns the path of the log of its calls.
+    """
+    grids, log = tmp_path / "grids", tmp_path / "mfa_calls.log"
+    make_corpus(grids)
+    stub = tmp_path / "mfa_stub.sh"
+    stub.write_text(STUB_MFA.format(grids=grids, log=log))
+    stub.chmod(stub.stat().st_mode | stat.S_IEXEC)
+    monkeypatch.setenv("ALIGNMENTS_MFA", str(stub))
+    monkeypatch.setenv("STUB_MFA_FAIL", "none")
+    log.touch()
+    return log
@@ -0,0 +1,179 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from zipfile import ZipFile
+import hashlib
+import io
+import os
+import tarfile
+import threading
+
+import pytest
+
+from alignments import download
+from alignments.download import download_and_extract, download_file, stream_extract
+from conftest import LocalDataset, make_corpus
+
+
+class Server():
+    """
+    Serves ``files`` (name -> bytes) with range requests. The first request of a name in ``drop``
+    is closed after ``drop[name]`` bytes.
+    """
+    def __init__(self, files, drop=None):
+        self.files = files
+        self.drop = dict(drop or {})
+        self.requests = []
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _headers(self, status, length, extra=()):
+                self.send_response(status)
+                self.send_header("Content-Length", str(length))
+                self.send_header("Accept-Ranges", "bytes")
+                for name, value in extra:
+                    self.send_header(name, value)
+                self.end_headers()
+
+            def do_HEAD(self):
+                self._headers(200, len(server.files[self.path.lstrip("/")]))
+
+            def do_GET(self):
+                name = self.path.lstrip("/")
+                data = server.files[name]
+                server.requests.append((name, self.headers.get("Range")))
+                start, end = 0, len(data)
+                if self.headers.get("Range") is not None:
+                    first, last = self.headers["Range"].split("=")[1].split("-")
+                    start, end = int(first), int(last) + 1 if last else len(data)
+                    self._headers(206, end - start, [("Content-Range", f"bytes {start}-{end - 1}/{len(data)}")])
+                else:
+                    self._headers(200, len(data))
+                if name in server.drop:
+                    self.wfile.write(data[start:start + server.drop.pop(name)])
+                    self.close_connection = True
+                    return
+                self.wfile.write(data[start:end])
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+
+    def url(self, name):
+        return f"http://127.0.0.1:{self.httpd.server_address[1]}/{name}"
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@pytest.fixture(autouse=True)
+def no_retry_delay(monkeypatch):
+    monkeypatch.setattr(download, "RETRY_DELAY", 0)
+
+
+def archive_files():
+    # incompressible contents, so the archives are large enough to be cut in the middle
+    return {f"spk{i}/utt_{i}.lab": os.urandom(50_000) for i in range(8)}
+
+
+def tar_gz(files):
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w:gz") as archive:
+        for name, data in files.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            archive.addfile(info, io.BytesIO(data))
+    return buffer.getvalue()
+
+
+def zip_file(files):
+    buffer = io.BytesIO()
+    with ZipFile(buffer, "w") as archive:
+        for name, data in files.items():
+            archive.writestr(name, data)
+    return buffer.getvalue()
+
+
+def read_tree(directory):
+    return {str(x.relative_to(directory)): x.read_bytes() for x in directory.rglob("*") if x.is_file()}
+
+
+def test_dropped_connection_is_resumed(tmp_path):
+    files = archive_files()
+    archive = tar_gz(files)
+    server = Server({"corpus.tar.gz": archive}, drop={"corpus.tar.gz": len(archive) // 3})
+    try:
+        n_bytes = stream_extract(server.url("corpus.tar.gz"), tmp_path / "corpus", hashlib.sha256(archive).hexdigest())
+    finally:
+        server.close()
+    assert n_bytes == len(archive)
+    assert read_tree(tmp_path / "corpus") == files
+    assert server.requests == [("corpus.tar.gz", None), ("corpus.tar.gz", f"bytes={len(archive) // 3}-")]
+
+
+def test_bad_sha256_removes_partial_output(tmp_path):
+    files = archive_files()
+    server = Server({"corpus.tar.gz": tar_gz(files), "corpus.zip": zip_file(files)})
+    try:
+        with pytest.raises(ValueError, match="checksum"):
+            stream_extract(server.url("corpus.tar.gz"), tmp_path / "corpus", "0" * 64)
+        with pytest.raises(ValueError, match="checksum"):
+            download_and_extract(server.url("corpus.zip"), tmp_path / "corpus", tmp_path / "downloads", "0" * 64, n_connections=3)
+    finally:
+        server.close()
+    assert not (tmp_path / "corpus").exists()
+    assert list(tmp_path.iterdir()) == [tmp_path / "downloads"]
+    assert list((tmp_path / "downloads").iterdir()) == []
+
+
+def test_zip_over_several_connections(tmp_path):
+    files = archive_files()
+    archive = zip_file(files)
+    sha256 = hashlib.sha256(archive).hexdigest()
+    # the second range is dropped once and continued
+    server = Server({"corpus.zip": archive})
+    try:
+        single = download_file(server.url("corpus.zip"), tmp_path / "single.zip", sha256)
+        server.requests.clear()
+        server.drop["corpus.zip"] = 1000
+        parallel = download_file(server.url("corpus.zip"), tmp_path / "parallel.zip", sha256, n_connections=4)
+        requests = list(server.requests)
+        download_and_extract(server.url("corpus.zip"), tmp_path / "corpus", tmp_path / "downloads", sha256, n_connections=4)
+    finally:
+        server.close()
+    assert parallel.read_bytes() == single.read_bytes() == archive
+    assert len([x for x in requests if x[1] is not None]) == 5
+    assert sorted(tmp_path.glob(".*.part")) == []
+    assert read_tree(tmp_path / "corpus") == files
+
+
+def test_dataset_from_urls(tmp_path, stub_mfa):
+    make_corpus(tmp_path / "corpus", textgrids=False)
+    source = tar_gz(read_tree(tmp_path / "corpus"))
+    # TextGrids without speaker directories, the dataset moves them into them
+    grids = zip_file({x.name: x.read_bytes() for x in (tmp_path / "grids").glob("*/*.TextGrid")})
+    server = Server({"corpus.tar.gz": source, "grids.zip": grids})
+    try:
+        dataset = LocalDataset(
+            target_directory=tmp_path / "target",
+            source_directory=tmp_path / "source",
+            source_url=server.url("corpus.tar.gz"),
+            source_sha256=hashlib.sha256(source).hexdigest(),
+            textgrid_url=server.url("grids.zip"),
+            textgrid_sha256=hashlib.sha256(grids).hexdigest(),
+            tmp_directory=tmp_path / "tmp",
+            n_workers=2,
+            download_connections=2,
+            g2p_cache=tmp_path / "g2p.sqlite",
+        )
+    finally:
+        server.close()
+    assert read_tree(tmp_path / "source") == read_tree(tmp_path / "corpus")
+    assert not any(x.startswith("align") for x in stub_mfa.read_text().splitlines())
+    assert len(dataset) == 20
+    reference = LocalDataset(target_directory=tmp_path / "grids", n_workers=2, use_index=False)
+    assert [x["phones"] for x in dataset] == [x["phones"] for x in reference]
@@ -0,0 +1,94 @@
+import numpy as np
+import pytest
+
+from alignments import features
+from alignments.audio_store import load_audio
+from alignments.container import read_container, write_container
+from alignments.features import FeatureStore, compute_features, extract_features, feature_config, features_directory, phones_crc
+from conftest import LocalDataset, make_corpus, SAMPLING_RATE
+
+CONFIG = feature_config(SAMPLING_RATE, n_fft=512, hop_length=160, n_mels=40)
+
+
+def corpus_items(tmp_path):
+    paths = make_corpus(tmp_path / "corpus")
+    dataset = LocalDataset(target_directory=tmp_path / "corpus", n_workers=2, tmp_directory=tmp_path / "tmp")
+    return [(dataset.data.wavs[i], dataset[i]["wav"], dataset.phone_arrays(i)[1]) for i in range(len(dataset))]
+
+
+def assert_features(store, items):
+    rows = store.rows([key for key, _, _ in items], [phones_crc(ends) for _, _, ends in items])
+    assert (rows >= 0).all()
+    for row, (_, path, ends) in zip(rows, items):
+        frames, phones = compute_features(load_audio(path, SAMPLING_RATE)[0], ends, CONFIG)
+        assert np.array_equal(store.frames(row), frames)
+        assert np.array_equal(store.phones(row), phones)
+        assert store.mel(row).shape == (len(frames), CONFIG["n_mels"])
+
+
+FAIL_PATH = None
+
+
+def failing_extract(args):
+    if args[0] == FAIL_PATH:
+        raise RuntimeError("interrupted")
+    return features.compute_features(load_audio(args[0], args[2]["sampling_rate"])[0], args[1], args[2])
+
+
+def test_interrupted_extraction_resumes(tmp_path, monkeypatch):
+    items = corpus_items(tmp_path)
+    directory = tmp_path / "features"
+    # worker processes are forked, so they run the patched function and fail at the 13th item
+    monkeypatch.setattr(features, "_extract", failing_extract)
+    monkeypatch.setitem(globals(), "FAIL_PATH", str(items[12][1]))
+    with pytest.raises(RuntimeError, match="interrupted"):
+        extract_features(items, directory, CONFIG, n_workers=1, chunk_size=1, flush_every=5)
+    monkeypatch.undo()
+    store = FeatureStore.open(directory, CONFIG)
+    assert len(store) == 10
+    keys, crcs = [key for key, _, _ in items], [phones_crc(ends) for _, _, ends in items]
+    todo = np.flatnonzero(store.rows(keys, crcs) < 0).tolist()
+    assert todo == list(range(10, 20))
+    store = extract_features([items[i] for i in todo], directory, CONFIG, n_workers=2, chunk_size=1, flush_every=5)
+    assert len(store) == 20
+    assert_features(store, items)
+    # rows appended after the last flush of the interrupted run were overwritten, not kept
+    n_frames = store.arrays["frame_lengths"].sum()
+    assert (directory / "frames_00000.bin").stat().st_size == n_frames * 4 * (CONFIG["n_mels"] + 2)
+
+
+def test_changed_phones_are_extracted_again(tmp_path):
+    items = corpus_items(tmp_path)
+    directory = tmp_path / "features"
+    store = extract_features(items, directory, CONFIG, n_workers=2)
+    key, path, ends = items[4]
+    realigned = ends.copy()
+    realigned[1] += 0.03
+    changed = items[:4] + [(key, path, realigned)] + items[5:]
+    rows = store.rows([x[0] for x in changed], [phones_crc(x[2]) for x in changed])
+    assert np.flatnonzero(rows < 0).tolist() == [4]
+    store = extract_features([changed[4]], directory, CONFIG, n_workers=1)
+    assert len(store) == 21
+    assert_features(store, changed)
+    assert FeatureStore.open(directory, feature_config(SAMPLING_RATE, n_fft=1024)) is None
+
+
+def test_dataset_items_contain_features(tmp_path):
+    make_corpus(tmp_path / "corpus")
+    kwargs = dict(target_directory=tmp_path / "corpus", n_workers=2, tmp_directory=tmp_path / "tmp")
+    settings = {"sampling_rate": SAMPLING_RATE, "n_fft": 512, "hop_length": 160, "n_mels": 40}
+    dataset = LocalDataset(**kwargs, features=settings)
+    item = dataset[7]
+    frames, phones = compute_features(load_audio(item["wav"], SAMPLING_RATE)[0], dataset.phone_arrays(7)[1], CONFIG)
+    assert np.array_equal(item["mel"], frames[:, :40]) and np.array_equal(item["phone_pitch"], phones[:, 0])
+    assert len(item["phone_energy"]) == len(item["phones"])
+    # a second dataset opens the stored features without extracting anything
+    again = LocalDataset(**kwargs, features=settings)
+    assert not any(x.name == "features" for x in again.metrics.stages)
+    assert np.array_equal(again[7]["mel"], item["mel"])
+    # a store whose index was written with another config is not silently reused
+    directory = features_directory(kwargs["target_directory"], again.feature_store.config)
+    meta, arrays = read_container(directory / "index", mmap=False)
+    write_container(directory / "index", {"config": dict(meta["config"], n_fft=1024)}, arrays)
+    with pytest.raises(ValueError, match=str(directory)):
+        again.extract_features(**settings)
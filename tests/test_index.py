@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+
+from alignments import container, dataset as dataset_module
+from alignments.index import PARSER_VERSION, index_path, load_index
+from conftest import LocalDataset
+
+
+def parsed_files(dataset):
+    # the load stage counts one file when the index is used and every parsed triple otherwise
+    return next(x.files for x in dataset.metrics.stages if x.name == "load")
+
+
+def reopen(dataset, **kwargs):
+    return LocalDataset(target_directory=dataset.target_directory, n_workers=2, tmp_directory=dataset.tmp_directory, **kwargs)
+
+
+def fail_writes(monkeypatch):
+    # chmod doesn't stop root, so writing fails like it does on a read-only directory
+    def write_container(path, meta, arrays):
+        raise PermissionError(f"read-only: {path}")
+    monkeypatch.setattr(container, "write_container", write_container)
+
+
+def test_index_is_reused(dataset):
+    assert parsed_files(dataset) == 20
+    again = reopen(dataset)
+    assert parsed_files(again) == 1
+    assert [x["phones"] for x in again] == [x["phones"] for x in dataset]
+
+
+def test_punctuation_marks_invalidate_the_index(dataset):
+    path = index_path(dataset.target_directory)
+    again = reopen(dataset, punctuation_marks="!?.")
+    assert parsed_files(again) == 20
+    assert load_index(path, dataset.target_directory, "!?.", PARSER_VERSION) is not None
+    assert load_index(path, dataset.target_directory, dataset.punctuation_marks, PARSER_VERSION) is None
+
+
+def test_parser_version_invalidates_the_index(dataset, monkeypatch):
+    monkeypatch.setattr(dataset_module, "PARSER_VERSION", PARSER_VERSION + 1)
+    assert parsed_files(reopen(dataset)) == 20
+    assert parsed_files(reopen(dataset)) == 1
+    assert load_index(index_path(dataset.target_directory), dataset.target_directory, dataset.punctuation_marks, PARSER_VERSION) is None
+
+
+def test_phones_format_of_the_index(dataset):
+    # the index stores the phones as arrays, items are only converted to the format on access
+    arrays = reopen(dataset, phones_format="arrays")
+    assert parsed_files(arrays) == 1
+    for i, item in enumerate(dataset):
+        starts, ends, ids = zip(*item["phones"])
+        assert np.allclose(arrays[i]["phone_starts"], starts) and np.allclose(arrays[i]["phone_ends"], ends)
+        assert [arrays.vocab[x] for x in arrays[i]["phone_ids"]] == list(ids)
+    assert [x["phones"] for x in reopen(dataset)] == [x["phones"] for x in dataset]
+
+
+def test_read_only_target_falls_back_to_parsing(aligned_corpus, tmp_path, monkeypatch):
+    fail_writes(monkeypatch)
+    with pytest.warns(UserWarning, match="could not write the cache"):
+        dataset = LocalDataset(target_directory=aligned_corpus, n_workers=2, tmp_directory=tmp_path / "tmp")
+    assert len(dataset) == 20
+    assert not index_path(aligned_corpus).exists()
+    assert parsed_files(reopen(dataset)) == 20
+
+
+def test_force_deletes_the_index(dataset, monkeypatch):
+    assert index_path(dataset.target_directory).exists()
+    fail_writes(monkeypatch)
+    with pytest.warns(UserWarning, match="could not write the cache"):
+        forced = reopen(dataset, force="all")
+    assert parsed_files(forced) == 20
+    assert not index_path(dataset.target_directory).exists()
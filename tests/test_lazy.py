@@ -0,0 +1,27 @@
+import numpy as np
+import pytest
+import soundfile as sf
+
+from alignments.index import index_path
+from conftest import LocalDataset
+
+
+def test_lazy_after_index(dataset, aligned_corpus, tmp_path):
+    assert index_path(aligned_corpus).exists()
+    lazy = LocalDataset(
+        target_directory=aligned_corpus,
+        n_workers=2,
+        tmp_directory=tmp_path / "tmp",
+        lazy=True,
+        target_sampling_rate=8000,
+        prefetch_audio=4,
+    )
+    assert len(lazy) == len(dataset)
+    assert np.allclose(lazy.durations("header"), dataset.durations("header"))
+    for i in range(len(lazy)):
+        item = lazy[i]
+        assert item["phones"] == dataset[i]["phones"]
+        assert sf.info(str(item["wav"])).samplerate == 8000
+        assert np.array_equal(item["audio"], sf.read(str(item["wav"]), dtype="float32")[0])
+    with pytest.raises(ValueError, match="lazy mode"):
+        lazy.stats()
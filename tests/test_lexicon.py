@@ -0,0 +1,18 @@
+import pytest
+
+from alignments.lexicon import corpus_words, find_oovs, write_lexicon
+from conftest import WORDS, make_corpus
+
+
+@pytest.mark.parametrize("n_workers", [1, 3])
+def test_oovs_match_lab_words_and_lexicon(tmp_path, n_workers):
+    make_corpus(tmp_path / "corpus", textgrids=False)
+    (tmp_path / "corpus" / "spk0" / "quoted.lab").write_text('"Hello," said the CAT... (quietly)!')
+    labs = sorted((tmp_path / "corpus").glob("*/*.lab"))
+    expected = set()
+    for lab in labs:
+        expected |= {word.strip('".,()!').lower() for word in lab.read_text().split()}
+    write_lexicon(tmp_path / "lexicon.txt", [(word.upper(), " ".join(WORDS[word])) for word in ["hello", "the", "sat"]])
+    assert corpus_words(labs, n_workers) == expected
+    assert find_oovs(labs, tmp_path / "lexicon.txt", n_workers) == sorted(expected - {"hello", "the", "sat"})
+    assert "said" in expected and "quietly" in expected
@@ -0,0 +1,48 @@
+import json
+import pickle
+
+from alignments.metrics import Metrics, run_command
+from conftest import LocalDataset, make_corpus
+
+
+def test_nested_stages():
+    finished = []
+    metrics = Metrics(hooks=[finished.append])
+    with metrics.stage("outer") as outer:
+        outer.add(files=2, bytes=10)
+        with metrics.stage("inner") as inner:
+            inner.skip()
+    assert [(x["name"], x["parent"], x["status"]) for x in finished] == [("inner", "outer", "skipped"), ("outer", None, "done")]
+    report = metrics.report()
+    assert report["total"]["files"] == 2
+    assert report["stages"][0]["rss"] > 0
+    assert report["total"]["lifetime_peak_rss"] > 0
+    assert pickle.loads(pickle.dumps(metrics)).hooks == []
+
+
+def test_run_command_usage():
+    # a child which allocates about 200 MiB
+    out = run_command("python -c \"x = bytearray(200 * 2**20); print(len(x))\"")
+    assert out.returncode == 0 and out.stdout.strip() == str(200 * 2**20).encode()
+    assert out.peak_rss > 200 * 2**20
+    assert run_command("exit 3").returncode == 3
+
+
+def test_mfa_calls_are_stages(tmp_path, stub_mfa):
+    make_corpus(tmp_path / "source", textgrids=False)
+    dataset = LocalDataset(
+        target_directory=tmp_path / "target",
+        source_directory=tmp_path / "source",
+        tmp_directory=tmp_path / "tmp",
+        n_workers=2,
+        n_shards=2,
+        g2p_cache=False,
+        metrics_path=tmp_path / "metrics.json",
+    )
+    stages = {x["name"]: x for x in json.loads((tmp_path / "metrics.json").read_text())["stages"]}
+    assert stages["downloading necessary models"]["parent"] == "prepare"
+    assert stages["creating lexicon using g2p model (this could take a while)"]["parent"] == "lexicon"
+    for shard in range(2):
+        assert stages[f"aligning shard {shard}"]["parent"] == "alignment"
+        assert stages[f"aligning shard {shard}"]["command_peak_rss"] > 0
+    assert "aligning shard 1" in dataset.metrics.summary()
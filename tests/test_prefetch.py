@@ -0,0 +1,56 @@
+import numpy as np
+import soundfile as sf
+from torch.utils.data import DataLoader
+
+from alignments.prefetch import AudioPrefetcher, phone_segment
+from conftest import LocalDataset, SAMPLING_RATE
+
+
+def direct_audio(path):
+    return sf.read(str(path), dtype="float32")[0]
+
+
+def test_prefetched_audio_matches_direct_load(aligned_corpus, tmp_path):
+    dataset = LocalDataset(target_directory=aligned_corpus, n_workers=2, tmp_directory=tmp_path / "tmp", prefetch_audio=4)
+    for i in list(range(len(dataset))) + [3, 17, 0]:
+        item = dataset[i]
+        assert np.array_equal(item["audio"], direct_audio(item["wav"]))
+    stats = dataset.prefetch_stats()
+    assert stats["hits"] + stats["waits"] > stats["misses"]
+    loader = DataLoader(dataset, batch_size=4, shuffle=True, collate_fn=lambda batch: batch)
+    for batch in loader:
+        assert all(np.array_equal(item["audio"], direct_audio(item["wav"])) for item in batch)
+
+
+def test_prefetcher_out_of_order():
+    prefetcher = AudioPrefetcher(lambda i: i * 2, n_items=100, n_threads=2, depth=8)
+    prefetcher.schedule([5, 9, 2])
+    assert [prefetcher.get(i) for i in [9, 2, 5, 6, 7, 8, 50, 51]] == [18, 4, 10, 12, 14, 16, 100, 102]
+    prefetcher.close()
+
+
+def test_crops_fall_on_phone_boundaries(aligned_corpus, tmp_path):
+    full = LocalDataset(target_directory=aligned_corpus, n_workers=2, tmp_directory=tmp_path / "tmp")
+    cropped = LocalDataset(target_directory=aligned_corpus, n_workers=2, tmp_directory=tmp_path / "tmp", prefetch_audio=4, crop_seconds=0.5)
+    n_cropped = 0
+    for i in range(len(full)):
+        phones, item = full[i]["phones"], cropped[i]
+        if "crop" not in item:
+            assert phones[-1][1] <= 0.5 and item["phones"] == phones
+            continue
+        n_cropped += 1
+        start, end = item["crop"]
+        assert start in [x[0] for x in phones] and end in [x[1] for x in phones]
+        assert end - start <= 0.5 + 1e-6
+        assert item["phones"] == [(round(s - start, 4), round(e - start, 4), p) for s, e, p in phones if s >= start and e <= end]
+        audio = direct_audio(item["wav"])
+        assert np.array_equal(item["audio"], audio[round(start * SAMPLING_RATE):round(end * SAMPLING_RATE)])
+        # the same crop every time
+        assert cropped[i]["crop"] == (start, end)
+    assert n_cropped > 0
+
+
+def test_phone_segment_never_cuts_a_phone():
+    rng = np.random.default_rng(0)
+    assert phone_segment([0, 0.1], [0.1, 0.3], 0.5, rng) is None
+    assert phone_segment([0, 1.0], [1.0, 1.2], 0.5, rng) in [(0.0, 1.0), (1.0, 1.2)]
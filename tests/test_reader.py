@@ -0,0 +1,36 @@
+from pathlib import Path
+import subprocess
+import sys
+
+from alignments.reader import AlignmentReader
+
+HEAVY_MODULES = ["torch", "torchaudio", "librosa", "transformers", "tgt", "rich", "tqdm.rich"]
+
+
+def test_reader_import_is_light():
+    # a fresh interpreter, the modules imported by other tests don't count
+    code = "import sys, alignments, alignments.reader; print(' '.join(x for x in %r if x in sys.modules))" % HEAVY_MODULES
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, check=True, cwd=Path(__file__).parents[1])
+    assert out.stdout.decode().split() == []
+
+
+def test_reading_a_corpus_is_light(dataset):
+    # opening the index, reading every item and searching it doesn't import the build path either
+    code = (
+        "import sys\n"
+        "from alignments.reader import AlignmentReader\n"
+        "reader = AlignmentReader(sys.argv[1])\n"
+        "items = [reader[i] for i in range(len(reader))]\n"
+        "reader.search_index().phones('K AE1 T')\n"
+        "print(len(items), ' '.join(x for x in %r if x in sys.modules))" % HEAVY_MODULES
+    )
+    out = subprocess.run(
+        [sys.executable, "-c", code, str(dataset.target_directory)], capture_output=True, check=True, cwd=Path(__file__).parents[1]
+    )
+    assert out.stdout.decode().split() == [str(len(dataset))]
+
+
+def test_reader_matches_dataset(dataset):
+    reader = AlignmentReader(dataset.target_directory)
+    assert len(reader) == len(dataset) and reader.vocab == dataset.vocab
+    assert all(reader[i] == dataset[i] for i in range(len(dataset)))
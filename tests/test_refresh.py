@@ -0,0 +1,44 @@
+import shutil
+
+import numpy as np
+
+from alignments.index import PARSER_VERSION, index_path, load_manifest
+from conftest import LocalDataset
+
+
+def copy_utterance(source, target):
+    for suffix in [".wav", ".lab", ".TextGrid"]:
+        shutil.copy(source.with_suffix(suffix), target.with_suffix(suffix))
+
+
+def manifest(dataset):
+    result = load_manifest(index_path(dataset.target_directory), dataset.punctuation_marks, PARSER_VERSION)
+    return list(result.wavs), result.items.tolist(), list(result.reasons)
+
+
+def test_refresh_matches_fresh_load(dataset, aligned_corpus, tmp_path):
+    wavs = sorted(aligned_corpus.glob("*/*.wav"))
+    # added
+    copy_utterance(wavs[0], aligned_corpus / "spk3" / "spk3_new.wav")
+    # removed
+    for path in wavs[5].parent.glob(f"{wavs[5].stem}.*"):
+        path.unlink()
+    # edited, once with the alignment of another utterance and once with a transcript that doesn't match
+    copy_utterance(wavs[9], wavs[2])
+    wavs[7].with_suffix(".lab").write_text("CAT, SAT WORLD THE HELLO CAT.")
+    dataset.refresh()
+    # only the added and the edited utterances are parsed again
+    assert dataset.metrics.report()["stages"][-1]["files"] == 3
+    refreshed = manifest(dataset)
+    assert "word does not start with mark" in refreshed[2]
+
+    index_path(aligned_corpus).unlink()
+    fresh = LocalDataset(target_directory=aligned_corpus, n_workers=2, tmp_directory=tmp_path / "tmp")
+    assert manifest(fresh) == refreshed
+    assert len(dataset) == len(fresh) == 19
+    assert dataset.vocab == fresh.vocab
+    assert dataset.token_counts == fresh.token_counts
+    for a, b in zip(dataset, fresh):
+        assert a["wav"] == b["wav"] and a["speaker"] == b["speaker"] and a["transcript"] == b["transcript"]
+        assert a["phones"] == b["phones"] and a["words"] == b["words"]
+    assert np.allclose(dataset.durations(), fresh.durations())
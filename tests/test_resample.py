@@ -0,0 +1,51 @@
+import hashlib
+
+import soundfile as sf
+
+from alignments.resample import resample_file, resampled_directory
+from conftest import LocalDataset, SAMPLING_RATE
+
+
+def digests(directory):
+    return {x: hashlib.sha256(x.read_bytes()).hexdigest() for x in sorted(directory.rglob("*.wav"))}
+
+
+def stage_names(dataset):
+    return [x.name for x in dataset.metrics.stages]
+
+
+def test_resampling_is_cached_per_rate(aligned_corpus, tmp_path):
+    sources = digests(aligned_corpus)
+    kwargs = dict(target_directory=aligned_corpus, n_workers=2, tmp_directory=tmp_path / "tmp")
+    dataset = LocalDataset(**kwargs, target_sampling_rate=8000)
+    assert "resample" in stage_names(dataset)
+    for item in dataset:
+        assert item["wav"].parent.parent == resampled_directory(aligned_corpus, 8000)
+        info = sf.info(str(item["wav"]))
+        assert info.samplerate == 8000
+        assert abs(info.duration - sf.info(str(aligned_corpus / item["wav"].relative_to(resampled_directory(aligned_corpus, 8000)))).duration) < 1e-3
+    resampled = digests(resampled_directory(aligned_corpus, 8000))
+    # the cached files are reused
+    assert "resample" not in stage_names(LocalDataset(**kwargs, target_sampling_rate=8000))
+    # another rate gets its own cache
+    dataset = LocalDataset(**kwargs, target_sampling_rate=22050)
+    assert "resample" in stage_names(dataset)
+    assert all(sf.info(str(item["wav"])).samplerate == 22050 for item in dataset)
+    # the source audio and the cache of the first rate are left alone
+    assert digests(resampled_directory(aligned_corpus, 8000)) == resampled
+    assert {x: y for x, y in digests(aligned_corpus).items() if ".resampled" not in str(x)} == sources
+
+
+def test_resample_file(tmp_path, aligned_corpus):
+    source = sorted(aligned_corpus.glob("*/*.wav"))[0]
+    target = tmp_path / "out" / "a.wav"
+    resample_file((source, target, 8000))
+    mtime = target.stat().st_mtime_ns
+    # existing files are skipped
+    resample_file((source, target, 8000))
+    assert target.stat().st_mtime_ns == mtime
+    # files at the target rate are linked, not copied
+    linked = tmp_path / "out" / "b.wav"
+    resample_file((source, linked, SAMPLING_RATE))
+    assert linked.is_symlink() and linked.resolve() == source.resolve()
+    assert list((tmp_path / "out").glob(".*.tmp")) == []
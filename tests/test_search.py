@@ -0,0 +1,83 @@
+import numpy as np
+import pytest
+
+from alignments.columnar import ColumnarData
+from alignments.container import StringColumn
+from alignments.search import SearchIndex, SEARCH_NAME
+
+
+def brute_force_phones(data, tokens):
+    hits = []
+    for i in range(len(data)):
+        starts, ends, ids = data.phones(i)
+        # pauses between phones are skipped, a single pause token is searched like a phone
+        speech = [j for j, x in enumerate(ids.tolist()) if len(tokens) == 1 or not data.vocab[x].startswith("[")]
+        for k in range(len(speech) - len(tokens) + 1):
+            if [data.vocab[ids[speech[k + n]]] for n in range(len(tokens))] == tokens:
+                hits.append((i, speech[k], round(float(starts[speech[k]]), 4), round(float(ends[speech[k + len(tokens) - 1]]), 4)))
+    return hits
+
+
+def brute_force_words(data, words):
+    hits = []
+    for i in range(len(data)):
+        starts, ends, ids = data.words(i)
+        for k in range(len(ids) - len(words) + 1):
+            if [data.word_vocab[x] for x in ids[k:k + len(words)].tolist()] == words:
+                hits.append((i, k, round(float(starts[k]), 4), round(float(ends[k + len(words) - 1]), 4)))
+    return hits
+
+
+def as_tuples(result):
+    return list(zip(result["items"].tolist(), result["intervals"].tolist(), result["starts"].tolist(), result["ends"].tolist()))
+
+
+def random_data(seed=0, n_items=300):
+    rng = np.random.default_rng(seed)
+    vocab = sorted(["[SILENCE]", "[COMMA]"] + [f"P{i}" for i in range(6)])
+    lengths = rng.integers(0, 30, n_items)
+    phone_offsets = np.concatenate([[0], np.cumsum(lengths)])
+    n_phones = int(phone_offsets[-1])
+    starts = np.round(np.arange(n_phones) % 100 * 0.05, 2).astype(np.float32)
+    # few distinct phones and many pauses, so long sequences occur and span pauses
+    phone_ids = np.where(rng.random(n_phones) < 0.3, vocab.index("[SILENCE]"), rng.integers(2, len(vocab), n_phones))
+    word_vocab = ["a", "b", "c"]
+    word_lengths = lengths // 3
+    word_offsets = np.concatenate([[0], np.cumsum(word_lengths)])
+    word_ids = rng.integers(0, len(word_vocab), int(word_offsets[-1])).astype(np.int32)
+    speakers = StringColumn.from_strings(["s0", "s1", "s2"])
+    return ColumnarData(
+        "/tmp", StringColumn.from_strings([f"{i}.wav" for i in range(n_items)]), speakers,
+        (np.arange(n_items) % 3).astype(np.int32), StringColumn.from_strings([""] * n_items),
+        phone_offsets, starts, starts + np.float32(0.05), phone_ids.astype(np.int16), vocab,
+        word_offsets, starts[:word_offsets[-1]], starts[:word_offsets[-1]] + np.float32(0.05), word_ids,
+        StringColumn.from_strings(word_vocab),
+    )
+
+
+@pytest.mark.parametrize("query", ["P0", "[SILENCE]", "P1 P2", "P0 P0 P3", "P1 P2 P3 P4", "P5 P0 P2 P2 P1", "P9", "P9 P1"])
+def test_phones_match_brute_force(query):
+    data = random_data()
+    index = SearchIndex.build(data)
+    result = index.phones(query)
+    assert as_tuples(result) == brute_force_phones(data, query.split())
+    assert result["speaker_ids"].tolist() == [i % 3 for i in result["items"].tolist()]
+    if len(query.split()) == 1:
+        assert index.count(query) == len(result["items"])
+
+
+@pytest.mark.parametrize("query", ["a", "b c", "a a b", "c b a c", "d", "a d"])
+def test_words_match_brute_force(query):
+    data = random_data(seed=1)
+    assert as_tuples(SearchIndex.build(data).word(query)) == brute_force_words(data, query.split())
+
+
+def test_index_of_dataset(dataset):
+    index = dataset.search_index()
+    assert as_tuples(index.phones("AE1 T")) == brute_force_phones(dataset.data, ["AE1", "T"])
+    assert as_tuples(index.word("the cat")) == brute_force_words(dataset.data, ["the", "cat"])
+    with pytest.raises(ValueError):
+        index.phones("AE1 [SILENCE]")
+    # the index was stored and is read again
+    stored = SearchIndex.open(dataset.data, dataset.target_directory / SEARCH_NAME, write=False)
+    assert all(np.array_equal(stored.arrays[name], array) for name, array in index.arrays.items())
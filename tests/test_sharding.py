@@ -0,0 +1,72 @@
+import subprocess
+
+import pytest
+
+from alignments.sharding import split_speakers
+from conftest import LocalDataset, make_corpus
+
+
+def test_split_speakers():
+    shards = split_speakers({"a": 10, "b": 6, "c": 5, "d": 1}, 2)
+    assert sorted(sum(shards, [])) == ["a", "b", "c", "d"]
+    assert sorted(shards) == [["a", "d"], ["b", "c"]]
+
+
+def sharded_dataset(tmp_path, **kwargs):
+    return LocalDataset(
+        target_directory=tmp_path / "target",
+        source_directory=tmp_path / "source",
+        tmp_directory=tmp_path / "tmp",
+        n_workers=2,
+        n_shards=3,
+        g2p_cache=tmp_path / "g2p.sqlite",
+        **kwargs,
+    )
+
+
+def test_sharded_pipeline_with_stub_mfa(tmp_path, stub_mfa):
+    make_corpus(tmp_path / "source", textgrids=False)
+    dataset = sharded_dataset(tmp_path)
+    calls = stub_mfa.read_text().splitlines()
+    assert any(x.startswith("model download acoustic") for x in calls)
+    assert any(x.startswith("model download g2p") for x in calls)
+    assert sum(x.startswith("align") for x in calls) == 3
+    assert len(dataset) == 20
+    assert len(list((tmp_path / "target").glob("*/*.TextGrid"))) == 20
+    reference = LocalDataset(target_directory=tmp_path / "grids", n_workers=2, use_index=False)
+    items = {item["wav"].name: item["phones"] for item in reference}
+    assert all(item["phones"] == items[item["wav"].name] for item in dataset)
+
+
+def test_failed_shard_is_aligned_again(tmp_path, stub_mfa, monkeypatch):
+    make_corpus(tmp_path / "source", textgrids=False)
+    monkeypatch.setenv("STUB_MFA_FAIL", "1")
+    with pytest.raises(Exception, match="aligning shards \\[1\\] failed"):
+        sharded_dataset(tmp_path)
+    monkeypatch.setenv("STUB_MFA_FAIL", "none")
+    stub_mfa.write_text("")
+    dataset = sharded_dataset(tmp_path)
+    aligned = [x for x in stub_mfa.read_text().splitlines() if x.startswith("align")]
+    assert len(aligned) == 1 and "_shard_1 " in aligned[0]
+    assert len(dataset) == 20
+
+
+def test_shard_commands_are_written_and_merged(tmp_path, stub_mfa):
+    make_corpus(tmp_path / "source", textgrids=False)
+    commands = tmp_path / "commands.sh"
+    dataset = sharded_dataset(tmp_path, shard_commands=commands)
+    assert len(dataset) == 0
+    assert not any(x.startswith("align") for x in stub_mfa.read_text().splitlines())
+    lines = commands.read_text().splitlines()
+    assert len(lines) == 3
+    # e.g. cluster jobs, one finishes before the dataset is created again
+    subprocess.run(lines[0], shell=True, check=True)
+    dataset = sharded_dataset(tmp_path, shard_commands=commands)
+    assert len(dataset) == 0 and len(commands.read_text().splitlines()) == 2
+    for line in commands.read_text().splitlines():
+        subprocess.run(line, shell=True, check=True)
+    stub_mfa.write_text("")
+    dataset = sharded_dataset(tmp_path, shard_commands=commands)
+    assert not any(x.startswith("align") for x in stub_mfa.read_text().splitlines())
+    assert len(dataset) == 20
+    assert len(list((tmp_path / "target").glob("*/*.TextGrid"))) == 20
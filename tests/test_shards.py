@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+
+from alignments.reader import AlignmentReader
+from alignments.shards import MANIFEST_NAME, ShardedCorpus
+
+pytest.importorskip("pyarrow")
+
+
+@pytest.mark.parametrize("format", ["parquet", "arrow"])
+def test_round_trip(dataset, tmp_path, format):
+    directory = tmp_path / "shards"
+    dataset.export_shards(directory, format=format, audio=True, max_shard_bytes=20_000, batch_size=3)
+    assert len(list(directory.glob(f"shard_*.{format}"))) > 1
+    reader = AlignmentReader.from_shards(directory, target_directory=dataset.target_directory)
+    assert len(reader) == len(dataset) and reader.vocab == dataset.vocab
+    for i in range(len(dataset)):
+        item = reader[i]
+        assert item.pop("audio_bytes") == item["wav"].read_bytes()
+        assert item == dataset[i]
+    assert reader.search_index().count("AE1") == dataset.search_index().count("AE1")
+
+
+@pytest.mark.parametrize("format", ["parquet", "arrow"])
+def test_only_some_columns(dataset, tmp_path, format):
+    directory = tmp_path / "shards"
+    dataset.export_shards(directory, format=format)
+    columns = ["key", "speaker", "phone_starts", "phone_ends", "phones"]
+    reader = AlignmentReader.from_shards(directory, target_directory=dataset.target_directory, columns=columns, phones_format="arrays")
+    assert reader.shards.columns == columns
+    for i in range(len(dataset)):
+        starts, ends, ids = dataset.phone_arrays(i)
+        item = reader[i]
+        assert item["transcript"] == "" and item["words"] == [] and "audio_bytes" not in item
+        assert np.array_equal(item["phone_starts"], starts) and np.array_equal(item["phone_ends"], ends)
+        assert np.array_equal(item["phone_ids"], ids)
+    row = ShardedCorpus(directory, columns=["key", "words"])[0]
+    assert row == {"key": dataset.data.wavs[0], "words": [x[2] for x in dataset[0]["words"]]}
+    with pytest.raises(ValueError, match="needed"):
+        ShardedCorpus(directory, columns=["key"]).to_columnar(dataset.target_directory)
+
+
+def test_incomplete_export(dataset, tmp_path):
+    directory = tmp_path / "shards"
+    dataset.export_shards(directory, format="arrow")
+    (directory / MANIFEST_NAME).unlink()
+    with pytest.raises(ValueError, match="no complete export"):
+        ShardedCorpus(directory)
@@ -0,0 +1,16 @@
+from alignments import dataset as dataset_module
+
+
+def test_stats_are_cached_per_data(dataset, aligned_corpus, monkeypatch):
+    stats = dataset.stats()
+    signatures = []
+    signature = dataset_module.data_signature
+    monkeypatch.setattr(dataset_module, "data_signature", lambda data: signatures.append(data) or signature(data))
+    assert dataset.stats() is stats
+    assert signatures == []
+    wav = sorted(aligned_corpus.glob("*/*.wav"))[0]
+    for path in wav.parent.glob(f"{wav.stem}.*"):
+        path.unlink()
+    dataset.refresh()
+    assert dataset.stats() is not stats
+    assert signatures == [dataset.data]
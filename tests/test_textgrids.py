@@ -0,0 +1,88 @@
+import pytest
+import textgrid
+
+from alignments.textgrids import read_tiers_fast
+
+# (class, name, xmin, xmax, intervals or points), marks contain quotes, which are escaped by doubling them
+TIERS = [
+    ("IntervalTier", "words", [
+        (0, 0.1, ""),
+        (0.1, 0.35, 'say ""hi""'),
+        (0.35, 0.35, "zero length"),
+        (0.35, 0.6, "it's"),
+        (0.6, 0.55, "backwards"),
+        (0.6, 0.812345678, ""),
+        (0.812345678, 1.2, "two\nlines"),
+    ]),
+    ("IntervalTier", "phones", [
+        (0, 0.1, ""),
+        (0.1, 0.2, "S"),
+        (0.2, 0.35, "EY1"),
+        (0.35, 0.6, ""),
+        (0.6, 1.2, "sil"),
+    ]),
+    ("TextTier", "events", [(0.25, 'a ""quoted"" point'), (0.9, "")]),
+]
+XMAX = 1.2
+
+
+def long_format(tiers):
+    lines = [
+        'File type = "ooTextFile"', 'Object class = "TextGrid"', "",
+        "xmin = 0 ", f"xmax = {XMAX} ", "tiers? <exists> ", f"size = {len(tiers)} ", "item []: ",
+    ]
+    for i, (tier_class, name, entries) in enumerate(tiers):
+        kind = "intervals" if tier_class == "IntervalTier" else "points"
+        lines += [
+            f"    item [{i + 1}]:", f'        class = "{tier_class}" ', f'        name = "{name}" ',
+            "        xmin = 0 ", f"        xmax = {XMAX} ", f"        {kind}: size = {len(entries)} ",
+        ]
+        for j, entry in enumerate(entries):
+            lines.append(f"        {kind} [{j + 1}]:")
+            if tier_class == "IntervalTier":
+                lines += [f"            xmin = {entry[0]} ", f"            xmax = {entry[1]} ", f'            text = "{entry[2]}" ']
+            else:
+                lines += [f"            number = {entry[0]} ", f'            mark = "{entry[1]}" ']
+    return "\n".join(lines) + "\n"
+
+
+def short_format(tiers):
+    lines = ['File type = "ooTextFile"', 'Object class = "TextGrid"', "", "0", str(XMAX), "<exists>", str(len(tiers))]
+    for tier_class, name, entries in tiers:
+        lines += [f'"{tier_class}"', f'"{name}"', "0", str(XMAX), str(len(entries))]
+        for entry in entries:
+            lines += [str(x) for x in entry[:-1]] + [f'"{entry[-1]}"']
+    return "\n".join(lines) + "\n"
+
+
+def reference(path):
+    grid = textgrid.TextGrid.fromFile(str(path))
+    tiers = []
+    for tier in grid.tiers:
+        if isinstance(tier, textgrid.PointTier):
+            times = [x.time for x in tier]
+            tiers.append((tier.name, times, times, [x.mark for x in tier]))
+        else:
+            tiers.append((tier.name, [x.minTime for x in tier], [x.maxTime for x in tier], [x.mark for x in tier]))
+    return tiers
+
+
+@pytest.mark.parametrize("write", [long_format, short_format])
+def test_parser_matches_textgrid_package(tmp_path, write):
+    path = tmp_path / "utterance.TextGrid"
+    # the textgrid package can't read point tiers in the short format
+    path.write_text(write(TIERS if write is long_format else TIERS[:2]))
+    tiers = read_tiers_fast(path)
+    assert tiers == reference(path)
+    words = tiers[0]
+    assert 'say "hi"' in words[3] and "zero length" not in words[3] and "backwards" not in words[3]
+    assert words[3][-1] == "two\nlines"
+    if write is long_format:
+        assert tiers[2][3][0] == 'a "quoted" point'
+    assert read_tiers_fast(path, n_tiers=2) == tiers[:2]
+
+
+def test_utf16(tmp_path):
+    path = tmp_path / "utterance.TextGrid"
+    path.write_bytes(long_format(TIERS).encode("utf-16"))
+    assert read_tiers_fast(path) == reference(path)